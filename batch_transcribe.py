@@ -0,0 +1,398 @@
+#! python3.7
+
+import argparse
+import hashlib
+import json
+import os
+import time
+import multiprocessing
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import islice
+
+import numpy as np
+import torch
+import whisper
+from whisper.audio import SAMPLE_RATE
+from runtime_log import LEVELS, setup_logging, get_logger, every
+from subtitle_writer import format_cue
+
+log = get_logger("batch_transcribe")
+
+AUDIO_EXTENSIONS = {".wav", ".mp3", ".m4a", ".flac", ".ogg", ".aac", ".wma", ".mp4", ".mkv", ".mov", ".webm"}
+
+
+def parse_args():
+  parser = argparse.ArgumentParser(
+    description="📁 Offline Batch Transcription of Recorded Audio and Video",
+    formatter_class=argparse.RawDescriptionHelpFormatter,
+    epilog="""
+🚀 Quick Start Examples:
+  python batch_transcribe.py meeting.m4a                       # Writes meeting.txt next to the file
+  python batch_transcribe.py recordings/ --format srt,json     # Every audio/video file in a directory
+  python batch_transcribe.py talk.mp4 --model base --language auto --workers 4
+    """
+  )
+
+  parser.add_argument("inputs", nargs="+", help="Audio/video files or directories")
+  parser.add_argument("--model", default="tiny.en", help="Whisper model to use (default: tiny.en)",
+            choices=["tiny", "base", "small", "medium", "large", "tiny.en", "base.en", "small.en", "medium.en", "large-v3"])
+  parser.add_argument("--language", default="en",
+            help="Language for transcription (default: en). Use 'auto' for auto-detection", type=str)
+  parser.add_argument("--format", default="txt",
+            help="Comma separated output formats: txt, srt, vtt, json (default: txt)", type=str)
+  parser.add_argument("--output-dir", default=None,
+            help="Directory for output files (default: next to each input)", type=str)
+  parser.add_argument("--workers", default=0,
+            help="Number of worker processes, each with its own model (default: 0, one per --threads-per-worker cores)", type=int)
+  parser.add_argument("--threads-per-worker", default=2,
+            help="Torch threads used by each worker process (default: 2)", type=int)
+  parser.add_argument("--restart", action='store_true', default=False,
+            help="Ignore progress saved by an interrupted run and start every file from scratch")
+
+  # 与实时转录相同的解码参数
+  parser.add_argument("--translate", action='store_true', default=False,
+            help="Translate to English")
+  parser.add_argument("--no-fp16", action='store_true', default=False,
+            help="Disable fp16 optimization")
+  parser.add_argument("--beam-size", default=1,
+            help="Beam size for Whisper decoding (default: 1, greedy)", type=int)
+  parser.add_argument("--tokens-per-second", default=10.0,
+            help="Token budget per second of audio; limits hallucinated runs (0 for no limit)", type=float)
+  parser.add_argument("--optimize-model", action='store_true', default=False,
+            help="Run the Whisper encoder as a TorchScript graph compiled once and cached on disk")
+  parser.add_argument("--onnx", action='store_true', default=False,
+            help="Run the model with ONNX Runtime on CPU")
+  parser.add_argument("--onnx-threads", default=0,
+            help="ONNX Runtime intra-op threads (default: 0, use --threads-per-worker)", type=int)
+  parser.add_argument("--onnx-inter-threads", default=0,
+            help="ONNX Runtime inter-op threads (default: 0, let ONNX Runtime decide)", type=int)
+  parser.add_argument("--log-level", default="info", choices=LEVELS,
+            help="Log verbosity (default: info). Use 'warning' for quiet long runs, 'debug' for per-window detail")
+  parser.add_argument("--log-file", default=None,
+            help="Also write logs to this file", type=str)
+
+  # 分块参数
+  parser.add_argument("--max-chunk", default=28.0,
+            help="Maximum chunk length in seconds; long files are cut at the quietest point before it (default: 28)", type=float)
+  parser.add_argument("--min-chunk", default=10.0,
+            help="Earliest point in a chunk where a cut may be placed (default: 10)", type=float)
+  parser.add_argument("--silence-threshold", default=0.005,
+            help="RMS level below which audio is treated as silence (default: 0.005)", type=float)
+  args = parser.parse_args()
+  if not 0 <= args.min_chunk < args.max_chunk:
+    parser.error(f"--min-chunk ({args.min_chunk}) must be at least 0 and less than --max-chunk ({args.max_chunk})")
+  return args
+
+
+def find_audio_files(inputs):
+  files = []
+  for path in inputs:
+    if os.path.isdir(path):
+      for root, _, names in os.walk(path):
+        for name in sorted(names):
+          if os.path.splitext(name)[1].lower() in AUDIO_EXTENSIONS:
+            files.append(os.path.join(root, name))
+    elif os.path.isfile(path):
+      files.append(path)
+    else:
+      log.warning(f"{path} not found, skipping")
+  return files
+
+
+def split_at_silence(audio, max_chunk, min_chunk, silence_threshold, frame_seconds=0.03):
+  """
+  把长音频切成不超过 max_chunk 秒的块，切点选在 [min_chunk, max_chunk] 区间里能量最低的帧；
+  区间为空（min_chunk >= max_chunk）时直接在 max_chunk 处硬切。
+  整块都是静音的块直接跳过。返回 [(start_sample, end_sample), ...]。
+  """
+  frame = int(SAMPLE_RATE * frame_seconds)
+  n_frames = len(audio) // frame
+  if n_frames == 0:
+    return [(0, len(audio))] if len(audio) else []
+  rms = np.sqrt(np.mean(audio[:n_frames * frame].reshape(n_frames, frame) ** 2, axis=1))
+
+  max_frames = max(1, int(max_chunk / frame_seconds))
+  min_frames = max(0, int(min_chunk / frame_seconds))
+  chunks = []
+  start = 0
+  while start < n_frames:
+    if n_frames - start <= max_frames:
+      end = n_frames
+    elif min_frames >= max_frames:
+      end = start + max_frames
+    else:
+      window = rms[start + min_frames:start + max_frames]
+      end = start + min_frames + int(np.argmin(window))
+    if rms[start:end].max() >= silence_threshold:
+      end_sample = len(audio) if end == n_frames else end * frame
+      chunks.append((start * frame, end_sample))
+    start = end
+  return chunks
+
+
+def atomic_write_json(path, data):
+  """先写临时文件再替换，中途崩溃不会留下写了一半的文件"""
+  tmp_path = path + ".tmp"
+  with open(tmp_path, "w", encoding="utf-8") as f:
+    json.dump(data, f, ensure_ascii=False)
+    f.flush()
+    os.fsync(f.fileno())
+  os.replace(tmp_path, path)
+
+
+class ChunkManifest:
+  """
+  每个输入文件的断点记录：切块结果、已完成的块和失败的块，每完成（或失败）一块原子地写一次。
+  失败的块不算完成，下次运行时重试。源文件或影响结果的参数变化后旧记录作废，重新开始。
+  """
+
+  # 这些参数变化会改变切块或解码结果
+  param_names = ["model", "language", "translate", "beam_size", "tokens_per_second", "onnx",
+                 "max_chunk", "min_chunk", "silence_threshold"]
+
+  def __init__(self, path, source, args):
+    self.path = path
+    stat = os.stat(source)
+    self.identity = {
+      'source': os.path.abspath(source),
+      'size': stat.st_size,
+      'mtime': stat.st_mtime,
+      'params': {name: getattr(args, name) for name in self.param_names},
+    }
+    self.chunks = None
+    self.results = {}
+    self.failed = {}
+
+  def load(self):
+    """读取与当前文件和参数一致的断点记录，返回是否可以续传"""
+    if not os.path.exists(self.path):
+      return False
+    try:
+      with open(self.path, encoding="utf-8") as f:
+        data = json.load(f)
+    except (OSError, ValueError) as e:
+      log.warning(f"Ignoring unreadable progress file {self.path}: {e}")
+      return False
+    if data.get('identity') != self.identity:
+      log.info("Source file or settings changed since the last run, starting over")
+      return False
+    self.chunks = [tuple(chunk) for chunk in data['chunks']]
+    self.results = {int(index): tuple(result) for index, result in data['results'].items()}
+    self.failed = {int(index): error for index, error in data.get('failed', {}).items()}
+    return True
+
+  def save(self):
+    atomic_write_json(self.path, {
+      'identity': self.identity,
+      'chunks': self.chunks,
+      'results': {str(index): list(result) for index, result in self.results.items()},
+      'failed': {str(index): error for index, error in self.failed.items()},
+    })
+
+  def record(self, chunk_index, text, language):
+    self.results[chunk_index] = (text, language)
+    self.failed.pop(chunk_index, None)
+    self.save()
+
+  def record_failure(self, chunk_index, error):
+    self.failed[chunk_index] = error
+    self.save()
+
+  def pending(self):
+    return [index for index in range(len(self.chunks)) if index not in self.results]
+
+
+def load_audio_cached(path, cache_dir):
+  """解码后的PCM缓存为 .npy，续传时直接映射读取，不必再调用 ffmpeg 解码几个小时的音频"""
+  stat = os.stat(path)
+  key = hashlib.sha1(f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime}".encode("utf-8")).hexdigest()[:16]
+  cache_path = os.path.join(cache_dir, f"{os.path.splitext(os.path.basename(path))[0]}-{key}.npy")
+  if os.path.exists(cache_path):
+    return np.load(cache_path, mmap_mode="r"), cache_path
+
+  audio = whisper.load_audio(path)
+  os.makedirs(cache_dir, exist_ok=True)
+  tmp_path = cache_path + ".tmp.npy"
+  np.save(tmp_path, audio)
+  os.replace(tmp_path, cache_path)
+  return audio, cache_path
+
+
+def output_directory(path, output_dir):
+  return output_dir or os.path.dirname(os.path.abspath(path))
+
+
+# 每个工作进程各自加载一次模型
+_backend = None
+
+
+def _init_worker(args):
+  global _backend
+  from model_optimizer import load_model
+  from onnx_backend import ONNXWhisperBackend, load_onnx_model
+  from whisper_backend import OpenAIWhisperBackend
+
+  setup_logging(args.log_level, args.log_file)
+  torch.set_num_threads(args.threads_per_worker)
+  if args.onnx:
+    args.onnx_threads = args.onnx_threads or args.threads_per_worker
+    _backend = ONNXWhisperBackend(load_onnx_model(args.model, args), args, "cpu")
+  else:
+    _backend = OpenAIWhisperBackend(load_model(args.model, "cpu", args), args, "cpu")
+
+
+def _transcribe_chunk(task):
+  file_index, chunk_index, audio, language = task
+  result = _backend.decode_audio(np.asarray(audio, dtype=np.float32), language)
+  return file_index, chunk_index, result['text'].strip(), result['language']
+
+
+def bounded_submit(pool, fn, tasks, limit):
+  """
+  逐个提交 tasks 中的 (key, 参数)，在途任务不超过 limit 个，按完成顺序产出 (key, future)。
+  tasks 可以是生成器：只在有空位时才取下一个，音频不必一次全部读进内存。
+  """
+  in_flight = {}
+  tasks = iter(tasks)
+  while True:
+    for key, arg in islice(tasks, limit - len(in_flight)):
+      in_flight[pool.submit(fn, arg)] = key
+    if not in_flight:
+      return
+    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+    for future in done:
+      yield in_flight.pop(future), future
+
+
+def pending_chunks(manifests, cache_files, language):
+  """逐个文件从PCM缓存映射读取未完成的块，每块复制出来，不保留整段音频"""
+  for file_index, (manifest, cache_path) in enumerate(zip(manifests, cache_files)):
+    pending = manifest.pending()
+    if not pending:
+      continue
+    audio = np.load(cache_path, mmap_mode="r")
+    for chunk_index in pending:
+      start, end = manifest.chunks[chunk_index]
+      yield (file_index, chunk_index), (file_index, chunk_index, np.array(audio[start:end]), language)
+    del audio
+
+
+def write_outputs(path, segments, formats, output_dir):
+  base = os.path.splitext(os.path.basename(path))[0]
+  directory = output_directory(path, output_dir)
+  os.makedirs(directory, exist_ok=True)
+  written = []
+
+  if "txt" in formats:
+    out = os.path.join(directory, base + ".txt")
+    with open(out, "w", encoding="utf-8") as f:
+      f.write('\n'.join(segment['text'] for segment in segments) + '\n')
+    written.append(out)
+  for fmt in ("srt", "vtt"):
+    if fmt not in formats:
+      continue
+    out = os.path.join(directory, base + "." + fmt)
+    with open(out, "w", encoding="utf-8") as f:
+      if fmt == "vtt":
+        f.write("WEBVTT\n\n")
+      for index, segment in enumerate(segments, 1):
+        f.write(format_cue(fmt, index, segment['start'], segment['end'], segment['text']))
+    written.append(out)
+  if "json" in formats:
+    out = os.path.join(directory, base + ".json")
+    with open(out, "w", encoding="utf-8") as f:
+      json.dump({'file': path, 'segments': segments}, f, ensure_ascii=False, indent=2)
+    written.append(out)
+  return written
+
+
+def main():
+  args = parse_args()
+  setup_logging(args.log_level, args.log_file)
+  formats = {fmt.strip() for fmt in args.format.split(',') if fmt.strip()}
+  files = find_audio_files(args.inputs)
+  if not files:
+    log.info("No audio files found")
+    return
+
+  workers = args.workers or max(1, (os.cpu_count() or 1) // max(1, args.threads_per_worker))
+  language = None if args.language == "auto" else args.language
+
+  # 先逐个文件切块（或读取上次的断点记录），整段音频用完即释放；
+  # 之后从PCM缓存按需读取未完成的块分发到进程池，在途的块不超过工作进程数的两倍
+  manifests = []
+  cache_files = []
+  n_pending = 0
+  for path in files:
+    log.info(f"Loading {path}...")
+    directory = output_directory(path, args.output_dir)
+    os.makedirs(directory, exist_ok=True)
+    base = os.path.splitext(os.path.basename(path))[0]
+    manifest = ChunkManifest(os.path.join(directory, base + ".progress.json"), path, args)
+    resumed = not args.restart and manifest.load()
+
+    audio, cache_path = load_audio_cached(path, os.path.join(directory, ".batch_cache"))
+    if not resumed:
+      manifest.chunks = split_at_silence(audio, args.max_chunk, args.min_chunk, args.silence_threshold)
+      manifest.results = {}
+      manifest.failed = {}
+      manifest.save()
+
+    pending = manifest.pending()
+    log.info(f"{len(audio)/SAMPLE_RATE:.1f} seconds, {len(manifest.chunks)} chunks"
+             + (f", resuming with {len(pending)} left" if resumed else ""))
+    n_pending += len(pending)
+    manifests.append(manifest)
+    cache_files.append(cache_path)
+    del audio
+
+  if n_pending:
+    log.info(f"Transcribing {n_pending} chunks with {workers} workers ({args.model})...")
+    start_time = time.time()
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                             initializer=_init_worker, initargs=(args,)) as pool:
+      results = bounded_submit(pool, _transcribe_chunk, pending_chunks(manifests, cache_files, language), 2 * workers)
+      for done, ((file_index, chunk_index), future) in enumerate(results, 1):
+        try:
+          _, _, text, detected = future.result()
+        except Exception as e:
+          # 一块失败不中断整个运行，记录下来留给下次运行重试
+          log.error(f"Chunk {chunk_index} of {files[file_index]} failed: {e!r}")
+          manifests[file_index].record_failure(chunk_index, repr(e))
+          continue
+        # 每完成一块就写入断点，崩溃后最多损失正在解码的块
+        manifests[file_index].record(chunk_index, text, detected)
+        log.info("%s/%s chunks", done, n_pending, extra=every(1.0))
+    log.info(f"Transcription finished in {time.time() - start_time:.2f} seconds")
+
+  # 按原始顺序拼接结果
+  for file_index, path in enumerate(files):
+    manifest = manifests[file_index]
+    segments = []
+    for chunk_index, (start, end) in enumerate(manifest.chunks):
+      if chunk_index not in manifest.results:
+        continue
+      text, detected = manifest.results[chunk_index]
+      if not text:
+        continue
+      segments.append({'start': round(start / SAMPLE_RATE, 3), 'end': round(end / SAMPLE_RATE, 3),
+                       'text': text, 'language': detected})
+    for out in write_outputs(path, segments, formats, args.output_dir):
+      log.info(f"Wrote {out}")
+
+    if manifest.failed:
+      # 保留断点和音频缓存，再次运行时只重新解码失败的块
+      log.warning(f"{len(manifest.failed)} chunks of {path} failed and are missing from the output; "
+                  f"run again to retry them (details in {manifest.path})")
+      continue
+
+    # 输出已完整写入，断点和音频缓存不再需要
+    for leftover in (manifest.path, cache_files[file_index]):
+      try:
+        os.remove(leftover)
+      except OSError:
+        pass
+
+
+if __name__ == "__main__":
+  main()
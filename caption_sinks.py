@@ -0,0 +1,220 @@
+#! python3.7
+
+import json
+import signal
+import socket
+import threading
+import time
+
+import runtime_log
+from caption_state import APPEND, REPLACE, change_dict
+from runtime_log import get_logger
+
+log = get_logger("caption_sinks")
+
+
+def caption_record(text, changes=None):
+  record = {"time": round(time.time(), 3), "text": text, "lines": text.split('\n')}
+  if changes:
+    record["changes"] = [change_dict(change) for change in changes]
+  return record
+
+
+class CaptionSink:
+  """
+  字幕输出端：publish 收到当前完整的字幕文本（每行一条），close 释放资源。
+  apply 收到 CaptionState 产生的增量变化和变化后的完整文本，默认按完整文本处理，增量输出端可以覆盖。
+  """
+
+  def publish(self, text):
+    raise NotImplementedError
+
+  def apply(self, changes, text):
+    self.publish(text)
+
+  def close(self):
+    pass
+
+
+class StdoutSink(CaptionSink):
+  """把有变化的字幕行写到标准输出，与日志共用控制台锁"""
+
+  def __init__(self):
+    self.lines = []
+
+  def publish(self, text):
+    lines = text.split('\n')
+    # 历史从顶部滚出时对齐，只输出新增或变化的行
+    previous = self.lines
+    if lines and previous and lines[0] != previous[0] and lines[0] in previous:
+      previous = previous[previous.index(lines[0]):]
+    common = 0
+    while common < min(len(lines), len(previous)) and lines[common] == previous[common]:
+      common += 1
+    self.lines = lines
+    if common < len(lines):
+      runtime_log.console_write(''.join(line + '\n' for line in lines[common:]))
+
+  def apply(self, changes, text):
+    # 只输出新增或文字有变化的条目；移出的条目和只是标记为完成的条目不需要输出
+    output = []
+    for change in changes:
+      if change.op in (APPEND, REPLACE) and change.entry.text not in self.lines[-1:]:
+        output.append(change.entry.text + '\n')
+    self.lines = text.split('\n')
+    if output:
+      runtime_log.console_write(''.join(output))
+
+
+class JsonlSink(CaptionSink):
+  """每次字幕变化追加一行 JSON，便于其他程序读取或事后分析"""
+
+  def __init__(self, path):
+    self.path = path
+    self.file = open(path, "a", encoding="utf-8")
+
+  def publish(self, text):
+    self.apply(None, text)
+
+  def apply(self, changes, text):
+    self.file.write(json.dumps(caption_record(text, changes), ensure_ascii=False) + "\n")
+    self.file.flush()
+
+  def close(self):
+    self.file.close()
+
+
+class SocketSink(CaptionSink):
+  """
+  在 HOST:PORT 上监听 TCP 连接，向所有已连接的客户端推送 JSON 行。
+  发送超时或出错的客户端直接断开，不阻塞转录线程。
+  """
+  send_timeout = 0.5
+
+  def __init__(self, host, port):
+    self.server = socket.create_server((host, port))
+    self.clients = []
+    self.lock = threading.Lock()
+    self.accept_thread = threading.Thread(target=self._accept, name="caption-socket", daemon=True)
+    self.accept_thread.start()
+    log.info(f"Serving captions on {host}:{port}")
+
+  def _accept(self):
+    while True:
+      try:
+        conn, address = self.server.accept()
+      except OSError:
+        return  # 服务端已关闭
+      conn.settimeout(self.send_timeout)
+      with self.lock:
+        self.clients.append(conn)
+      log.info(f"Caption client connected: {address[0]}:{address[1]}")
+
+  def publish(self, text):
+    self.apply(None, text)
+
+  def apply(self, changes, text):
+    data = (json.dumps(caption_record(text, changes), ensure_ascii=False) + "\n").encode("utf-8")
+    with self.lock:
+      clients = list(self.clients)
+    for conn in clients:
+      try:
+        conn.sendall(data)
+      except OSError as e:
+        log.info(f"Caption client disconnected: {e}")
+        with self.lock:
+          self.clients.remove(conn)
+        conn.close()
+
+  def close(self):
+    self.server.close()
+    with self.lock:
+      for conn in self.clients:
+        conn.close()
+      self.clients = []
+
+
+def parse_sink(spec):
+  """stdout | jsonl:PATH | socket:HOST:PORT（HOST 可省略，默认 127.0.0.1）"""
+  kind, _, target = spec.partition(':')
+  if kind == "stdout":
+    return StdoutSink()
+  if kind == "jsonl" and target:
+    return JsonlSink(target)
+  if kind == "socket" and target:
+    host, _, port = target.rpartition(':')
+    return SocketSink(host or "127.0.0.1", int(port))
+  raise ValueError(f"Unknown caption sink '{spec}', expected stdout, jsonl:PATH or socket:HOST:PORT")
+
+
+class CaptionFanout:
+  """
+  转录器发布字幕的唯一入口，文本有变化时分发给所有输出端（字幕窗口也是其中之一）。
+  单个输出端出错只记录日志，不影响转录和其他输出端。
+  """
+
+  def __init__(self, sinks=()):
+    self.sinks = list(sinks)
+    self.text = None
+    self.lock = threading.Lock()
+
+  def add(self, sink):
+    self.sinks.append(sink)
+
+  def writes_stdout(self):
+    """是否有输出端把字幕写到标准输出；此时不应再在终端里另外绘制转录历史"""
+    return any(isinstance(sink, StdoutSink) for sink in self.sinks)
+
+  def publish(self, text, changes=None):
+    """
+    changes 为 CaptionState.update 的结果：支持增量的输出端收到变化列表，其余输出端收到完整文本。
+    不带 changes 的发布（例如状态提示）相当于整体替换显示内容。
+    """
+    with self.lock:
+      # 句子完成时文本可能不变，只有 partial 标记变化，仍需通知输出端
+      if text == self.text and not changes:
+        return False
+      self.text = text
+    for sink in self.sinks:
+      try:
+        if changes and hasattr(sink, "apply"):
+          sink.apply(changes, text)
+        else:
+          sink.publish(text)
+      except Exception as e:
+        log.error(f"Caption sink {type(sink).__name__} failed: {e}")
+    return True
+
+  def close(self):
+    for sink in self.sinks:
+      try:
+        sink.close()
+      except Exception as e:
+        log.error(f"Error closing caption sink {type(sink).__name__}: {e}")
+
+
+def build_captions(specs, headless):
+  """按 --caption-sink 创建输出端；无界面模式下没有指定时默认输出到标准输出"""
+  sinks = [parse_sink(spec) for spec in specs or []]
+  if headless and not sinks:
+    sinks.append(StdoutSink())
+  return CaptionFanout(sinks)
+
+
+def run_headless(transcriber, captions):
+  """无界面运行：不导入Qt，主线程只等待 Ctrl+C 或 SIGTERM 后停止转录"""
+  stop_event = threading.Event()
+
+  def handle_signal(sig, frame):
+    log.info("Received interrupt signal, shutting down...")
+    stop_event.set()
+  signal.signal(signal.SIGINT, handle_signal)
+  signal.signal(signal.SIGTERM, handle_signal)
+
+  log.info(f"Running headless with caption sinks: {', '.join(type(sink).__name__ for sink in captions.sinks)}")
+  transcriber.start_transcribe_thread()
+  # 带超时的等待让解释器能及时处理信号
+  while not stop_event.wait(0.5):
+    pass
+  transcriber.stop_transcribe_thread()
+  captions.close()
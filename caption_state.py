@@ -0,0 +1,90 @@
+#! python3.7
+
+from collections import deque, namedtuple
+
+APPEND = "append"
+REPLACE = "replace"
+EVICT = "evict"
+
+# op 为 APPEND / REPLACE / EVICT，entry 为变化后的条目（EVICT 时为被移出的条目）
+CaptionChange = namedtuple("CaptionChange", "op entry")
+
+
+class CaptionEntry:
+  """
+  一行字幕。id 在会话内唯一且不变，revision 每次被新结果替换时加一；
+  partial 为 True 表示句子尚未完成，下一次结果会替换这一行。
+  """
+  __slots__ = ("id", "text", "revision", "partial")
+
+  def __init__(self, id, text, partial=False):
+    self.id = id
+    self.text = text
+    self.revision = 0
+    self.partial = partial
+
+  @property
+  def final(self):
+    return not self.partial
+
+  def to_dict(self):
+    return {"id": self.id, "revision": self.revision, "partial": self.partial, "text": self.text}
+
+
+def change_dict(change):
+  return dict(change.entry.to_dict(), op=change.op)
+
+
+class CaptionState:
+  """
+  字幕窗口显示的最近几行字幕，替代 listen() 中手工传递的 caption_history / current_caption 等变量。
+  条目保存在有界 deque 中，update 返回本次的最小变化（追加、替换末行、移出首行），
+  输出端可以据此增量更新，不必每次从完整文本重新渲染。
+  """
+
+  def __init__(self, max_lines=5):
+    self.entries = deque(maxlen=max_lines)
+    self.next_id = 1
+
+  def __len__(self):
+    return len(self.entries)
+
+  @property
+  def tail(self):
+    return self.entries[-1] if self.entries else None
+
+  def lines(self):
+    return [entry.text for entry in self.entries]
+
+  @property
+  def text(self):
+    return '\n'.join(entry.text for entry in self.entries)
+
+  def update(self, text, partial=False):
+    """
+    加入一次解码结果，返回 CaptionChange 列表；与末行完全相同的结果不产生变化。
+    末行是未完成的句子时替换它，否则追加新行，超出 max_lines 时最早的一行被移出。
+    """
+    # 每个条目只占一行，输出端按行对应条目
+    text = ' '.join(line.strip() for line in (text or '').split('\n') if line.strip())
+    if not text:
+      return []
+
+    tail = self.tail
+    # 末行未完成时用新结果替换它；与已完成的末行相同的未完成结果让末行重新变为未完成
+    if tail is not None and (tail.partial or tail.text == text):
+      if tail.text == text and tail.partial == partial:
+        return []
+      tail.text = text
+      tail.partial = partial
+      tail.revision += 1
+      return [CaptionChange(REPLACE, tail)]
+
+    changes = []
+    if len(self.entries) == self.entries.maxlen:
+      changes.append(CaptionChange(EVICT, self.entries[0]))
+    entry = CaptionEntry(self.next_id, text, partial)
+    self.next_id += 1
+    self.entries.append(entry)
+    changes.append(CaptionChange(APPEND, entry))
+    return changes
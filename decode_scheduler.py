@@ -0,0 +1,79 @@
+#! python3.7
+
+import time
+from collections import deque
+from runtime_log import get_logger
+
+log = get_logger("decode_scheduler")
+
+
+class DeadlineScheduler:
+  """
+  按截止时间调度解码窗口。
+  每个窗口的截止时间 = 最后一个采样的采集时间 + 允许的实时延迟；
+  预计无法按时完成的窗口不立即解码，而是并入下一个窗口（每个窗口最多并入一次，之后即使迟到也立即解码）；
+  过于陈旧的窗口降级到后台，只在空闲时解码并写入最终转录，不再占用实时字幕的计算。
+  """
+
+  LIVE = 'live'
+  MERGE = 'merge'
+  BACKGROUND = 'background'
+
+  def __init__(self, live_latency=2.0, max_staleness=8.0, decode_overhead=0.1, smoothing=0.3, max_background=20):
+    self.live_latency = live_latency
+    self.max_staleness = max_staleness
+    self.decode_overhead = decode_overhead
+    self.smoothing = smoothing
+
+    self.rtf = None  # 每秒音频的解码耗时（指数滑动平均）
+    self.background = deque(maxlen=max_background)
+    self.stats = {'live': 0, 'late': 0, 'merged': 0, 'demoted': 0, 'background_decoded': 0}
+
+  def predict(self, audio_seconds):
+    """预计解码 audio_seconds 秒音频需要的时间"""
+    return self.decode_overhead + audio_seconds * (self.rtf or 0.0)
+
+  def record(self, decode_seconds, audio_seconds):
+    if audio_seconds <= 0:
+      return
+    rtf = max(0.0, decode_seconds - self.decode_overhead) / audio_seconds
+    self.rtf = rtf if self.rtf is None else self.rtf + self.smoothing * (rtf - self.rtf)
+
+  def plan(self, capture_start, capture_end, audio_seconds, now=None, merged=False):
+    """
+    决定当前窗口是实时解码、并入下一个窗口还是降级到后台。
+    capture_start / capture_end 为窗口首尾采样的采集时间；merged 表示该窗口已经并入过一次，
+    不再继续并入，否则窗口会一直增长直到被降级。
+    """
+    now = time.time() if now is None else now
+    deadline = capture_end + self.live_latency
+
+    if self.rtf is None or now + self.predict(audio_seconds) <= deadline:
+      self.stats['live'] += 1
+      return self.LIVE
+
+    if now - capture_start >= self.max_staleness:
+      self.stats['demoted'] += 1
+      return self.BACKGROUND
+
+    if merged:
+      self.stats['late'] += 1
+      return self.LIVE
+
+    self.stats['merged'] += 1
+    return self.MERGE
+
+  def demote(self, audio, capture_start):
+    if len(self.background) == self.background.maxlen:
+      log.debug("Background queue full, dropping oldest demoted window")
+    self.background.append((capture_start, audio))
+    log.debug("Window from %.1fs ago demoted to background (%s pending, stats: %s)",
+              time.time() - capture_start, len(self.background), self.stats)
+
+  def take_background(self, max_windows=1):
+    """取出最多 max_windows 个待解码的后台窗口，按采集顺序返回 [(capture_start, audio), ...]"""
+    windows = []
+    while self.background and len(windows) < max_windows:
+      windows.append(self.background.popleft())
+    self.stats['background_decoded'] += len(windows)
+    return windows
@@ -0,0 +1,691 @@
+#! python3.7
+
+import argparse
+import signal
+import threading
+import time
+import numpy as np
+import torch
+import whisper
+from faster_whisper import WhisperModel
+from streaming_features import StreamingLogMel
+from whisper_backend import OpenAIWhisperBackend, CancellationToken, DecodeCancelled
+from inference_worker import InferenceWorker
+from language_id import LanguageIdManager
+from rtf_governor import RealtimeGovernor, build_levels
+from decode_scheduler import DeadlineScheduler
+from result_cache import DecodeResultCache
+from model_optimizer import load_model
+from onnx_backend import ONNXWhisperBackend, load_onnx_model
+from subtitle_writer import SubtitleWriter
+from caption_state import CaptionState
+from transcript_store import TranscriptStore
+
+from queue import Queue
+
+from caption_sinks import build_captions, run_headless
+from runtime_log import LEVELS, setup_logging, flush_logging, get_logger
+
+log = get_logger("engine")
+
+MODEL_CHOICES = ["tiny", "base", "small", "medium", "large", "tiny.en", "base.en", "small.en", "medium.en", "large-v3"]
+
+
+def add_caption_arguments(parser):
+  """字幕窗口和字幕输出端参数，三个实时转录入口共用"""
+  parser.add_argument("--font-size", default=32,
+            help="Subtitle font size (default: 32)", type=int)
+  parser.add_argument("--caption-widget", default="text", choices=["text", "painted"],
+            help="Caption widget: 'text' (rich-text QTextEdit) or 'painted' (lightweight, cached line layouts)")
+  parser.add_argument("--headless", action='store_true', default=False,
+            help="Run without the Qt caption window (PyQt5 is not imported); captions go to --caption-sink outputs, stdout by default")
+  parser.add_argument("--caption-sink", action='append', default=None,
+            help="Extra caption output, repeatable: 'stdout', 'jsonl:PATH' or 'socket:HOST:PORT' (JSON lines to connected TCP clients)")
+  parser.add_argument("--transcript-db", default=None,
+            help="Append committed captions to this SQLite database (full-text searchable across sessions with transcript_store.py); only recent history is kept in memory", type=str)
+  parser.add_argument("--subtitle-file", default=None,
+            help="Write committed captions to this subtitle file as they are transcribed, SRT or WebVTT by extension (.srt/.vtt)", type=str)
+
+
+def add_decode_arguments(parser):
+  """模型、解码和日志参数，三个实时转录入口共用"""
+  parser.add_argument("--translate", action='store_true', default=False,
+            help="Translate to English")
+  parser.add_argument("--no-fp16", action='store_true', default=False,
+            help="Disable fp16 optimization")
+  parser.add_argument("--beam-size", default=1,
+            help="Beam size for standard Whisper decoding (default: 1, greedy)", type=int)
+  parser.add_argument("--inference-process", action='store_true', default=False,
+            help="Run Whisper inference in a separate worker process to keep audio capture and UI responsive")
+  parser.add_argument("--no-rtf-governor", action='store_true', default=False,
+            help="Disable automatic degradation (decode interval, beam size, smaller model) when decoding falls behind real time")
+  parser.add_argument("--result-cache-size", default=64,
+            help="Number of decode results cached by audio fingerprint, so identical windows are not decoded twice (0 to disable)", type=int)
+  parser.add_argument("--max-batch-size", default=8,
+            help="Maximum number of windows (backlogged, or from different sources) decoded together in one batch", type=int)
+  parser.add_argument("--tokens-per-second", default=10.0,
+            help="Token budget per second of audio; limits hallucinated runs on short windows (0 for no limit)", type=float)
+  parser.add_argument("--optimize-model", action='store_true', default=False,
+            help="Run the Whisper encoder as a TorchScript graph compiled once and cached on disk (one graph per power-of-two batch size up to --max-batch-size)")
+  parser.add_argument("--onnx", action='store_true', default=False,
+            help="Run the model with ONNX Runtime on CPU (exported locally from the cached Whisper weights on first use)")
+  parser.add_argument("--onnx-threads", default=0,
+            help="ONNX Runtime intra-op threads (default: 0, let ONNX Runtime decide)", type=int)
+  parser.add_argument("--onnx-inter-threads", default=0,
+            help="ONNX Runtime inter-op threads (default: 0, let ONNX Runtime decide)", type=int)
+  parser.add_argument("--log-level", default="info", choices=LEVELS,
+            help="Log verbosity (default: info). Use 'warning' for quiet long runs, 'debug' for per-window detail")
+  parser.add_argument("--log-file", default=None,
+            help="Also write logs to this file", type=str)
+
+
+def build_parser(description, epilog, input_help):
+  """单一音频来源入口（麦克风、系统音频）的完整参数"""
+  parser = argparse.ArgumentParser(
+    description=description,
+    formatter_class=argparse.RawDescriptionHelpFormatter,
+    epilog=epilog
+  )
+
+  # 简化的核心参数，设置最佳默认值
+  parser.add_argument("--model", default="tiny.en", help="Whisper model to use (default: tiny.en for fast English transcription)",
+            choices=MODEL_CHOICES)
+  parser.add_argument("--language", default="en",
+            help="Language for transcription (default: en). Use 'zh' for Chinese, 'auto' for auto-detection", type=str)
+  add_caption_arguments(parser)
+
+  # 高级参数（大多数用户不需要修改）
+  parser.add_argument("--input", default=None,
+            help=input_help, type=str)
+  parser.add_argument("--input-provider", default="pyaudio",
+            choices=["pyaudio", "speech-recognition"],
+            help="Audio input provider (default: pyaudio)", type=str)
+  parser.add_argument("--no-faster-whisper", action='store_true', default=True,
+            help="Use standard Whisper instead of faster-whisper (default: enabled for stability)")
+  parser.add_argument("--stabilize-turns", default=0,
+            help="Turns to stabilize result (default: 0 for real-time)", type=int)
+  parser.add_argument("--min-duration", default=0.2,
+            help="Min duration of audio to process (default: 0.2s for low latency)", type=float)
+  parser.add_argument("--max-duration", default=1.5,
+            help="Max duration of audio to process (default: 1.5s for low latency)", type=float)
+  parser.add_argument("--keep-transcriptions", action='store_true', default=False,
+            help="Keep all previous transcriptions in memory (ignored with --transcript-db, which keeps them on disk)")
+  parser.add_argument("--partial-results", action='store_true', default=False,
+            help="Keep growing the audio window until the sentence completes, reusing stable tokens as decoder prefix")
+  parser.add_argument("--live-latency", default=2.0,
+            help="Seconds after capture by which a caption must be shown; later windows are merged or decoded in background (0 to disable)", type=float)
+  add_decode_arguments(parser)
+
+  # args for input provider 'speech-recognition'
+  parser.add_argument("--energy_threshold", default=300,
+            help="Energy level for mic to detect", type=int)
+  parser.add_argument("--record_timeout", default=0.3,
+            help="How real time the recording is in seconds", type=float)
+  parser.add_argument("--phrase_timeout", default=0.8,
+            help="How much empty space between recordings before considering it a new line", type=float)
+
+  # args for input provider 'pyaudio'
+  parser.add_argument("--moving-window", default=10,
+            help="Moving window duration in seconds", type=int)
+  parser.add_argument("--chunk-size", default=512,
+            help="Audio chunk size (default: 512 for low latency)", type=int)
+  parser.add_argument("--realtime-mode", action='store_true', default=True,
+            help="Enable real-time optimizations (default: enabled)")
+  return parser
+
+
+class AudioInputProvider:
+  def list_input_devices(self):
+    raise NotImplementedError
+
+  def init_input_device(self, device_index):
+    raise NotImplementedError
+
+  def start_record(self):
+    raise NotImplementedError
+
+  def stop_record(self):
+    raise NotImplementedError
+
+  def phrase_cut_off(self, acc_data, new_data):
+    raise NotImplementedError
+
+
+class Engine():
+  """
+  实时转录引擎共用的部分：转录线程启停、字幕输出、解码结果缓存、批量解码和实时率调节。
+  子类加载模型后调用 init_decode_control()，并实现 listen()。
+  """
+  max_transcription_history = 100
+  max_caption_lines = 5  # 字幕窗口最多显示的行数
+  program = None  # 转录库中会话的程序名
+
+  def __init__(self, args, captions):
+    self.args = args
+    # 字幕输出端（字幕窗口、标准输出、文件、socket）
+    self.captions = captions
+    # 字幕窗口显示的最近几行，产生增量变化给输出端
+    self.caption_state = CaptionState(self.max_caption_lines)
+    # 边转录边写字幕文件，时间取自音频采集时间
+    self.subtitles = SubtitleWriter(args.subtitle_file) if args.subtitle_file else None
+    # 确认的字幕写入转录库，内存中只保留最近的历史
+    self.transcripts = TranscriptStore(args.transcript_db, program=self.program) if args.transcript_db else None
+    self.sample_rate = whisper.audio.SAMPLE_RATE
+    # Use CPU by default for more compatibility, allow opt-in to GPU
+    self.compute_device = "cpu"
+    self.transcribe_thread = None
+    self.stop_event = threading.Event()
+
+    self.inference_worker = None
+    self.backend = None
+    self.decode_interval = 0.0
+    self.governor = None
+    self.scheduler = None
+    self.result_cache = None
+    self.last_decode_cached = False  # 上一次解码是否命中缓存，命中时不计入实时率
+
+  def init_decode_control(self):
+    """后端就绪后创建实时率调节器和结果缓存"""
+    # 实时率调节器：解码跟不上实时时逐级降低开销
+    if not self.args.no_rtf_governor:
+      self.governor = RealtimeGovernor(build_levels(self.args))
+    # 以音频指纹缓存解码结果，重复送入的相同窗口不再推理
+    if self.backend is not None and self.args.result_cache_size > 0:
+      self.result_cache = DecodeResultCache(max_entries=self.args.result_cache_size)
+
+  def start_transcribe_thread(self):
+    if self.transcribe_thread is not None:
+      log.warning("Transcription thread already running")
+      return
+
+    self.stop_event.clear()
+    self.transcribe_thread = threading.Thread(target=self.listen)
+    self.transcribe_thread.daemon = True
+    self.transcribe_thread.start()
+    log.info("Transcription thread started")
+
+  def stop_transcribe_thread(self):
+    if self.transcribe_thread is None:
+      return
+
+    log.info("Stopping transcription thread...")
+    self.stop_event.set()
+    self.transcribe_thread.join(timeout=5.0)  # Wait up to 5 seconds
+    self.transcribe_thread = None
+    log.info("Transcription thread stopped")
+
+    if self.inference_worker is not None:
+      self.inference_worker.close()
+    if self.subtitles is not None:
+      self.subtitles.close()
+    if self.transcripts is not None:
+      self.transcripts.close()
+
+  def listen(self):
+    raise NotImplementedError
+
+  def publish_captions(self, changes):
+    """把字幕状态的增量变化和完整文本发给输出端"""
+    if changes and self.captions.publish(self.caption_state.text, changes):
+      log.debug("Published caption changes: %s", ', '.join(f"{change.op} #{change.entry.id}" for change in changes))
+
+  def log_final_transcription(self, lines):
+    """停止时把本次的转录结果写入日志，不直接打印，避免与 stdout 字幕输出端混在一起"""
+    lines = [line for line in lines if line]
+    if lines:
+      log.info("Final transcription:\n%s", '\n'.join(lines))
+
+  def queued_chunks(self):
+    """等待处理的音频块数量，交给实时率调节器判断积压"""
+    return self.data_queue.qsize()
+
+  def apply_governor_settings(self, settings):
+    """应用实时率调节器给出的降级/回升配置"""
+    self.decode_interval = settings['decode_interval']
+    if self.backend is not None:
+      self.backend.apply_settings(settings)
+
+  def record_decode_time(self, decode_seconds, audio_seconds):
+    """把一次解码的耗时交给调度器和实时率调节器，必要时切换配置"""
+    if self.last_decode_cached:
+      # 缓存命中没有真正推理，接近零的耗时会把实时率估计拉低，掩盖真实的过载
+      self.last_decode_cached = False
+      return
+    if self.scheduler is not None:
+      self.scheduler.record(decode_seconds, audio_seconds)
+    if self.governor is None:
+      return
+    settings = self.governor.record(decode_seconds, audio_seconds, self.queued_chunks())
+    if settings is not None:
+      self.apply_governor_settings(settings)
+
+  def decode_params(self, language):
+    """
+    影响解码结果的参数，作为结果缓存键的一部分。
+    优先取后端实际使用的模型和beam大小：ONNX后端不会切换模型，也只做贪心解码。
+    """
+    settings = self.governor.settings if self.governor is not None else {}
+    return {
+      'model': getattr(self.backend, 'model_name', settings.get('model', self.args.model)),
+      'beam_size': getattr(self.backend, 'beam_size', settings.get('beam_size', self.args.beam_size)),
+      'task': "translate" if self.args.translate else "transcribe",
+      'language': language,
+    }
+
+  def cached_decode(self, audio, language, decode):
+    """通过结果缓存调用 decode()；相同音频和参数的窗口直接返回上次的结果"""
+    if self.result_cache is None:
+      return decode()
+    key = self.result_cache.key(audio, self.decode_params(language))
+    result = self.result_cache.get(key)
+    if result is not None:
+      log.debug("Result cache hit: %s", self.result_cache.stats())
+      self.last_decode_cached = True
+      return result
+    result = decode()
+    self.result_cache.put(key, result)
+    return result
+
+  def decode_batch(self, audios, language, record=False):
+    """
+    批量解码多段音频；缓存命中的直接返回，其余补齐后一次性送入后端，结果按输入顺序返回。
+    record 为 True 时把实际解码部分的耗时交给调度器和实时率调节器。
+    """
+    results = [None] * len(audios)
+    keys = [None] * len(audios)
+    if self.result_cache is not None:
+      params = self.decode_params(language)
+      for i, audio in enumerate(audios):
+        keys[i] = self.result_cache.key(audio, params)
+        results[i] = self.result_cache.get(keys[i])
+
+    pending = [i for i, result in enumerate(results) if result is None]
+    if pending:
+      batch_start = time.time()
+      decoded = self.backend.decode_batch([audios[i] for i in pending], language,
+                                          cancel_token=CancellationToken(self.stop_event.is_set))
+      decode_seconds = time.time() - batch_start
+      log.debug("Batch decoded %s windows in %.2f seconds", len(pending), decode_seconds)
+      for i, result in zip(pending, decoded):
+        results[i] = result
+        if self.result_cache is not None:
+          self.result_cache.put(keys[i], result)
+      if record:
+        self.last_decode_cached = False
+        self.record_decode_time(decode_seconds, sum(len(audios[i]) for i in pending) / self.sample_rate)
+    return results
+
+
+class StreamTranscriber(Engine):
+  """
+  单一音频来源的实时转录引擎：一个输入设备、一个累积窗口，支持 faster-whisper、
+  增量 log-mel 特征、截止时间调度和部分结果。子类提供输入设备和 listen() 主循环。
+  """
+  n_context = 5
+  supersede_seconds = 0.5  # 部分结果模式下排队的新音频超过该时长时，放弃正在进行的解码
+  transcript_source = None  # 转录库中字幕的来源标签
+
+  def __init__(self, args, captions):
+    super().__init__(args, captions)
+    self.language = args.language
+    # 自动识别语言时缓存识别结果，不再每个窗口都重新识别
+    self.language_id = None
+    if args.language == "auto":
+      self.language = None
+      self.language_id = LanguageIdManager()
+    if torch.cuda.is_available():
+      log.info("CUDA is available! To use GPU, restart the program without --no-faster-whisper flag")
+
+    self.model_name = args.model
+
+    # Thread safe Queue for passing data from the threaded recording callback.
+    self.data_queue = Queue()
+    self.input_provider = self.create_input_provider()
+
+    log.info(f"Using {self.model_name} model")
+    log.info(f"Computing on {self.compute_device}")
+
+    self.init_input_device(args)
+
+    log.info(f"Loading model {self.model_name}...")
+    # Load / Download model
+    start_time = time.time()
+    try:
+      if self.args.no_faster_whisper and self.args.inference_process:
+        # 模型只在推理进程中加载，主进程只负责采集和显示
+        self.inference_worker = InferenceWorker(args, self.compute_device)
+        self.audio_model = None
+      elif self.args.no_faster_whisper and self.args.onnx:
+        # ONNX Runtime 执行本地导出的编码器/解码器图，不加载 PyTorch 模型
+        self.audio_model = load_onnx_model(self.model_name, args)
+      elif self.args.no_faster_whisper:
+        self.audio_model = load_model(self.model_name, self.compute_device, args)
+      else:
+        self.audio_model = WhisperModel(self.model_name, device=self.compute_device)
+      log.info(f"Model loaded in {time.time() - start_time:.2f} seconds")
+    except Exception as e:
+      log.error(f"Error loading model: {e}")
+      raise
+
+    # 标准whisper使用增量计算的 log-mel 特征，避免每次转录重复计算整个窗口的STFT
+    self.mel_stream = None
+    if self.inference_worker is not None:
+      # 推理进程同时负责特征计算和解码
+      self.mel_stream = self.inference_worker
+      self.backend = self.inference_worker
+    elif self.args.no_faster_whisper:
+      self.mel_stream = StreamingLogMel(n_mels=self.audio_model.dims.n_mels, max_seconds=args.moving_window)
+      backend_class = ONNXWhisperBackend if args.onnx else OpenAIWhisperBackend
+      self.backend = backend_class(self.audio_model, args, self.compute_device)
+
+    self.init_decode_control()
+    # 按截止时间调度解码，赶不上实时显示的窗口不再占用实时计算
+    if args.live_latency > 0:
+      self.scheduler = DeadlineScheduler(live_latency=args.live_latency)
+    self.window_merged = False  # 当前窗口是否已经并入过一次，清空窗口时复位
+
+    # Cue the user that we're ready to go.
+    log.info("System ready. Starting transcription...")
+
+  def create_input_provider(self):
+    """创建音频输入，采集到的数据以 (采集时间, bytes) 放入 self.data_queue"""
+    raise NotImplementedError
+
+  def default_input_device(self, devices):
+    """未指定 --input 时默认使用的设备索引"""
+    return 0
+
+  def init_input_device(self, args):
+    device_index = None
+
+    if args.input is not None:
+      try:
+        # 检查是否输入的是数字索引
+        if args.input.isdigit():
+          device_index = int(args.input)
+          devices = self.input_provider.list_input_devices()
+          if device_index < 0 or device_index >= len(devices):
+            log.warning(f"Device index {device_index} out of range, will list available devices")
+            device_index = None
+          else:
+            log.info(f"Using specified device index: {device_index} ({devices[device_index]})")
+        else:
+          # 如果不是数字，尝试匹配设备名称
+          for idx, name in enumerate(self.input_provider.list_input_devices()):
+            if args.input.lower() in name.lower():  # 使用部分匹配而不是精确匹配
+              device_index = idx
+              log.info(f"Found matching device: {idx}. {name}")
+              break
+      except Exception as e:
+        log.error(f"Error finding specified input device: {e}")
+        device_index = None
+
+    if device_index is None:
+      try:
+        # 打印可用音频设备列表
+        devices = list(self.input_provider.list_input_devices())
+        # 列表和输入提示直接写控制台，先等已排队的日志写完
+        flush_logging()
+        print("Available input devices:")
+        for idx, name in enumerate(devices):
+          print(f"{idx}. {name}")
+
+        if args.input is None:
+          # 选择所需输入设备的索引
+          default_device = self.default_input_device(devices)
+
+          print(f"Default device will be {default_device}: {devices[default_device]} in 5 seconds...")
+          print("Enter device number to override (or press Enter to use default):", end="", flush=True)
+
+          # 设置超时读取输入
+          import select
+          import sys
+
+          # 检查是否有用户输入，最多等待5秒
+          ready, _, _ = select.select([sys.stdin], [], [], 5)
+          if ready:
+            user_input = sys.stdin.readline().strip()
+            if user_input.isdigit() and 0 <= int(user_input) < len(devices):
+              device_index = int(user_input)
+              log.info(f"User selected device: {device_index}. {devices[device_index]}")
+            else:
+              if user_input:
+                log.warning(f"Invalid input '{user_input}', using default device")
+              device_index = default_device
+          else:
+            log.warning("No input received, using default device")
+            device_index = default_device
+        else:
+          log.warning(f"Could not find device matching '{args.input}', please select from available devices")
+          return self.init_input_device(argparse.Namespace(**{**vars(args), 'input': None}))  # 重新调用但清除input参数
+      except Exception as e:
+        log.error(f"Error in device selection: {e}")
+        device_index = None  # 使用默认设备
+
+    try:
+      self.input_provider.init_input_device(device_index)
+    except Exception as e:
+      log.error(f"Critical error initializing input device: {e}")
+      raise
+
+  def update_hud_text(self, text):
+    # 确保是字符串且不为空
+    if text is None:
+      log.warning("Attempted to update with None text, ignored")
+      return
+
+    if not isinstance(text, str):
+      text = str(text)
+      log.warning(f"Non-string text converted to: {text}")
+
+    # 去除多余空白字符，保留每行一条字幕的结构，字幕窗口按条目缓存分句结果
+    cleaned_text = '\n'.join([line.strip() for line in text.split('\n') if line.strip()])
+
+    # 确保文本非空
+    if not cleaned_text.strip():
+      log.warning("Attempted to update with empty text, ignored")
+      return
+
+    # 文本有变化时才会通知字幕窗口刷新
+    if self.captions.publish(cleaned_text):
+      # 限制日志长度以避免刷屏
+      preview = cleaned_text[:50] + "..." if len(cleaned_text) > 50 else cleaned_text
+      log.debug("Published caption: '%s' (len=%s)", preview, len(cleaned_text))
+
+  def current_language(self):
+    """返回本次解码使用的语言；自动识别模式下由 LanguageIdManager 决定，None 表示需要识别"""
+    if self.language_id is None:
+      return self.language
+    return self.language_id.language_for_decode()
+
+  def update_language(self, language_probs, has_speech):
+    """把一次解码的语言识别结果交给 LanguageIdManager；language_probs 为 None 时只记录是否有语音"""
+    if self.language_id is None:
+      return
+    if language_probs:
+      self.language_id.observe(language_probs)
+    if has_speech:
+      self.language_id.mark_speech()
+
+  def decode_superseded(self):
+    """正在进行的解码是否已无意义：转录正在停止，或部分结果模式下已经排队了足够的新音频"""
+    if self.stop_event.is_set():
+      return "transcription stopping"
+    queued_samples = self.data_queue.qsize() * self.args.chunk_size
+    if self.args.partial_results and queued_samples >= self.sample_rate * self.supersede_seconds:
+      return "superseded by newer audio"
+    return None
+
+  def decode_window(self, acc_audio_data):
+    """解码当前窗口的增量 log-mel 特征，被更新的音频取代或停止时抛出 DecodeCancelled"""
+    language = self.current_language()
+    cancel_token = CancellationToken(self.decode_superseded)
+    # 需要识别语言时先把识别结果交给 LanguageIdManager，按它保持或切换后的语言解码
+    choose_language = self.language_id.resolve if self.language_id is not None else None
+    decode = lambda: self.backend.decode(self.mel_stream.log_mel(), len(acc_audio_data), language,
+                                         cancel_token=cancel_token, choose_language=choose_language)
+    # 部分结果模式下解码结果还取决于已确认的前缀，相同音频不一定得到相同结果
+    if self.args.partial_results:
+      return decode()
+    return self.cached_decode(self.audio_buffer_numpy(acc_audio_data), language, decode)
+
+  def audio_buffer_numpy(self, acc_audio_data):
+    """把累积的音频缓冲区复制为 numpy 数组"""
+    if torch.is_tensor(acc_audio_data):
+      return acc_audio_data.cpu().numpy().astype(np.float32)
+    return np.array(acc_audio_data, dtype=np.float32)
+
+  def process_background_windows(self, transcription):
+    """空闲时批量解码积压的后台窗口，结果按采集顺序只写入最终转录，不更新实时字幕"""
+    if self.scheduler is None:
+      return False
+    windows = self.scheduler.take_background(max(1, self.args.max_batch_size))
+    if not windows:
+      return False
+
+    language = self.current_language()
+    try:
+      if self.backend is not None:
+        texts = [result['text'] for result in self.decode_batch([audio for _, audio in windows], language)]
+      else:
+        texts = []
+        for _, audio in windows:
+          segments, _ = self.audio_model.transcribe(audio, language=language)
+          texts.append(' '.join(segment.text for segment in segments))
+    except DecodeCancelled:
+      log.warning(f"Background decode cancelled, {len(windows)} windows dropped")
+      return True
+    except Exception as e:
+      log.error(f"Error decoding background windows: {e}")
+      return True
+
+    for (capture_start, audio), text in zip(windows, texts):
+      if text.strip():
+        transcription.append(text.strip())
+        self.record_commit([text.strip()], None, capture_start, capture_start + len(audio) / self.sample_rate)
+        log.info(f"Background transcription ({time.time() - capture_start:.1f}s late): {text.strip()}")
+    # 写入转录库时完整历史在磁盘上，内存中只保留最近的部分
+    if not self.args.keep_transcriptions or self.transcripts is not None:
+      del transcription[:-self.max_transcription_history]
+    return True
+
+  def record_commit(self, texts, result, capture_start, capture_end):
+    """
+    把确认的结果写入字幕文件和转录库。
+    字幕文件有分段时间时按分段写，否则整个窗口一条；转录库每个窗口一条。
+    """
+    if self.transcripts is not None:
+      self.transcripts.add(capture_start, capture_end, ' '.join(texts), source=self.transcript_source)
+    if self.subtitles is None:
+      return
+    segments = result.get('segments') if isinstance(result, dict) else None
+    if segments:
+      self.subtitles.add_segments(capture_start, segments)
+    else:
+      self.subtitles.add(capture_start, capture_end, ' '.join(texts))
+
+  def empty_audio_buffer(self):
+    """返回一个空的音频缓冲区，同时清空对应的增量特征"""
+    self.window_merged = False
+    if self.mel_stream is not None:
+      self.mel_stream.reset()
+    if self.backend is not None:
+      self.backend.reset_context()
+    if self.args.no_faster_whisper:
+      return torch.zeros((0,), dtype=torch.float32, device=self.compute_device)
+    return np.array([], dtype=np.float32)
+
+  def discard_audio(self, acc_audio_data, n_samples):
+    """从缓冲区头部裁掉 n_samples 个采样，同步裁剪特征；已确认的前缀不再对应窗口，需要清空"""
+    if self.mel_stream is not None:
+      self.mel_stream.discard(n_samples)
+    if self.backend is not None:
+      self.backend.reset_context()
+    return acc_audio_data[n_samples:]
+
+  def is_sentence_complete(self, text):
+    """检测句子是否完整（以句号、问号、感叹号等结尾）"""
+    if not text or not text.strip():
+      return False
+
+    text = text.strip()
+    # 检查是否以句子结束符结尾
+    sentence_endings = ['.', '!', '?', '。', '！', '？', '...', ':', '：']
+    return any(text.endswith(ending) for ending in sentence_endings)
+
+
+def run(args, create_transcriber, initial_text):
+  """
+  三个实时转录入口共用的 main()：无界面模式只启动转录线程，
+  否则在主线程创建 Qt 字幕窗口并运行事件循环，直到 Ctrl+C 或窗口关闭。
+  """
+  setup_logging(args.log_level, args.log_file)
+
+  try:
+    captions = build_captions(args.caption_sink, args.headless)
+    if args.headless:
+      # 无界面模式：不导入Qt，字幕只发往 --caption-sink 指定的输出端
+      log.info("Creating transcriber...")
+      run_headless(create_transcriber(args, captions), captions)
+      return
+
+    # 只有显示字幕窗口时才导入Qt
+    from PyQt5.QtWidgets import QApplication
+    from PyQt5.QtCore import QTimer
+    from hud import HUD, CaptionStore
+
+    # 首先在主线程创建QApplication
+    app = QApplication([])
+
+    log.info("Creating caption display window...")
+
+    # 转录线程通过它把字幕推送给窗口
+    caption_store = CaptionStore()
+    captions.add(caption_store)
+
+    # 创建HUD窗口
+    hud_window = HUD(font_size=args.font_size, caption_store=caption_store, initial_text=initial_text, widget=args.caption_widget)
+    hud_window.show()
+
+    # 强制窗口显示在前台
+    hud_window.raise_()
+    hud_window.activateWindow()
+
+    log.info("Caption window displayed")
+
+    log.info("Creating transcriber...")
+
+    # 创建转录器
+    transcriber = create_transcriber(args, captions)
+
+    log.info("Starting transcription thread...")
+
+    # 启动转录线程
+    transcriber.start_transcribe_thread()
+
+    # 设置信号处理
+    def handle_signal(sig, frame):
+      log.info("Received interrupt signal, shutting down...")
+      transcriber.stop_transcribe_thread()
+      app.quit()
+    signal.signal(signal.SIGINT, handle_signal)
+
+    # 字幕改为信号推送后事件循环会长时间停在Qt内部，Python的信号处理函数得不到执行，
+    # 用一个空的低频定时器让解释器定期处理 Ctrl+C
+    signal_timer = QTimer()
+    signal_timer.timeout.connect(lambda: None)
+    signal_timer.start(500)
+
+    log.info("Starting UI event loop...")
+
+    # 运行事件循环
+    app.exec()
+
+    # 停止转录线程
+    transcriber.stop_transcribe_thread()
+    captions.close()
+
+  except KeyboardInterrupt:
+    log.info("Program interrupted by user. Exiting...")
+  except Exception as e:
+    log.exception(f"Critical error in main function: {e}")
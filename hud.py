@@ -0,0 +1,430 @@
+#! python3.7
+
+import threading
+import time
+
+from PyQt5.QtWidgets import QApplication, QMainWindow, QWidget, QHBoxLayout, QTextEdit
+from PyQt5.QtGui import (QFont, QColor, QTextCursor, QTextBlockFormat, QTextCharFormat, QPainter, QPen,
+                         QLinearGradient, QStaticText, QTextOption, QPixmap)
+from PyQt5.QtCore import Qt, QPoint, QRectF, pyqtSignal, QObject
+from runtime_log import get_logger
+
+log = get_logger("hud")
+
+
+class CaptionStore(QObject):
+  """
+  转录线程与字幕窗口之间共享的字幕文本。
+  publish 在文本变化时递增版本号并发出 caption_changed 信号，窗口通过排队连接在UI线程中刷新，
+  不再需要定时轮询。
+  """
+  caption_changed = pyqtSignal(int)
+
+  def __init__(self):
+    super().__init__()
+    self.lock = threading.Lock()
+    self.text = ""
+    self.version = 0
+
+  def publish(self, text):
+    with self.lock:
+      if text == self.text:
+        return False
+      self.text = text
+      self.version += 1
+      version = self.version
+    self.caption_changed.emit(version)
+    return True
+
+  def snapshot(self):
+    with self.lock:
+      return self.version, self.text
+
+  def close(self):
+    """作为字幕输出端关闭时无需释放资源，窗口由 Qt 管理"""
+
+
+class SentenceSegmenter:
+  """
+  把字幕条目（每行一条）按句号、问号、感叹号拆成显示行，保留分隔符。
+  已处理过的条目直接复用缓存结果；最后一条在部分结果模式下会不断增长，
+  只从上次最后一个确定的句子边界之后继续处理，开销与新增文本成正比。
+  """
+  terminators = '.!?。！？'
+
+  def __init__(self):
+    self.cache = {}
+    # 上一次处理的尾部条目：(条目中已确定部分的前缀, 已确定的句子)
+    self.tail_prefix = None
+    self.tail_sentences = []
+
+  def split(self, text, start=0):
+    """从 start 开始拆分 text，返回 (已确定的句子, 剩余部分, 最后一个确定边界的位置)"""
+    sentences = []
+    current_pos = start
+    for i in range(start, len(text) - 1):
+      # 分隔符后面紧跟空格才算句子结束；没有空格可能是缩写或小数点
+      if text[i] in self.terminators and text[i + 1] == ' ':
+        sentences.append(text[current_pos:i + 2])
+        current_pos = i + 2
+    return sentences, text[current_pos:], current_pos
+
+  def segment_entry(self, entry):
+    sentences = self.cache.get(entry)
+    if sentences is not None:
+      return sentences
+
+    if self.tail_prefix is not None and entry.startswith(self.tail_prefix):
+      confirmed = list(self.tail_sentences)
+      new_sentences, rest, boundary = self.split(entry, len(self.tail_prefix))
+    else:
+      confirmed = []
+      new_sentences, rest, boundary = self.split(entry)
+    confirmed.extend(new_sentences)
+    self.tail_prefix = entry[:boundary]
+    self.tail_sentences = confirmed
+
+    # 末尾的分隔符后面还可能追加文本，只在输出里拆开，不计入已确定的边界
+    sentences = list(confirmed)
+    if rest:
+      sentences.append(rest)
+    if not sentences:
+      sentences = [entry]
+    self.cache[entry] = sentences
+    return sentences
+
+  def segment(self, entries):
+    """拆分所有条目，返回扁平的显示行列表；缓存只保留仍在显示的条目"""
+    lines = []
+    for entry in entries:
+      lines.extend(self.segment_entry(entry))
+    self.cache = {entry: self.cache[entry] for entry in entries}
+    return lines
+
+
+class PaintStats:
+  """统计字幕控件 paintEvent 的耗时，每 report_every 次打印一次平均值，便于比较两种控件"""
+
+  def __init__(self, name, report_every=200):
+    self.name = name
+    self.report_every = report_every
+    self.count = 0
+    self.total = 0.0
+    self.worst = 0.0
+
+  def record(self, seconds):
+    self.count += 1
+    self.total += seconds
+    self.worst = max(self.worst, seconds)
+    if self.count % self.report_every == 0:
+      log.debug("Caption paint time (%s): avg %.3f ms, worst %.3f ms over %s paints",
+                self.name, self.total / self.count * 1000, self.worst * 1000, self.count)
+
+
+class HUDText(QTextEdit):
+  def __init__(self, font_size):
+    super().__init__()
+
+    self.setReadOnly(True)
+    self.setAlignment(Qt.AlignLeft|Qt.AlignVCenter)
+    self.setStyleSheet("""
+      background-color: qlineargradient(x1:0, y1:0, x2:0, y2:1,
+                                        stop:0 rgba(20,20,20,0.8), 
+                                        stop:1 rgba(40,40,40,0.8));
+      color: #FFFFFF;
+      border-radius: 15px;
+      border: 1px solid rgba(255,255,255,0.3);
+      padding: 10px;
+      selection-background-color: rgba(30,144,255,0.5);
+      selection-color: white;
+    """)
+    self.setLineWrapMode(QTextEdit.WidgetWidth)
+    
+    # 设置字体
+    font = QFont("Arial", font_size)
+    font.setWeight(QFont.Medium)
+    self.setFont(font)
+    
+    # 段落格式：行高和段间距
+    self.block_format = QTextBlockFormat()
+    self.block_format.setLineHeight(130, QTextBlockFormat.ProportionalHeight)
+    self.block_format.setBottomMargin(8)
+
+    # 字符格式：当前正在转录的行较亮，已完成的行稍暗
+    self.current_format = QTextCharFormat()
+    self.current_format.setForeground(QColor("#F8F8F8"))
+    self.current_format.setFontLetterSpacingType(QFont.AbsoluteSpacing)
+    self.current_format.setFontLetterSpacing(0.5)
+    self.previous_format = QTextCharFormat(self.current_format)
+    self.previous_format.setForeground(QColor(255, 255, 255, 217))
+
+    # 当前文档中每个块对应的行
+    self.lines = []
+    self.paint_stats = PaintStats("text")
+
+    self.setVerticalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
+    self.viewport().setCursor(Qt.CursorShape.ArrowCursor)
+    
+    # 设置文档边距
+    document = self.document()
+    document.setDocumentMargin(15)
+
+  def set_lines(self, lines):
+    """
+    与已显示的行比较后用 QTextCursor 局部修改文档：从顶部滚出的行删掉对应的块，
+    相同的前缀保持不动，只替换之后变化的尾部，重排开销不随历史长度增长。
+    """
+    document = self.document()
+    cursor = QTextCursor(document)
+    cursor.beginEditBlock()
+
+    # 历史从顶部滚出时，删除顶部多出的块
+    if lines and lines[0] in self.lines[1:]:
+      dropped = self.lines.index(lines[0])
+      cursor.movePosition(QTextCursor.Start)
+      cursor.movePosition(QTextCursor.NextBlock, QTextCursor.KeepAnchor, dropped)
+      cursor.removeSelectedText()
+      del self.lines[:dropped]
+
+    common = 0
+    while common < min(len(lines), len(self.lines)) and lines[common] == self.lines[common]:
+      common += 1
+
+    # 删除第一个不同的行及之后的块
+    if common < len(self.lines):
+      if common == 0:
+        cursor.select(QTextCursor.Document)
+      else:
+        cursor.setPosition(document.findBlockByNumber(common - 1).position())
+        cursor.movePosition(QTextCursor.EndOfBlock)
+        cursor.movePosition(QTextCursor.End, QTextCursor.KeepAnchor)
+      cursor.removeSelectedText()
+
+    # 保留的最后一行可能由当前行变为已完成的行（或相反），只需重设这一块的格式
+    if common > 0:
+      cursor.setPosition(document.findBlockByNumber(common - 1).position())
+      cursor.movePosition(QTextCursor.EndOfBlock, QTextCursor.KeepAnchor)
+      cursor.setCharFormat(self.current_format if common == len(lines) else self.previous_format)
+
+    # 追加新的尾部行
+    cursor.movePosition(QTextCursor.End)
+    for i in range(common, len(lines)):
+      char_format = self.current_format if i == len(lines) - 1 else self.previous_format
+      if i == 0:
+        cursor.setBlockFormat(self.block_format)
+        cursor.setBlockCharFormat(char_format)
+      else:
+        cursor.insertBlock(self.block_format, char_format)
+      cursor.insertText(lines[i], char_format)
+
+    cursor.endEditBlock()
+    self.lines = list(lines)
+
+  def scroll_to_end(self):
+    vertical_scrollbar = self.verticalScrollBar()
+    vertical_scrollbar.setValue(vertical_scrollbar.maximum())
+
+  def paintEvent(self, event):
+    start_time = time.perf_counter()
+    super().paintEvent(event)
+    self.paint_stats.record(time.perf_counter() - start_time)
+
+  def mousePressEvent(self, event):
+    event.ignore()
+
+  def mouseMoveEvent(self, event):
+    event.ignore()
+
+  def mouseReleaseEvent(self, event):
+    event.ignore()
+
+
+class PaintedCaptionText(QWidget):
+  """
+  直接绘制字幕的轻量控件，用来替代 HUDText（--caption-widget painted）。
+  每行缓存一个按当前宽度换行好的 QStaticText，只有新出现或变化的行需要重新排版；
+  从底部向上绘制，放不下的旧行直接裁掉，不需要滚动条。
+  """
+  padding = 25
+  line_spacing = 8
+  radius = 15
+
+  def __init__(self, font_size):
+    super().__init__()
+
+    self.font = QFont("Arial", font_size)
+    self.font.setWeight(QFont.Medium)
+    self.font.setLetterSpacing(QFont.AbsoluteSpacing, 0.5)
+    self.setFont(self.font)
+
+    self.current_color = QColor("#F8F8F8")
+    self.previous_color = QColor(255, 255, 255, 217)
+    self.border_pen = QPen(QColor(255, 255, 255, 77), 1)
+
+    self.text_option = QTextOption()
+    self.text_option.setWrapMode(QTextOption.WrapAtWordBoundaryOrAnywhere)
+
+    self.lines = []
+    self.layouts = {}
+    self.background = None
+    self.paint_stats = PaintStats("painted")
+
+  def set_lines(self, lines):
+    # 只为新出现的行创建排版缓存，不再显示的行释放掉
+    self.layouts = {line: self.layouts.get(line) for line in lines}
+    self.lines = list(lines)
+    self.update()
+
+  def scroll_to_end(self):
+    # 总是贴着底部绘制
+    pass
+
+  def layout_for(self, line, width):
+    layout = self.layouts.get(line)
+    if layout is None:
+      layout = QStaticText(line)
+      layout.setTextFormat(Qt.PlainText)
+      layout.setTextOption(self.text_option)
+      layout.setTextWidth(width)
+      layout.setPerformanceHint(QStaticText.AggressiveCaching)
+      layout.prepare(font=self.font)
+      self.layouts[line] = layout
+    return layout
+
+  def render_background(self):
+    """与 HUDText 样式表相同的半透明渐变背景和圆角边框，按窗口大小预先绘制一次"""
+    ratio = self.devicePixelRatioF()
+    background = QPixmap(int(self.width() * ratio), int(self.height() * ratio))
+    background.setDevicePixelRatio(ratio)
+    background.fill(Qt.transparent)
+
+    painter = QPainter(background)
+    painter.setRenderHint(QPainter.Antialiasing)
+    rect = QRectF(self.rect()).adjusted(0.5, 0.5, -0.5, -0.5)
+    gradient = QLinearGradient(rect.topLeft(), rect.bottomLeft())
+    gradient.setColorAt(0, QColor(20, 20, 20, 204))
+    gradient.setColorAt(1, QColor(40, 40, 40, 204))
+    painter.setPen(self.border_pen)
+    painter.setBrush(gradient)
+    painter.drawRoundedRect(rect, self.radius, self.radius)
+    painter.end()
+    return background
+
+  def resizeEvent(self, event):
+    # 大小变化后背景重画，所有行都要重新换行
+    self.background = None
+    self.layouts = dict.fromkeys(self.lines)
+    super().resizeEvent(event)
+
+  def paintEvent(self, event):
+    start_time = time.perf_counter()
+    if self.background is None:
+      self.background = self.render_background()
+    painter = QPainter(self)
+    painter.setRenderHint(QPainter.TextAntialiasing)
+    painter.drawPixmap(0, 0, self.background)
+
+    width = max(1, self.width() - 2 * self.padding)
+    painter.setFont(self.font)
+    y = self.height() - self.padding
+    for i in range(len(self.lines) - 1, -1, -1):
+      layout = self.layout_for(self.lines[i], width)
+      y -= layout.size().height()
+      if y < 0:
+        break
+      painter.setPen(self.current_color if i == len(self.lines) - 1 else self.previous_color)
+      painter.drawStaticText(QPoint(self.padding, int(y)), layout)
+      y -= self.line_spacing
+
+    painter.end()
+    self.paint_stats.record(time.perf_counter() - start_time)
+
+
+class HUD(QMainWindow):
+  max_width_percentage = 0.7  # 增大窗口宽度，避免文本换行过多
+  max_height_percentage = 0.35  # 再增加高度以容纳更多文本
+  max_lines = 6
+  padding = 15
+  corner_spacing = 20
+
+  def __init__(self, font_size, caption_store, initial_text="Caption window started\nStart speaking...", widget="text"):
+    super().__init__()
+
+    # 设置窗口属性
+    self.setWindowFlags(Qt.CustomizeWindowHint|Qt.FramelessWindowHint|Qt.WindowStaysOnTopHint|Qt.WindowDoesNotAcceptFocus)
+    self.setAttribute(Qt.WA_TranslucentBackground)
+
+    # 设置窗口透明度
+    self.setWindowOpacity(1.0)
+
+    # 设置中央窗口
+    central_widget = QWidget()
+    layout = QHBoxLayout(central_widget)
+    layout.setContentsMargins(10, 10, 10, 10)
+
+    self.text_widget = PaintedCaptionText(font_size) if widget == "painted" else HUDText(font_size)
+    self.text_widget.setParent(central_widget)
+    layout.addWidget(self.text_widget)
+
+    self.setCentralWidget(central_widget)
+
+    # 限制窗口大小
+    screen_geometry = QApplication.desktop().screenGeometry()
+    max_width = int(self.max_width_percentage * screen_geometry.width())
+    max_height = int(self.max_height_percentage * screen_geometry.height())
+    self.setFixedWidth(max_width)
+    self.setFixedHeight(max_height)
+    
+    # 将窗口放在屏幕底部中央
+    self.move(int((screen_geometry.width() - max_width) / 2), 
+              screen_geometry.height() - max_height - self.corner_spacing)
+
+    # 拖动窗口的变量
+    self.old_pos = None
+
+    # 上一次显示的字幕版本
+    self.displayed_version = -1
+
+    # 字幕条目按句子拆分，结果在两次更新之间缓存
+    self.segmenter = SentenceSegmenter()
+
+    # 有新字幕时由转录线程通过排队的信号通知，UI线程在两次更新之间保持空闲
+    self.caption_store = caption_store
+    self.caption_store.caption_changed.connect(self.updateTextWidget, Qt.QueuedConnection)
+    self.caption_store.publish(initial_text)
+
+    log.info("HUD window created, initial text set")
+
+  def mousePressEvent(self, event):
+    if event.button() == Qt.LeftButton:
+      self.old_pos = event.globalPos()
+
+  def mouseMoveEvent(self, event):
+    if self.old_pos:
+      delta = QPoint(event.globalPos() - self.old_pos)
+      self.move(self.x() + delta.x(), self.y() + delta.y())
+      self.old_pos = event.globalPos()
+
+  def mouseReleaseEvent(self, event):
+    if event.button() == Qt.LeftButton:
+      self.old_pos = None
+
+  def updateTextWidget(self, version=None):
+    # 多个排队的信号只处理最新版本，已经显示过的版本直接跳过
+    version, current_text = self.caption_store.snapshot()
+    if version == self.displayed_version:
+      return
+    self.displayed_version = version
+
+    if current_text and current_text.strip():
+      try:
+        # 每个字幕条目按句子换行显示，空行不占用块
+        lines = [line for line in self.segmenter.segment(current_text.split('\n')) if line.strip()]
+
+        # 只修改变化的尾部
+        self.text_widget.set_lines(lines)
+
+        # 自动滚动到底部
+        self.text_widget.scroll_to_end()
+      except Exception as e:
+        log.exception(f"Error updating caption window: {e}")
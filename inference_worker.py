@@ -0,0 +1,311 @@
+#! python3.7
+
+import os
+import time
+import multiprocessing
+from multiprocessing import shared_memory
+
+import numpy as np
+from whisper.audio import SAMPLE_RATE
+
+from whisper_backend import CancellationToken, DecodeCancelled
+from runtime_log import get_logger, setup_logging
+
+log = get_logger("inference_worker")
+
+
+def _read_ring(ring, start, end):
+  """读取环形缓冲中绝对位置 [start, end) 的采样"""
+  capacity = len(ring)
+  index = np.arange(start, end) % capacity
+  return ring[index]
+
+
+def _worker_main(conn, shm_name, capacity, args, compute_device, cancel_event):
+  # 只在工作进程中导入模型相关模块，主进程不加载模型
+  from model_optimizer import load_model
+  from streaming_features import StreamingLogMel
+  from whisper_backend import OpenAIWhisperBackend
+  from onnx_backend import ONNXWhisperBackend, load_onnx_model
+
+  setup_logging(args.log_level, args.log_file)
+  shm = shared_memory.SharedMemory(name=shm_name)
+  ring = np.ndarray((capacity,), dtype=np.float32, buffer=shm.buf)
+
+  try:
+    if args.onnx:
+      model = load_onnx_model(args.model, args)
+      backend = ONNXWhisperBackend(model, args, compute_device)
+    else:
+      model = load_model(args.model, compute_device, args)
+      backend = OpenAIWhisperBackend(model, args, compute_device)
+    mel_stream = StreamingLogMel(n_mels=model.dims.n_mels, max_seconds=args.moving_window)
+  except Exception as e:
+    conn.send(('failed', repr(e)))
+    shm.close()
+    return
+
+  fed = 0  # 已送入特征计算的绝对采样位置
+
+  def run(request_id, decode):
+    # 主进程设置 cancel_event 时在下一个解码步放弃本次解码
+    try:
+      conn.send(('result', request_id, decode(CancellationToken(cancel_event.is_set))))
+    except DecodeCancelled as e:
+      conn.send(('cancelled', request_id, str(e)))
+    except Exception as e:
+      conn.send(('error', request_id, repr(e)))
+
+  def feed(written):
+    nonlocal fed
+    if written - fed > capacity:
+      log.warning(f"Inference worker lagged behind by {(written - fed)/SAMPLE_RATE:.2f} seconds, dropping oldest audio")
+      fed = written - capacity
+    if written > fed:
+      mel_stream.accept(_read_ring(ring, fed, written))
+      fed = written
+
+  def apply_settings(settings):
+    # 回复实际生效的模型和beam大小：不兼容的模型不会切换，ONNX后端只做贪心解码
+    backend.apply_settings(settings)
+    return backend.model_name, backend.beam_size
+
+  conn.send(('ready', os.getpid(), backend.model_name, backend.beam_size))
+  try:
+    while True:
+      try:
+        msg = conn.recv()
+      except EOFError:
+        break
+
+      cmd = msg[0]
+      if cmd == 'stop':
+        break
+      elif cmd == 'reset':
+        fed = msg[1]
+        mel_stream.reset()
+        backend.reset_context()
+      elif cmd == 'reset_context':
+        backend.reset_context()
+      elif cmd == 'settings':
+        _, request_id, settings = msg
+        run(request_id, lambda token: apply_settings(settings))
+      elif cmd == 'discard':
+        _, written, n_samples = msg
+        feed(written)
+        mel_stream.discard(n_samples)
+      elif cmd == 'decode':
+        _, request_id, written, n_samples, language, use_context = msg
+        feed(written)
+        run(request_id, lambda token: backend.decode(mel_stream.log_mel(), n_samples, language,
+                                                     use_context=use_context, cancel_token=token))
+      elif cmd == 'detect':
+        _, request_id, written = msg
+        feed(written)
+        run(request_id, lambda token: backend.detect(mel_stream.log_mel()))
+      elif cmd == 'detect_audio':
+        _, request_id, audio = msg
+        run(request_id, lambda token: backend.detect_audio(audio))
+      elif cmd == 'decode_audio':
+        _, request_id, audio, language = msg
+        run(request_id, lambda token: backend.decode_audio(audio, language, cancel_token=token))
+      elif cmd == 'decode_batch':
+        _, request_id, audios, language = msg
+        run(request_id, lambda token: backend.decode_batch(audios, language, cancel_token=token))
+  finally:
+    shm.close()
+
+
+class InferenceWorker:
+  """
+  在独立进程中运行 Whisper 推理，避免解码与音频回调、UI线程争抢GIL。
+  音频通过共享内存环形缓冲传递，命令和结果通过管道传递，工作进程崩溃时自动重启。
+  对外提供与 StreamingLogMel 和 OpenAIWhisperBackend 相同的接口。
+  """
+
+  def __init__(self, args, compute_device, start_timeout=600):
+    self.args = args
+    self.compute_device = compute_device
+    self.start_timeout = start_timeout
+    self.capacity = SAMPLE_RATE * max(60, 2 * args.moving_window)
+
+    self.shm = shared_memory.SharedMemory(create=True, size=self.capacity * np.dtype(np.float32).itemsize)
+    self.ring = np.ndarray((self.capacity,), dtype=np.float32, buffer=self.shm.buf)
+    self.ring[:] = 0
+
+    self.written = 0  # 已写入共享内存的绝对采样位置
+    self.window_start = 0  # 当前转录窗口在绝对位置中的起点，重启后从这里重建特征
+    self.request_id = 0
+    self.restarts = 0
+    self.settings = None  # 重启后需要重新应用的配置
+    # 工作进程中后端实际使用的模型和beam大小，作为结果缓存键的一部分
+    self.model_name = args.model
+    self.beam_size = args.beam_size
+    self.process = None
+    self.conn = None
+    # 跨进程的取消标记，工作进程在每个解码步检查
+    self.cancel_event = multiprocessing.get_context("spawn").Event()
+
+    self._start()
+
+  def _start(self):
+    ctx = multiprocessing.get_context("spawn")
+    parent_conn, child_conn = ctx.Pipe()
+    self.process = ctx.Process(
+      target=_worker_main,
+      args=(child_conn, self.shm.name, self.capacity, self.args, self.compute_device, self.cancel_event),
+      daemon=True,
+    )
+    start_time = time.time()
+    self.process.start()
+    child_conn.close()
+    self.conn = parent_conn
+
+    if not self.conn.poll(self.start_timeout):
+      raise RuntimeError("Inference worker did not become ready in time")
+    msg = self.conn.recv()
+    if msg[0] != 'ready':
+      raise RuntimeError(f"Inference worker failed to load model: {msg[1]}")
+    log.info(f"Inference worker started (pid {msg[1]}) in {time.time() - start_time:.2f} seconds")
+
+    # 新进程从当前窗口起点开始重建特征
+    self.conn.send(('reset', self.window_start))
+    if self.settings is None:
+      self.model_name, self.beam_size = msg[2], msg[3]
+    else:
+      # 重新应用相同的配置，生效的模型和beam大小与重启前一致，回复的请求号 0 不会被任何请求等待
+      self.conn.send(('settings', 0, self.settings))
+
+  def _restart(self):
+    self.restarts += 1
+    log.warning(f"Restarting inference worker (restart #{self.restarts})...")
+    try:
+      if self.process is not None and self.process.is_alive():
+        self.process.terminate()
+        self.process.join(timeout=2.0)
+    except Exception as e:
+      log.error(f"Error terminating inference worker: {e}")
+    self._start()
+
+  def _send(self, msg):
+    try:
+      self.conn.send(msg)
+    except (BrokenPipeError, EOFError, OSError) as e:
+      log.error(f"Inference worker pipe error: {e}")
+      self._restart()
+
+  def accept(self, samples):
+    """把新采样写入共享内存，工作进程在下次命令时计算特征"""
+    samples = np.asarray(samples, dtype=np.float32).reshape(-1)
+    n_samples = len(samples)
+    if n_samples > self.capacity:
+      samples = samples[-self.capacity:]
+      self.written += n_samples - self.capacity
+      n_samples = self.capacity
+
+    start = self.written % self.capacity
+    first = min(n_samples, self.capacity - start)
+    self.ring[start:start + first] = samples[:first]
+    self.ring[:n_samples - first] = samples[first:]
+    self.written += n_samples
+    return n_samples
+
+  def discard(self, n_samples):
+    self.window_start += int(n_samples)
+    self._send(('discard', self.written, int(n_samples)))
+
+  def reset(self):
+    self.window_start = self.written
+    self._send(('reset', self.written))
+
+  def reset_context(self):
+    self._send(('reset_context',))
+
+  def apply_settings(self, settings):
+    """在工作进程中应用配置（可能需要加载模型），等待工作进程回复实际生效的模型和beam大小"""
+    self.settings = dict(settings)
+    self.model_name, self.beam_size = self._request(lambda request_id: ('settings', request_id, self.settings))
+
+  def log_mel(self):
+    # 特征在工作进程中计算，这里不返回任何数据
+    return None
+
+  def decode(self, mel, n_samples, language, use_context=True, cancel_token=None, choose_language=None):
+    """
+    在工作进程中解码当前窗口，进程崩溃时重启并重试一次。
+    需要由 choose_language 决定语言时先单独识别一次，再用选定的语言解码（识别窗口多一次编码）。
+    """
+    if language is None and choose_language is not None:
+      language = choose_language(self._request(lambda request_id: ('detect', request_id, self.written), cancel_token))
+    return self._request(lambda request_id: ('decode', request_id, self.written, n_samples, language, use_context),
+                         cancel_token)
+
+  def detect(self, mel):
+    return self._request(lambda request_id: ('detect', request_id, self.written))
+
+  def detect_audio(self, audio):
+    audio = np.asarray(audio, dtype=np.float32)
+    return self._request(lambda request_id: ('detect_audio', request_id, audio))
+
+  def decode_audio(self, audio, language, cancel_token=None):
+    """在工作进程中独立解码一段音频（直接通过管道传递）"""
+    audio = np.asarray(audio, dtype=np.float32)
+    return self._request(lambda request_id: ('decode_audio', request_id, audio, language), cancel_token)
+
+  def decode_batch(self, audios, language, cancel_token=None):
+    """在工作进程中批量解码多段音频"""
+    audios = [np.asarray(audio, dtype=np.float32) for audio in audios]
+    return self._request(lambda request_id: ('decode_batch', request_id, audios, language), cancel_token)
+
+  def _request(self, make_message, cancel_token=None):
+    for attempt in range(2):
+      if cancel_token is not None:
+        cancel_token.check()
+      self.request_id += 1
+      request_id = self.request_id
+      self.cancel_event.clear()
+      try:
+        self.conn.send(make_message(request_id))
+        while True:
+          if self.conn.poll(0.05):
+            msg = self.conn.recv()
+            if msg[1] == request_id:
+              break
+          elif not self.process.is_alive():
+            raise EOFError(f"worker exited with code {self.process.exitcode}")
+          elif cancel_token is not None and cancel_token.cancelled:
+            # 通知工作进程放弃本次解码，然后等待它确认
+            self.cancel_event.set()
+      except (BrokenPipeError, EOFError, OSError) as e:
+        log.error(f"Inference worker crashed during decode: {e}")
+        self._restart()
+        continue
+
+      if msg[0] == 'cancelled':
+        raise DecodeCancelled(cancel_token.reason if cancel_token is not None else msg[2])
+      if msg[0] == 'error':
+        raise RuntimeError(f"Inference worker error: {msg[2]}")
+      return msg[2]
+
+    raise RuntimeError("Inference worker failed to decode after restart")
+
+  def close(self):
+    try:
+      if self.process is not None and self.process.is_alive():
+        try:
+          self.cancel_event.set()
+          self.conn.send(('stop',))
+        except (BrokenPipeError, OSError):
+          pass
+        self.process.join(timeout=2.0)
+        if self.process.is_alive():
+          self.process.terminate()
+      log.info("Inference worker stopped")
+    except Exception as e:
+      log.error(f"Error stopping inference worker: {e}")
+    finally:
+      try:
+        self.shm.close()
+        self.shm.unlink()
+      except FileNotFoundError:
+        pass
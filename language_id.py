@@ -0,0 +1,97 @@
+#! python3.7
+
+import time
+from runtime_log import get_logger
+
+log = get_logger("language_id")
+
+
+class LanguageIdManager:
+  """
+  --language auto 时的语言识别缓存。
+  在第一段置信度足够的语音上识别并锁定语言，之后只在定期复查或长时间静音后重新识别；
+  切换语言需要连续多次高置信度且明显领先当前语言，避免短片段造成语言来回跳变。
+  """
+
+  def __init__(self, min_confidence=0.6, switch_confidence=0.8, switch_margin=0.3, switch_votes=2,
+               recheck_interval=30.0, silence_reset=10.0):
+    self.min_confidence = min_confidence
+    self.switch_confidence = switch_confidence
+    self.switch_margin = switch_margin
+    self.switch_votes = switch_votes
+    self.recheck_interval = recheck_interval
+    self.silence_reset = silence_reset
+
+    self.language = None  # 已锁定的语言
+    self.locked_time = 0
+    self.last_speech_time = 0
+    self.candidate = None
+    self.candidate_votes = 0
+    self.detections = 0
+
+  def language_for_decode(self, now=None):
+    """返回本次解码使用的语言；返回 None 表示需要重新识别"""
+    now = time.time() if now is None else now
+    if self.language is None or self.candidate is not None:
+      return None
+    if now - self.locked_time >= self.recheck_interval:
+      return None
+    if self.last_speech_time and now - self.last_speech_time >= self.silence_reset:
+      return None
+    return self.language
+
+  def mark_speech(self, now=None):
+    self.last_speech_time = time.time() if now is None else now
+
+  def resolve(self, language_probs, now=None):
+    """
+    解码前调用：记录一次识别结果，返回本次解码应使用的语言。
+    已锁定时返回锁定（或刚切换）的语言，单次识别结果不会直接改变输出语言；尚未锁定时使用识别出的语言。
+    """
+    language = self.observe(language_probs, now)
+    if language is None and language_probs:
+      language = max(language_probs, key=language_probs.get)
+    return language
+
+  def observe(self, language_probs, now=None):
+    """根据一次识别结果更新锁定的语言，返回当前语言"""
+    now = time.time() if now is None else now
+    if not language_probs:
+      return self.language
+
+    self.detections += 1
+    detected = max(language_probs, key=language_probs.get)
+    confidence = language_probs[detected]
+
+    if self.language is None:
+      if confidence >= self.min_confidence:
+        self.language = detected
+        self.locked_time = now
+        log.info(f"Language locked: {detected} (confidence {confidence:.2f})")
+      return self.language
+
+    # 复查时当前语言仍然成立，刷新锁定时间
+    self.locked_time = now
+    if detected == self.language:
+      self.candidate = None
+      self.candidate_votes = 0
+      return self.language
+
+    current_confidence = language_probs.get(self.language, 0.0)
+    if confidence >= self.switch_confidence and confidence - current_confidence >= self.switch_margin:
+      if detected == self.candidate:
+        self.candidate_votes += 1
+      else:
+        self.candidate = detected
+        self.candidate_votes = 1
+
+      if self.candidate_votes >= self.switch_votes:
+        log.info(f"Language switched: {self.language} -> {detected} (confidence {confidence:.2f})")
+        self.language = detected
+        self.candidate = None
+        self.candidate_votes = 0
+    else:
+      self.candidate = None
+      self.candidate_votes = 0
+
+    return self.language
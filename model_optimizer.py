@@ -0,0 +1,150 @@
+#! python3.7
+
+import argparse
+import os
+import time
+
+import torch
+import whisper
+from whisper.audio import N_FRAMES
+from runtime_log import get_logger, setup_logging
+
+log = get_logger("model_optimizer")
+
+CACHE_DIR = os.path.join(os.getenv("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache")),
+                         "realtime-transcribe", "compiled")
+
+
+class OptimizedEncoder(torch.nn.Module):
+  """
+  按批大小分桶调用 TorchScript 编码器图；批大小不足时补零到最近的较大的桶，结果再截取回来。
+  超过最大桶的批或非30秒窗口回退到原始编码器。
+  """
+
+  def __init__(self, eager, graphs):
+    super().__init__()
+    self.eager = eager
+    self.buckets = sorted(graphs)
+    self.graphs = torch.nn.ModuleDict({str(bucket): graph for bucket, graph in graphs.items()})
+
+  def forward(self, mel):
+    n = mel.shape[0]
+    bucket = next((bucket for bucket in self.buckets if bucket >= n), None)
+    if mel.shape[-1] != N_FRAMES or bucket is None:
+      return self.eager(mel)
+    if bucket > n:
+      mel = torch.cat([mel, mel.new_zeros((bucket - n,) + tuple(mel.shape[1:]))])
+    return self.graphs[str(bucket)](mel)[:n]
+
+
+def encoder_buckets(max_batch_size):
+  """编译的批大小：不超过 max_batch_size 的 2 的幂，再加上 max_batch_size 本身"""
+  max_batch_size = max(1, max_batch_size)
+  buckets = []
+  bucket = 1
+  while bucket < max_batch_size:
+    buckets.append(bucket)
+    bucket *= 2
+  buckets.append(max_batch_size)
+  return tuple(buckets)
+
+
+def artifact_path(model_name, model, bucket, device, dtype):
+  """编译产物按模型名、输入桶、设备/精度和 torch 版本区分，任何一项变化都会重新编译"""
+  name = os.path.basename(model_name).replace(".pt", "")
+  dims = model.dims
+  precision = "fp16" if dtype == torch.float16 else "fp32"
+  filename = (f"{name}-mel{dims.n_mels}-state{dims.n_audio_state}-encoder-b{bucket}"
+              f"-{device}-{precision}-torch{torch.__version__.replace('+', '_')}.pt")
+  return os.path.join(CACHE_DIR, filename)
+
+
+def compile_encoder(model, bucket, device, dtype):
+  """把编码器按固定输入形状 (bucket, n_mels, N_FRAMES) 追踪为 TorchScript 图并冻结"""
+  encoder = model.encoder.eval()
+  example = torch.zeros((bucket, model.dims.n_mels, N_FRAMES), dtype=dtype, device=device)
+  with torch.no_grad():
+    traced = torch.jit.trace(encoder, example, check_trace=False)
+    traced = torch.jit.optimize_for_inference(torch.jit.freeze(traced.eval()))
+  return traced
+
+
+def load_or_compile(model_name, model, bucket, device, dtype):
+  path = artifact_path(model_name, model, bucket, device, dtype)
+  if os.path.exists(path):
+    try:
+      return torch.jit.load(path, map_location=device)
+    except Exception as e:
+      log.warning(f"Cached compiled encoder {path} could not be loaded ({e}), recompiling")
+
+  log.info(f"Compiling encoder for batch size {bucket} (first run only)...")
+  start_time = time.time()
+  graph = compile_encoder(model, bucket, device, dtype)
+  os.makedirs(CACHE_DIR, exist_ok=True)
+  torch.jit.save(graph, path)
+  log.info(f"Encoder compiled in {time.time() - start_time:.2f} seconds, cached at {path}")
+  return graph
+
+
+def optimize_model(model, model_name, device, fp16=False, buckets=(1,)):
+  """用缓存的 TorchScript 编码器替换 model.encoder；失败时保持原始模型不变"""
+  if isinstance(model.encoder, OptimizedEncoder):
+    return model
+  dtype = torch.float16 if fp16 else torch.float32
+  try:
+    graphs = {bucket: load_or_compile(model_name, model, bucket, device, dtype) for bucket in buckets}
+  except Exception as e:
+    log.warning(f"Could not build optimized encoder, using eager model: {e}")
+    return model
+  model.encoder = OptimizedEncoder(model.encoder, graphs)
+  log.info(f"Using optimized encoder for batch sizes {list(buckets)}")
+  return model
+
+
+def load_model(model_name, device, args):
+  """加载 whisper 模型；启用 --optimize-model 时按 --max-batch-size 换上缓存的编译编码器"""
+  model = whisper.load_model(model_name, device=device)
+  if getattr(args, 'optimize_model', False):
+    buckets = encoder_buckets(getattr(args, 'max_batch_size', 1))
+    optimize_model(model, model_name, device, fp16=not args.no_fp16 and device != "cpu", buckets=buckets)
+  return model
+
+
+def benchmark(model, buckets, device, dtype, runs=5):
+  """比较原始编码器与优化编码器在每个输入桶上的平均延迟"""
+  eager = model.encoder.eager if isinstance(model.encoder, OptimizedEncoder) else model.encoder
+  optimized = model.encoder
+
+  def measure(encoder, mel):
+    with torch.no_grad():
+      encoder(mel)  # 预热
+      start = time.time()
+      for _ in range(runs):
+        encoder(mel)
+    return (time.time() - start) / runs
+
+  print(f"{'batch':>6} {'eager (s)':>10} {'optimized (s)':>14} {'speedup':>8}")
+  for bucket in buckets:
+    mel = torch.randn((bucket, model.dims.n_mels, N_FRAMES), dtype=dtype, device=device)
+    eager_time = measure(eager, mel)
+    optimized_time = measure(optimized, mel)
+    print(f"{bucket:>6} {eager_time:>10.3f} {optimized_time:>14.3f} {eager_time / optimized_time:>7.2f}x")
+
+
+def main():
+  parser = argparse.ArgumentParser(description="Build cached optimized encoders and compare them with eager PyTorch")
+  parser.add_argument("--model", default="tiny.en", help="Whisper model name or checkpoint path")
+  parser.add_argument("--buckets", default="1,2,4", help="Comma separated batch sizes to compile (default: 1,2,4)")
+  parser.add_argument("--runs", default=5, help="Timed runs per bucket", type=int)
+  args = parser.parse_args()
+  setup_logging()
+
+  device = "cpu"
+  buckets = [int(bucket) for bucket in args.buckets.split(',')]
+  model = whisper.load_model(args.model, device=device)
+  optimize_model(model, args.model, device, buckets=buckets)
+  benchmark(model, buckets, device, torch.float32, runs=args.runs)
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,288 @@
+#! python3.7
+
+import argparse
+import time
+import numpy as np
+
+from collections import deque
+from queue import Queue, Empty
+from time import sleep
+
+from engine import Engine, MODEL_CHOICES, add_caption_arguments, add_decode_arguments, run
+from transcribe import PyAudioProvider
+from system_audio_transcribe import SystemAudioProvider
+from whisper_backend import OpenAIWhisperBackend, DecodeCancelled
+from inference_worker import InferenceWorker
+from language_id import LanguageIdManager
+from model_optimizer import load_model
+from onnx_backend import ONNXWhisperBackend, load_onnx_model
+from runtime_log import get_logger
+
+log = get_logger("multi_transcribe")
+
+
+def parse_args():
+  parser = argparse.ArgumentParser(
+    description="🎤🔊 Real-time Transcription of Microphone and System Audio with One Shared Model",
+    formatter_class=argparse.RawDescriptionHelpFormatter,
+    epilog="""
+🚀 Quick Start Examples:
+  python multi_transcribe.py                              # Caption both sides of a call (mic + BlackHole)
+  python multi_transcribe.py --sources system             # Only system audio
+  python multi_transcribe.py --mic-input 1 --system-input BlackHole
+    """
+  )
+
+  parser.add_argument("--model", default="tiny.en", help="Whisper model shared by all sources (default: tiny.en)",
+            choices=MODEL_CHOICES)
+  parser.add_argument("--language", default="en",
+            help="Language for transcription (default: en). Use 'auto' to detect the language of each source separately", type=str)
+  add_caption_arguments(parser)
+  parser.add_argument("--sources", default="mic,system",
+            help="Comma separated audio sources to capture: mic, system (default: mic,system)", type=str)
+
+  # 高级参数（大多数用户不需要修改）
+  parser.add_argument("--mic-input", default=None,
+            help="Microphone device index or name (auto-detects the built-in microphone by default)", type=str)
+  parser.add_argument("--system-input", default=None,
+            help="System audio device index or name (auto-detects BlackHole by default)", type=str)
+  parser.add_argument("--min-duration", default=0.5,
+            help="Min duration of audio to process (default: 0.5s)", type=float)
+  parser.add_argument("--max-duration", default=3.0,
+            help="Max duration of one caption window (default: 3.0s)", type=float)
+  parser.add_argument("--silence-threshold", default=0.005,
+            help="Peak amplitude below which a window is treated as silence", type=float)
+  add_decode_arguments(parser)
+
+  # args for input provider 'pyaudio'
+  parser.add_argument("--moving-window", default=10,
+            help="Moving window duration in seconds", type=int)
+  parser.add_argument("--chunk-size", default=512,
+            help="Audio chunk size (default: 512 for low latency)", type=int)
+  args = parser.parse_args()
+  return args
+
+
+def select_device(provider, query, keywords):
+  """按索引或名称选择设备，未指定时按关键字自动匹配，找不到时使用第一个设备"""
+  devices = provider.list_input_devices()
+  if query is not None:
+    if query.isdigit() and 0 <= int(query) < len(devices):
+      return int(query)
+    for idx, name in enumerate(devices):
+      if query.lower() in name.lower():
+        return idx
+    log.warning(f"Could not find device matching '{query}', falling back to auto-detection")
+
+  for keyword in keywords:
+    for idx, name in enumerate(devices):
+      if keyword.lower() in name.lower():
+        return idx
+  return 0
+
+
+class SourceStream:
+  """一个音频来源的采集队列、累积窗口和语言状态"""
+
+  def __init__(self, name, label, provider_class, dtype, args, sample_rate):
+    self.name = name
+    self.label = label
+    self.dtype = dtype
+    self.sample_rate = sample_rate
+    self.data_queue = Queue()
+    self.provider = provider_class(args=args, data_queue=self.data_queue, sample_rate=sample_rate)
+
+    self.audio = np.zeros((0,), dtype=np.float32)
+    self.last_audio_time = time.time()
+
+    # 每个来源单独识别语言，通话双方可以说不同的语言
+    self.language = None if args.language == "auto" else args.language
+    self.language_id = LanguageIdManager() if args.language == "auto" else None
+
+  def current_language(self):
+    if self.language_id is None:
+      return self.language
+    return self.language_id.language_for_decode()
+
+  def decode_language(self, backend):
+    """本轮解码使用的语言；需要识别时先单独识别，由 LanguageIdManager 决定保持还是切换"""
+    language = self.current_language()
+    if language is None and self.language_id is not None:
+      language = self.language_id.resolve(backend.detect_audio(self.audio))
+    return language
+
+  def update_language(self, language_probs, has_speech):
+    if self.language_id is None:
+      return
+    if language_probs:
+      self.language_id.observe(language_probs)
+    if has_speech:
+      self.language_id.mark_speech()
+
+  def drain(self):
+    """取出队列中的全部音频并追加到窗口，返回新增的采样数"""
+    chunks = []
+    capture_time = None
+    while True:
+      try:
+        capture_time, chunk = self.data_queue.get_nowait()
+      except Empty:
+        break
+      chunks.append(chunk)
+    if not chunks:
+      return 0
+
+    audio_np = np.frombuffer(b''.join(chunks), dtype=self.dtype)
+    if self.dtype == np.int16:
+      audio_np = audio_np.astype(np.float32) / 32768.0
+    self.audio = np.concatenate([self.audio, audio_np.astype(np.float32)])
+    self.last_audio_time = capture_time  # 最后一块音频入队时记录的采集时间
+    return len(audio_np)
+
+  def clear(self):
+    self.audio = np.zeros((0,), dtype=np.float32)
+
+
+class MultiSourceTranscriber(Engine):
+  """
+  在一个进程中同时采集多个音频来源（麦克风、系统音频），共用一个模型。
+  每轮把各来源已经就绪的窗口按语言分组后一起批量解码，字幕按来源打上标签显示在同一个HUD中。
+  实时率调节器按整批的耗时降级；窗口长度由 --max-duration 限定，不经过截止时间调度。
+  """
+  max_caption_lines = 6
+  program = "multi"
+
+  def __init__(self, args, captions):
+    super().__init__(args, captions)
+
+    self.streams = []
+    for name in [source.strip() for source in args.sources.split(',') if source.strip()]:
+      if name == "mic":
+        stream = SourceStream(name, "🎤", PyAudioProvider, np.int16, args, self.sample_rate)
+        device_index = select_device(stream.provider, args.mic_input, ["MacBook Pro", "麦克风", "mic"])
+      elif name == "system":
+        stream = SourceStream(name, "🔊", SystemAudioProvider, np.float32, args, self.sample_rate)
+        device_index = select_device(stream.provider, args.system_input, ["BlackHole", "Soundflower", "Loopback"])
+      else:
+        raise ValueError(f"Unknown audio source '{name}', expected 'mic' or 'system'")
+      stream.provider.init_input_device(device_index)
+      self.streams.append(stream)
+      log.info(f"Source '{name}' using input device {device_index}")
+
+    if not self.streams:
+      raise ValueError("No audio sources selected")
+
+    log.info(f"Loading model {args.model} (shared by {len(self.streams)} sources)...")
+    start_time = time.time()
+    if args.inference_process:
+      self.inference_worker = InferenceWorker(args, self.compute_device)
+      self.backend = self.inference_worker
+    elif args.onnx:
+      self.backend = ONNXWhisperBackend(load_onnx_model(args.model, args), args, self.compute_device)
+    else:
+      self.backend = OpenAIWhisperBackend(load_model(args.model, self.compute_device, args), args, self.compute_device)
+    log.info(f"Model loaded in {time.time() - start_time:.2f} seconds")
+    self.init_decode_control()
+    self.last_decode_time = 0.0
+
+    # 带来源标签的最近转录，停止时写入日志
+    self.transcription = deque(maxlen=self.max_transcription_history)
+
+  def queued_chunks(self):
+    return sum(stream.data_queue.qsize() for stream in self.streams)
+
+  def ready_streams(self, new_samples):
+    """
+    返回本轮需要解码的来源：窗口达到最长时长，或已达到最短时长且本轮没有新音频。
+    只要有一个来源就绪，其他已达到最短时长的来源也一起解码，合并成同一批。
+    """
+    candidates = []
+    due = False
+    for stream in self.streams:
+      duration = len(stream.audio) / self.sample_rate
+      if duration < self.args.min_duration:
+        continue
+      if np.max(np.abs(stream.audio)) < self.args.silence_threshold:
+        stream.clear()
+        continue
+      candidates.append(stream)
+      if duration >= self.args.max_duration or new_samples[stream.name] == 0:
+        due = True
+    return candidates if due else []
+
+  def transcribe_streams(self, streams):
+    """按语言把就绪的窗口分组批量解码，结果按来源顺序显示"""
+    groups = {}
+    for stream in streams:
+      groups.setdefault(stream.decode_language(self.backend), []).append(stream)
+
+    results = {}
+    for language, group in groups.items():
+      for start in range(0, len(group), max(1, self.args.max_batch_size)):
+        batch = group[start:start + max(1, self.args.max_batch_size)]
+        audios = [stream.audio for stream in batch]
+        for stream, result in zip(batch, self.decode_batch(audios, language, record=True)):
+          results[stream.name] = result
+
+    changes = []
+    for stream in streams:
+      result = results[stream.name]
+      text = result['text'].strip()
+      # 识别结果已在分组前交给 LanguageIdManager，这里只记录是否有语音
+      stream.update_language(None, bool(text))
+      capture_start = stream.last_audio_time - len(stream.audio) / self.sample_rate
+      capture_end = stream.last_audio_time
+      stream.clear()
+      if text:
+        caption = f"{stream.label} {text}"
+        log.info(f"[{stream.name}] {text}")
+        if self.subtitles is not None:
+          self.subtitles.add(capture_start, capture_end, caption)
+        if self.transcripts is not None:
+          self.transcripts.add(capture_start, capture_end, text, source=stream.name)
+        changes.extend(self.caption_state.update(caption))
+        self.transcription.append(caption)
+    self.publish_captions(changes)
+
+  def listen(self):
+    for stream in self.streams:
+      log.info(f"Starting {stream.name} recording...")
+      stream.provider.start_record()
+
+    max_samples = self.sample_rate * self.args.moving_window
+    try:
+      while not self.stop_event.is_set():
+        new_samples = {stream.name: stream.drain() for stream in self.streams}
+        for stream in self.streams:
+          # 防止某个来源长时间未解码时窗口无限增长
+          if len(stream.audio) > max_samples:
+            stream.audio = stream.audio[-max_samples:]
+
+        streams = self.ready_streams(new_samples)
+        # 实时率调节器降级时加大解码间隔，窗口在 --moving-window 以内继续积累
+        if not streams or time.time() - self.last_decode_time < self.decode_interval:
+          sleep(0.05)
+          continue
+
+        self.last_decode_time = time.time()
+        try:
+          self.transcribe_streams(streams)
+        except DecodeCancelled:
+          log.info("Decode cancelled, transcription stopping")
+          break
+        except Exception as e:
+          log.exception(f"Error during transcription: {e}")
+          for stream in streams:
+            stream.clear()
+    finally:
+      for stream in self.streams:
+        stream.provider.stop_record()
+
+      self.log_final_transcription(self.transcription)
+
+
+def main():
+  run(parse_args(), MultiSourceTranscriber, "🎤🔊 多来源转录已启动\n开始说话或播放音频...")
+
+if __name__ == "__main__":
+  main()
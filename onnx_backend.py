@@ -0,0 +1,396 @@
+#! python3.7
+
+import argparse
+import json
+import os
+import time
+from types import SimpleNamespace
+
+import numpy as np
+import torch
+import whisper
+from whisper.decoding import DecodingResult
+from whisper.model import ModelDimensions
+from whisper.utils import compression_ratio
+
+from whisper_backend import OpenAIWhisperBackend, repeated_tail
+from runtime_log import get_logger, setup_logging
+
+log = get_logger("onnx_backend")
+
+ONNX_DIR = os.path.join(os.getenv("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache")),
+                        "realtime-transcribe", "onnx")
+OPSET = 17
+
+
+# 导出图的输入输出变化时递增，旧格式的导出缓存不再使用
+EXPORT_VERSION = 2
+
+
+def _split_heads(x, n_head):
+  """(batch, n, n_state) -> (batch, n_head, n, head_dim)；头维度用常量，空序列也能 reshape"""
+  n_batch, n, n_state = x.shape
+  return x.reshape(n_batch, n, n_head, n_state // n_head).permute(0, 2, 1, 3)
+
+
+def _attention(attn, q, k, v, mask=None):
+  """
+  与 whisper 的 qkv_attention 相同，但 k 已经乘过缩放系数并转置为 (batch, n_head, head_dim, n)，
+  v 为 (batch, n_head, n, head_dim)，缓存的 key/value 不必每步重新排列。
+  """
+  q = _split_heads(q, attn.n_head) * (attn.query.in_features // attn.n_head) ** -0.25
+  qk = q @ k
+  if mask is not None:
+    qk = qk + mask
+  w = torch.softmax(qk.float(), dim=-1).to(q.dtype)
+  return attn.out((w @ v).permute(0, 2, 1, 3).flatten(start_dim=2))
+
+
+def _cache_key(attn, x):
+  """key 投影，按 _attention 需要的布局缩放并转置"""
+  k = _split_heads(attn.key(x), attn.n_head) * (attn.key.in_features // attn.n_head) ** -0.25
+  return k.transpose(-1, -2)
+
+
+class _EncoderCrossKV(torch.nn.Module):
+  """
+  编码后直接算出每层交叉注意力的 key/value（每层两个输出）。
+  它们在整个解码过程中不变，每步作为独立的输入直接读取，不需要切片复制。
+  """
+
+  def __init__(self, model):
+    super().__init__()
+    self.encoder = model.encoder
+    self.blocks = model.decoder.blocks
+
+  def forward(self, mel):
+    xa = self.encoder(mel)
+    cross_kv = []
+    for block in self.blocks:
+      cross_kv += [_cache_key(block.cross_attn, xa), _split_heads(block.cross_attn.value(xa), block.cross_attn.n_head)]
+    return tuple(cross_kv)
+
+
+class _CachedDecoder(torch.nn.Module):
+  """
+  带KV缓存的解码器：输入新token、每层交叉注意力的 key/value 和之前各步每层自注意力的 key/value
+  （首步长度为0），输出最后一个位置的 logits 和拼接了新token的自注意力 key/value。
+  首步送入完整的起始序列（含前缀），之后每步只送入上一步生成的token。
+  """
+
+  def __init__(self, decoder):
+    super().__init__()
+    self.decoder = decoder
+
+  def forward(self, tokens, *caches):
+    decoder = self.decoder
+    n_layer = len(decoder.blocks)
+    cross_kv, past_kv = caches[:2 * n_layer], caches[2 * n_layer:]
+    offset = past_kv[1].shape[2]
+    n_tokens = tokens.shape[1]
+    x = decoder.token_embedding(tokens) + decoder.positional_embedding[offset:offset + n_tokens]
+    mask = decoder.mask[offset:offset + n_tokens, :offset + n_tokens]
+
+    present = []
+    for i, block in enumerate(decoder.blocks):
+      h = block.attn_ln(x)
+      k = torch.cat([past_kv[2 * i], _cache_key(block.attn, h)], dim=3)
+      v = torch.cat([past_kv[2 * i + 1], _split_heads(block.attn.value(h), block.attn.n_head)], dim=2)
+      present += [k, v]
+      x = x + _attention(block.attn, block.attn.query(h), k, v, mask)
+      h = block.cross_attn_ln(x)
+      x = x + _attention(block.cross_attn, block.cross_attn.query(h), cross_kv[2 * i], cross_kv[2 * i + 1])
+      x = x + block.mlp(block.mlp_ln(x))
+
+    x = decoder.ln(x[:, -1])
+    logits = (x @ decoder.token_embedding.weight.to(x.dtype).T).float()
+    return (logits,) + tuple(present)
+
+
+def _cache_names(prefix, n_layer):
+  return [f"{prefix}_{kind}{i}" for i in range(n_layer) for kind in ("k", "v")]
+
+
+def export_onnx(model_name, model_dir):
+  """从本地缓存的 whisper 权重导出编码器和解码器 ONNX 图"""
+  log.info(f"Exporting {model_name} to ONNX (first run only)...")
+  start_time = time.time()
+  export_model(whisper.load_model(model_name, device="cpu"), model_dir)
+  log.info(f"ONNX export finished in {time.time() - start_time:.2f} seconds: {model_dir}")
+
+
+def export_model(model, model_dir):
+  model = model.eval()
+  dims = model.dims
+  n_layer = dims.n_text_layer
+  head_dim = dims.n_text_state // dims.n_text_head
+  os.makedirs(model_dir, exist_ok=True)
+
+  mel = torch.zeros((1, dims.n_mels, whisper.audio.N_FRAMES), dtype=torch.float32)
+  # 追踪时 past 和新token都取非零且不同的长度，避免形状被固定成常量
+  tokens = torch.zeros((1, 2), dtype=torch.int64)
+  past_kv = [torch.zeros((1, dims.n_text_head, head_dim, 3)), torch.zeros((1, dims.n_text_head, 3, head_dim))] * n_layer
+  cross_names = _cache_names("cross", n_layer)
+  past_names = _cache_names("past", n_layer)
+  present_names = _cache_names("present", n_layer)
+  # key 缓存的序列维在最后，value 在倒数第二
+  cache_axes = [{0: "batch", 3: "tokens"}, {0: "batch", 2: "tokens"}] * n_layer
+  # SDPA 的 is_causal 分支会在追踪时被固定，导出时改用显式掩码
+  with torch.no_grad(), whisper.model.disable_sdpa():
+    encoder = _EncoderCrossKV(model)
+    cross_kv = encoder(mel)
+    torch.onnx.export(
+      encoder, (mel,), os.path.join(model_dir, "encoder.onnx"),
+      input_names=["mel"], output_names=cross_names,
+      dynamic_axes={"mel": {0: "batch"}, **{name: {0: "batch"} for name in cross_names}},
+      opset_version=OPSET, dynamo=False,
+    )
+    torch.onnx.export(
+      _CachedDecoder(model.decoder), (tokens, *cross_kv, *past_kv), os.path.join(model_dir, "decoder.onnx"),
+      input_names=["tokens"] + cross_names + past_names, output_names=["logits"] + present_names,
+      dynamic_axes={"tokens": {0: "batch", 1: "new_tokens"}, "logits": {0: "batch"},
+                    **{name: {0: "batch"} for name in cross_names},
+                    **dict(zip(past_names, cache_axes)), **dict(zip(present_names, cache_axes))},
+      opset_version=OPSET, dynamo=False,
+    )
+
+  # 最后写入维度信息，用它判断导出是否完整
+  with open(os.path.join(model_dir, "dims.json"), "w") as f:
+    json.dump(dims.__dict__, f)
+
+
+class ONNXWhisperModel:
+  """
+  ONNX Runtime CPU 会话，提供 OpenAIWhisperBackend 用到的模型属性（dims、is_multilingual、num_languages）。
+  会话常驻，交叉注意力的 key/value 和每步的自注意力缓存都通过 IO binding 留在 OrtValue 中，
+  直接绑定为下一步的输入，不在每一步复制。
+  """
+
+  def __init__(self, model_dir, intra_op_threads=0, inter_op_threads=0):
+    import onnxruntime as ort
+    self.ort = ort
+
+    with open(os.path.join(model_dir, "dims.json")) as f:
+      self.dims = ModelDimensions(**json.load(f))
+    self.is_multilingual = self.dims.n_vocab >= 51865
+    self.num_languages = self.dims.n_vocab - 51765 - int(self.is_multilingual)
+    self.cross_names = _cache_names("cross", self.dims.n_text_layer)
+    self.past_names = _cache_names("past", self.dims.n_text_layer)
+    self.present_names = _cache_names("present", self.dims.n_text_layer)
+
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    options.intra_op_num_threads = intra_op_threads
+    options.inter_op_num_threads = inter_op_threads
+    if inter_op_threads > 1:
+      options.execution_mode = ort.ExecutionMode.ORT_PARALLEL
+    providers = ["CPUExecutionProvider"]
+    self.encoder = ort.InferenceSession(os.path.join(model_dir, "encoder.onnx"), options, providers=providers)
+    self.decoder = ort.InferenceSession(os.path.join(model_dir, "decoder.onnx"), options, providers=providers)
+    self.encoder_binding = self.encoder.io_binding()
+    self.decoder_binding = self.decoder.io_binding()
+
+  def encode(self, mel):
+    """mel 为 (batch, n_mels, N_FRAMES) 的 numpy 数组，返回留在 ONNX Runtime 中的每层交叉注意力 key/value（OrtValue 列表）"""
+    binding = self.encoder_binding
+    binding.clear_binding_inputs()
+    binding.clear_binding_outputs()
+    binding.bind_cpu_input("mel", np.ascontiguousarray(mel, dtype=np.float32))
+    for name in self.cross_names:
+      binding.bind_output(name, "cpu")
+    self.encoder.run_with_iobinding(binding)
+    return binding.get_outputs()
+
+  def batch_size(self, cross_kv):
+    return cross_kv[0].shape()[0]
+
+  def empty_cache(self, n_batch):
+    head_dim = self.dims.n_text_state // self.dims.n_text_head
+    key = np.zeros((n_batch, self.dims.n_text_head, head_dim, 0), dtype=np.float32)
+    value = np.zeros((n_batch, self.dims.n_text_head, 0, head_dim), dtype=np.float32)
+    return [key, value] * self.dims.n_text_layer
+
+  def step(self, tokens, cross_kv, past_kv):
+    """
+    tokens 为 (batch, n) 的 int64 数组，只包含 past_kv 之后的新token；
+    返回 (最后一个位置的 logits (batch, n_vocab), 新的自注意力缓存 OrtValue 列表)。
+    """
+    binding = self.decoder_binding
+    binding.clear_binding_inputs()
+    binding.clear_binding_outputs()
+    binding.bind_cpu_input("tokens", np.ascontiguousarray(tokens, dtype=np.int64))
+    for name, value in zip(self.cross_names + self.past_names, cross_kv + past_kv):
+      if isinstance(value, np.ndarray):
+        binding.bind_cpu_input(name, value)
+      else:
+        binding.bind_ortvalue_input(name, value)
+    for name in ["logits"] + self.present_names:
+      binding.bind_output(name, "cpu")
+    self.decoder.run_with_iobinding(binding)
+    outputs = binding.get_outputs()
+    return outputs[0].numpy(), outputs[1:]
+
+  def logits(self, tokens, cross_kv):
+    """不使用缓存，对完整的 tokens 计算最后一个位置的 logits (batch, n_vocab)"""
+    return self.step(tokens, cross_kv, self.empty_cache(len(tokens)))[0]
+
+
+def load_onnx_model(model_name, args):
+  """加载（必要时先导出）ONNX 模型，导出结果按模型名和导出格式版本缓存"""
+  model_dir = os.path.join(ONNX_DIR, os.path.basename(model_name).replace(".pt", "") + f".v{EXPORT_VERSION}")
+  if not os.path.exists(os.path.join(model_dir, "dims.json")):
+    export_onnx(model_name, model_dir)
+  return ONNXWhisperModel(model_dir, args.onnx_threads, args.onnx_inter_threads)
+
+
+class ONNXWhisperBackend(OpenAIWhisperBackend):
+  """
+  用 ONNX Runtime 执行编码和贪心解码，前缀复用、解码预算、取消等逻辑与 OpenAIWhisperBackend 共用。
+  """
+
+  def __init__(self, model, args, compute_device):
+    super().__init__(model, args, compute_device)
+    if self.beam_size and self.beam_size > 1:
+      log.warning("ONNX backend only supports greedy decoding, ignoring --beam-size")
+      self.beam_size = 1
+
+  def apply_settings(self, settings):
+    # 只导出了一个模型，也只有贪心解码，调节器只能通过解码间隔降级
+    if settings.get('model', self.model_name) != self.model_name:
+      log.warning(f"ONNX backend cannot switch to model {settings['model']}, keeping {self.model_name}")
+
+  def language_probs(self, audio_features):
+    tokenizer = self.tokenizer(None)
+    n_batch = self.model.batch_size(audio_features)
+    logits = self.model.logits(np.full((n_batch, 1), tokenizer.sot, dtype=np.int64), audio_features)
+    language_logits = logits[:, list(tokenizer.all_language_tokens)]
+    language_logits = np.exp(language_logits - language_logits.max(axis=-1, keepdims=True))
+    probs = language_logits / language_logits.sum(axis=-1, keepdims=True)
+    return [dict(zip(tokenizer.all_language_codes, row.tolist())) for row in probs]
+
+  def detect_language(self, mel):
+    audio_features = self.model.encode(mel.cpu().numpy()[None])
+    return audio_features, self.language_probs(audio_features)[0]
+
+  def suppress_tokens(self, tokenizer):
+    """与 whisper 默认的 suppress_tokens="-1" 相同，另外屏蔽时间戳token"""
+    suppress = set(tokenizer.non_speech_tokens)
+    suppress.update([tokenizer.transcribe, tokenizer.translate, tokenizer.sot, tokenizer.sot_prev, tokenizer.sot_lm])
+    if tokenizer.no_speech is not None:
+      suppress.add(tokenizer.no_speech)
+    suppress.update(range(tokenizer.timestamp_begin, self.model.dims.n_vocab))
+    return sorted(suppress)
+
+  def run_decoding(self, mel, options, cancel_token=None):
+    if isinstance(mel, list):
+      # detect_language 已经编码过（每层交叉注意力的 key/value）
+      single = True
+      audio_features = mel
+    else:
+      mel = mel.cpu().numpy()
+      if single := mel.ndim == 2:
+        mel = mel[None]
+      if cancel_token is not None:
+        cancel_token.check()
+      audio_features = self.model.encode(mel)
+    n_batch = self.model.batch_size(audio_features)
+
+    tokenizer = self.tokenizer(options.language)
+    sample_len = options.sample_len or self.model.dims.n_text_ctx // 2
+    prefix = list(options.prefix or [])[-(self.model.dims.n_text_ctx // 2 - sample_len):]
+    initial = list(tokenizer.sot_sequence_including_notimestamps) + prefix
+    sample_begin = len(initial)
+    tokens = np.tile(np.array(initial, dtype=np.int64), (n_batch, 1))
+
+    # 未指定语言时逐段识别，写入语言token的位置
+    languages = [options.language] * n_batch
+    language_probs = [None] * n_batch
+    if options.language is None:
+      language_probs = self.language_probs(audio_features)
+      languages = [max(probs, key=probs.get) for probs in language_probs]
+      tokens[:, initial.index(tokenizer.sot) + 1] = [tokenizer.to_language_token(language) for language in languages]
+
+    suppress = self.suppress_tokens(tokenizer)
+    blank = tokenizer.encode(" ") + [tokenizer.eot]
+    finished = np.zeros(n_batch, dtype=bool)
+    stopped = set()
+    # 首步送入完整的起始序列填充KV缓存，之后每步只送入上一步生成的token
+    kv_cache = self.model.empty_cache(n_batch)
+    new_tokens = tokens
+    for step in range(sample_len):
+      if cancel_token is not None:
+        cancel_token.check()
+      logits, kv_cache = self.model.step(new_tokens, audio_features, kv_cache)
+      logits[:, suppress] = -np.inf
+      if step == 0:
+        logits[:, blank] = -np.inf
+      for i in range(n_batch):
+        if not finished[i] and repeated_tail(tokens[i, sample_begin:].tolist()) is not None:
+          logits[i, :] = -np.inf
+          logits[i, tokenizer.eot] = 0
+          stopped.add(i)
+
+      next_tokens = logits.argmax(axis=-1)
+      next_tokens[finished] = tokenizer.eot
+      new_tokens = next_tokens[:, None]
+      tokens = np.concatenate([tokens, new_tokens], axis=1)
+      finished |= next_tokens == tokenizer.eot
+      if finished.all():
+        break
+
+    results = []
+    for i in range(n_batch):
+      sampled = tokens[i, sample_begin:].tolist()
+      if tokenizer.eot in sampled:
+        sampled = sampled[:sampled.index(tokenizer.eot)]
+      text = tokenizer.decode(sampled).strip()
+      results.append(DecodingResult(
+        audio_features=None,
+        language=languages[i],
+        language_probs=language_probs[i],
+        tokens=sampled,
+        text=text,
+        compression_ratio=compression_ratio(text) if text else 0.0,
+      ))
+    return (results[0] if single else results), stopped
+
+
+def benchmark(model_name, audio, language, threads, runs=3):
+  """比较 PyTorch 与 ONNX 后端贪心解码同一段音频的平均延迟（都在CPU上，线程数相同）"""
+  # tokens_per_second 为 0 时不限制解码预算，让解码循环的差别充分体现
+  args = SimpleNamespace(model=model_name, translate=False, no_fp16=True, beam_size=1, tokens_per_second=0,
+                         onnx_threads=threads, onnx_inter_threads=0)
+  torch.set_num_threads(threads)
+  backends = [
+    ("pytorch", OpenAIWhisperBackend(whisper.load_model(model_name, device="cpu"), args, "cpu")),
+    ("onnx", ONNXWhisperBackend(load_onnx_model(model_name, args), args, "cpu")),
+  ]
+
+  print(f"{'backend':>8} {'decode (s)':>11} {'tokens':>7}")
+  for name, backend in backends:
+    backend.decode_audio(audio, language)  # 预热
+    start = time.time()
+    for _ in range(runs):
+      result = backend.decode_audio(audio, language)
+    print(f"{name:>8} {(time.time() - start) / runs:>11.3f} {len(result['tokens']):>7}")
+
+
+def main():
+  parser = argparse.ArgumentParser(description="Export the ONNX model if needed and compare its decode latency with PyTorch")
+  parser.add_argument("--model", default="tiny.en", help="Whisper model name or checkpoint path")
+  parser.add_argument("--audio", default=None, help="Audio file to decode (default: 30 seconds of low-level noise)")
+  parser.add_argument("--language", default="en", help="Language for decoding (default: en)")
+  parser.add_argument("--threads", default=min(4, os.cpu_count() or 1), help="CPU threads for both backends", type=int)
+  parser.add_argument("--runs", default=3, help="Timed runs per backend", type=int)
+  args = parser.parse_args()
+  setup_logging()
+
+  if args.audio:
+    audio = whisper.load_audio(args.audio)[:whisper.audio.N_SAMPLES]
+  else:
+    audio = np.random.default_rng(0).normal(0, 0.01, whisper.audio.N_SAMPLES).astype(np.float32)
+  benchmark(args.model, audio, args.language, args.threads, runs=args.runs)
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,53 @@
+#! python3.7
+
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+
+
+class DecodeResultCache:
+  """
+  解码结果的LRU缓存。
+  键为音频PCM的快速哈希加上解码参数（模型、语言、beam大小等），
+  无新数据时重复送入的同一窗口、回放录音时重复出现的相同音频都不必再次推理。
+  """
+
+  def __init__(self, max_entries=64):
+    self.max_entries = max_entries
+    self.entries = OrderedDict()
+    self.hits = 0
+    self.misses = 0
+
+  def __len__(self):
+    return len(self.entries)
+
+  @property
+  def hit_rate(self):
+    total = self.hits + self.misses
+    return self.hits / total if total else 0.0
+
+  def key(self, audio, params):
+    """audio 为 float32 PCM，params 为影响解码结果的参数字典"""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(np.ascontiguousarray(audio, dtype=np.float32).tobytes())
+    digest.update(repr(sorted(params.items())).encode("utf-8"))
+    return digest.hexdigest()
+
+  def get(self, key):
+    result = self.entries.get(key)
+    if result is None:
+      self.misses += 1
+      return None
+    self.entries.move_to_end(key)
+    self.hits += 1
+    return result
+
+  def put(self, key, result):
+    self.entries[key] = result
+    self.entries.move_to_end(key)
+    while len(self.entries) > self.max_entries:
+      self.entries.popitem(last=False)
+
+  def stats(self):
+    return f"{self.hits} hits / {self.misses} misses ({self.hit_rate:.0%}), {len(self.entries)} entries"
@@ -0,0 +1,98 @@
+#! python3.7
+
+import time
+from collections import deque
+from runtime_log import get_logger
+
+log = get_logger("rtf_governor")
+
+# 负载过高时依次降级到的更小模型，只包含 mel 维度相同的模型：
+# large 指向 128 维 mel 的 large-v3，medium 及以下都是 80 维，不能互相切换
+MODEL_FALLBACKS = {
+  "medium": "small",
+  "small": "base",
+  "base": "tiny",
+  "medium.en": "small.en",
+  "small.en": "base.en",
+  "base.en": "tiny.en",
+}
+
+
+def build_levels(args, slow_interval=1.0):
+  """
+  根据启动参数生成逐级降级的配置，每一级在上一级基础上再降低一项开销：
+  加大解码间隔 -> 关闭 beam search -> 换用更小的模型
+  """
+  level = {'name': 'normal', 'decode_interval': 0.0, 'beam_size': args.beam_size, 'model': args.model}
+  levels = [level]
+
+  level = {**level, 'name': 'slow-cadence', 'decode_interval': slow_interval}
+  levels.append(level)
+
+  if args.beam_size and args.beam_size > 1:
+    level = {**level, 'name': 'greedy', 'beam_size': 1}
+    levels.append(level)
+
+  # 只降一档模型，避免准确率下降过多
+  fallback = MODEL_FALLBACKS.get(args.model)
+  if fallback:
+    level = {**level, 'name': f'model-{fallback}', 'model': fallback}
+    levels.append(level)
+
+  return levels
+
+
+class RealtimeGovernor:
+  """
+  监测滚动实时率（解码耗时 / 音频时长）和采集队列深度，
+  处理跟不上实时时逐级降低开销，负载恢复后再逐级回升。
+  """
+
+  def __init__(self, levels, window=8, high_rtf=0.8, low_rtf=0.4, high_queue=60, low_queue=10, hold_time=5.0):
+    self.levels = levels
+    self.level = 0
+    self.high_rtf = high_rtf
+    self.low_rtf = low_rtf
+    self.high_queue = high_queue
+    self.low_queue = low_queue
+    self.hold_time = hold_time
+
+    self.samples = deque(maxlen=window)
+    self.last_change_time = 0
+    self.queue_depth = 0
+
+  @property
+  def settings(self):
+    return self.levels[self.level]
+
+  @property
+  def rtf(self):
+    decode_seconds = sum(sample[0] for sample in self.samples)
+    audio_seconds = sum(sample[1] for sample in self.samples)
+    return decode_seconds / audio_seconds if audio_seconds > 0 else 0.0
+
+  def record(self, decode_seconds, audio_seconds, queue_depth, now=None):
+    """记录一次解码，需要切换级别时返回新的配置，否则返回 None"""
+    now = time.time() if now is None else now
+    if audio_seconds > 0:
+      self.samples.append((decode_seconds, audio_seconds))
+    self.queue_depth = queue_depth
+
+    if len(self.samples) < self.samples.maxlen // 2 or now - self.last_change_time < self.hold_time:
+      return None
+
+    rtf = self.rtf
+    if (rtf > self.high_rtf or queue_depth > self.high_queue) and self.level < len(self.levels) - 1:
+      return self._change(self.level + 1, rtf, queue_depth, now)
+    if rtf < self.low_rtf and queue_depth < self.low_queue and self.level > 0:
+      return self._change(self.level - 1, rtf, queue_depth, now)
+    return None
+
+  def _change(self, level, rtf, queue_depth, now):
+    direction = "down" if level > self.level else "up"
+    self.level = level
+    self.last_change_time = now
+    # 新级别下重新统计
+    self.samples.clear()
+    log.info(f"Realtime governor stepping {direction} to '{self.settings['name']}' (rtf {rtf:.2f}, queue {queue_depth})")
+    return self.settings
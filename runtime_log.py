@@ -0,0 +1,149 @@
+#! python3.7
+
+import atexit
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+
+LEVELS = ["debug", "info", "warning", "error"]
+ROOT = "realtime"
+FORMAT = "%(asctime)s.%(msecs)03d %(levelname)-7s %(threadName)s %(name)s: %(message)s"
+DATE_FORMAT = "%H:%M:%S"
+
+_listener = None
+
+# 控制台输出锁和计数：终端转录视图据此判断两次重绘之间是否有日志插入
+console_lock = threading.RLock()
+_console_writes = 0
+
+
+def get_logger(name):
+  """各模块的日志记录器都挂在 realtime 下，只配置它，不接管第三方库的日志"""
+  return logging.getLogger(f"{ROOT}.{name}")
+
+
+def every(seconds):
+  """给单条日志指定限流间隔：log.debug("...", extra=every(1.0))"""
+  return {'rate_limit': seconds}
+
+
+class RateLimitFilter(logging.Filter):
+  """
+  按调用位置（文件+行号）限流，同一位置在 rate_limit 秒内只放行一条，
+  被丢弃的条数附在下一条放行的消息后面。没有指定 rate_limit 的记录不受影响。
+  """
+
+  def __init__(self):
+    super().__init__()
+    self.lock = threading.Lock()
+    self.sites = {}
+
+  def filter(self, record):
+    interval = getattr(record, 'rate_limit', 0)
+    if not interval:
+      return True
+
+    key = (record.pathname, record.lineno)
+    with self.lock:
+      site = self.sites.get(key)
+      if site is not None and record.created - site[0] < interval:
+        site[1] += 1
+        return False
+      suppressed = site[1] if site is not None else 0
+      self.sites[key] = [record.created, 0]
+
+    if suppressed:
+      record.suppressed = suppressed
+    return True
+
+
+class SuppressedFormatter(logging.Formatter):
+  def format(self, record):
+    message = super().format(record)
+    suppressed = getattr(record, 'suppressed', 0)
+    if suppressed:
+      message += f" ({suppressed} similar messages suppressed)"
+    return message
+
+
+def console_writes():
+  return _console_writes
+
+
+def console_write(text):
+  """在日志之外直接写控制台（例如字幕输出），同样持锁并计数"""
+  global _console_writes
+  with console_lock:
+    sys.stdout.write(text)
+    sys.stdout.flush()
+    _console_writes += 1
+
+
+class ConsoleHandler(logging.StreamHandler):
+  """写标准输出时持有 console_lock 并计数，与终端转录视图互斥"""
+
+  def createLock(self):
+    self.lock = console_lock
+
+  def emit(self, record):
+    global _console_writes
+    super().emit(record)
+    _console_writes += 1
+
+
+class AsyncHandler(logging.handlers.QueueHandler):
+  """
+  只把记录放进队列，格式化和写入都在监听线程中完成。
+  QueueHandler 默认会在调用线程里格式化消息，这里跳过，采集和推理线程只付出入队的开销。
+  """
+
+  def prepare(self, record):
+    return record
+
+
+def setup_logging(level="info", log_file=None):
+  """
+  配置异步日志：调用线程经过限流后入队，监听线程负责格式化并写到标准输出（和可选的日志文件）。
+  重复调用只更新级别。子进程（推理进程、批量转录进程）需要各自调用一次。
+  """
+  global _listener
+  logger = logging.getLogger(ROOT)
+  logger.setLevel(getattr(logging, level.upper()))
+  if _listener is not None:
+    return logger
+
+  formatter = SuppressedFormatter(FORMAT, DATE_FORMAT)
+  handlers = [ConsoleHandler(sys.stdout)]
+  if log_file:
+    handlers.append(logging.FileHandler(log_file, encoding="utf-8"))
+  for handler in handlers:
+    handler.setFormatter(formatter)
+
+  log_queue = queue.SimpleQueue()
+  handler = AsyncHandler(log_queue)
+  handler.addFilter(RateLimitFilter())
+  logger.addHandler(handler)
+  logger.propagate = False
+
+  _listener = logging.handlers.QueueListener(log_queue, *handlers)
+  _listener.start()
+  atexit.register(shutdown_logging)
+  return logger
+
+
+def flush_logging():
+  """等待队列中已有的记录写完，交互式提示之前调用，避免提示和日志交错"""
+  if _listener is not None:
+    _listener.stop()
+    _listener.start()
+
+
+def shutdown_logging():
+  """写完队列中剩余的记录后停止监听线程"""
+  global _listener
+  if _listener is not None:
+    _listener.stop()
+    _listener = None
+
@@ -0,0 +1,116 @@
+#! python3.7
+
+import numpy as np
+from whisper.audio import SAMPLE_RATE, N_FFT, HOP_LENGTH, N_FRAMES, FRAMES_PER_SECOND, mel_filters
+
+# 全零音频经过 clamp(1e-10).log10() 之后的取值，用于把窗口补齐到30秒
+PAD_LOG_VALUE = -10.0
+
+
+class StreamingLogMel:
+  """
+  增量计算 log-mel 特征，结果与 whisper.audio.log_mel_spectrogram 对齐。
+  每个 mel 帧只在音频到达时计算一次，保存在与采样缓冲区对齐的环形缓冲中，
+  解码时直接取出归一化后的特征，避免每轮重复计算 STFT。
+  """
+
+  def __init__(self, n_mels=80, max_seconds=30, sample_rate=SAMPLE_RATE):
+    if sample_rate != SAMPLE_RATE:
+      raise ValueError(f"Whisper features require {SAMPLE_RATE}Hz audio, got {sample_rate}Hz")
+
+    self.n_mels = n_mels
+    self.max_frames = int(min(max_seconds, N_FRAMES / FRAMES_PER_SECOND) * FRAMES_PER_SECOND)
+
+    # 缓存窗函数和滤波器组，与 torch.hann_window(N_FFT) 一致（周期窗）
+    self.fft_window = (0.5 - 0.5 * np.cos(2 * np.pi * np.arange(N_FFT) / N_FFT)).astype(np.float32)
+    self.filters_t = np.ascontiguousarray(mel_filters("cpu", n_mels).numpy().T)
+
+    # 环形缓冲，保存 clamp 之前的 log10 mel 值，形状 (帧, n_mels)
+    self.ring = np.zeros((self.max_frames, n_mels), dtype=np.float32)
+    self.reset()
+
+  def reset(self):
+    """清空特征和未消费的采样，下一段音频重新开始"""
+    self.pending = np.zeros((0,), dtype=np.float32)
+    self.started = False
+    self.head = 0
+    self.count = 0
+    self.discard_remainder = 0
+
+  def __len__(self):
+    return self.count
+
+  def accept(self, samples):
+    """接收新采样并计算所有可以完整计算的 mel 帧，返回新增帧数"""
+    samples = np.asarray(samples, dtype=np.float32).reshape(-1)
+    if len(samples) == 0:
+      return 0
+
+    self.pending = np.concatenate([self.pending, samples])
+
+    # torch.stft(center=True) 在开头做反射填充，需要至少 N_FFT//2+1 个采样
+    if not self.started:
+      half = N_FFT // 2
+      if len(self.pending) <= half:
+        return 0
+      self.pending = np.concatenate([self.pending[1:half + 1][::-1], self.pending])
+      self.started = True
+
+    if len(self.pending) < N_FFT:
+      return 0
+
+    n_new = 1 + (len(self.pending) - N_FFT) // HOP_LENGTH
+    frames = np.lib.stride_tricks.sliding_window_view(self.pending, N_FFT)[::HOP_LENGTH][:n_new]
+    magnitudes = np.abs(np.fft.rfft(frames * self.fft_window, axis=-1)) ** 2
+    mel_spec = magnitudes.astype(np.float32) @ self.filters_t
+    log_spec = np.log10(np.maximum(mel_spec, 1e-10))
+
+    self.pending = self.pending[n_new * HOP_LENGTH:]
+    self._push(log_spec)
+    return n_new
+
+  def discard(self, n_samples):
+    """采样缓冲区从头部裁掉 n_samples 时调用，保持特征与采样对齐"""
+    total = self.discard_remainder + int(n_samples)
+    n_frames, self.discard_remainder = divmod(total, HOP_LENGTH)
+    n_frames = min(n_frames, self.count)
+    self.head = (self.head + n_frames) % self.max_frames
+    self.count -= n_frames
+
+  def features(self, n_frames=None):
+    """按时间顺序返回最近 n_frames 帧未归一化的 log10 mel，形状 (帧, n_mels)"""
+    count = self.count if n_frames is None else min(n_frames, self.count)
+    start = self.head + self.count - count
+    index = np.arange(start, start + count) % self.max_frames
+    return self.ring[index]
+
+  def log_mel(self, n_frames=N_FRAMES):
+    """返回可直接送入 whisper.decode 的归一化特征，形状 (n_mels, n_frames)"""
+    log_spec = np.full((n_frames, self.n_mels), PAD_LOG_VALUE, dtype=np.float32)
+    feats = self.features(n_frames)
+    log_spec[:len(feats)] = feats
+
+    # 与 log_mel_spectrogram 相同的动态范围压缩和归一化
+    np.maximum(log_spec, log_spec.max() - 8.0, out=log_spec)
+    log_spec += 4.0
+    log_spec /= 4.0
+    return np.ascontiguousarray(log_spec.T)
+
+  def _push(self, frames):
+    n_new = len(frames)
+    if n_new >= self.max_frames:
+      self.ring[:] = frames[-self.max_frames:]
+      self.head = 0
+      self.count = self.max_frames
+      return
+
+    end = (self.head + self.count) % self.max_frames
+    first = min(n_new, self.max_frames - end)
+    self.ring[end:end + first] = frames[:first]
+    self.ring[:n_new - first] = frames[first:]
+
+    self.count += n_new
+    if self.count > self.max_frames:
+      overflow = self.count - self.max_frames
+      self.head = (self.head + overflow) % self.max_frames
+      self.count = self.max_frames
@@ -0,0 +1,116 @@
+#! python3.7
+
+import os
+import queue
+import threading
+import time
+
+from runtime_log import get_logger
+
+log = get_logger("subtitle_writer")
+
+
+def format_timestamp(seconds, separator=","):
+  milliseconds = int(round(max(0.0, seconds) * 1000))
+  hours, milliseconds = divmod(milliseconds, 3600000)
+  minutes, milliseconds = divmod(milliseconds, 60000)
+  seconds, milliseconds = divmod(milliseconds, 1000)
+  return f"{hours:02d}:{minutes:02d}:{seconds:02d}{separator}{milliseconds:03d}"
+
+
+def format_cue(fmt, index, start, end, text):
+  """一条完整的字幕条目（含结尾空行），SRT 带序号、逗号毫秒分隔，WebVTT 用点号"""
+  text = text.strip().replace("-->", "->")
+  if fmt == "vtt":
+    return f"{format_timestamp(start, '.')} --> {format_timestamp(end, '.')}\n{text}\n\n"
+  return f"{index}\n{format_timestamp(start)} --> {format_timestamp(end)}\n{text}\n\n"
+
+
+def subtitle_format(path):
+  return "vtt" if path.lower().endswith(".vtt") else "srt"
+
+
+class SubtitleWriter:
+  """
+  边转录边写 SRT/WebVTT 字幕文件。
+  转录线程只把确认的条目（采集时间 + 文本）放进队列，格式化、写入和 fsync 都在写入线程完成；
+  每条字幕一次 write 写完整，fsync 最多每 fsync_interval 秒一次，进程被杀时文件中只会缺少最后几条，
+  已写入的部分仍是有效的字幕文件。时间以创建时刻为零点。
+  """
+
+  def __init__(self, path, fsync_interval=2.0, origin=None):
+    self.path = path
+    self.format = subtitle_format(path)
+    self.fsync_interval = fsync_interval
+    self.origin = time.time() if origin is None else origin
+    self.index = 0
+    self.last_start = 0.0
+
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    self.file = open(path, "w", encoding="utf-8")
+    if self.format == "vtt":
+      self.file.write("WEBVTT\n\n")
+    self.file.flush()
+    os.fsync(self.file.fileno())
+
+    self.queue = queue.SimpleQueue()
+    self.thread = threading.Thread(target=self._run, name="subtitle-writer", daemon=True)
+    self.thread.start()
+    log.info(f"Writing {self.format.upper()} subtitles to {path}")
+
+  def add(self, capture_start, capture_end, text):
+    """capture_start / capture_end 为 time.time() 时间轴上的采集时间"""
+    if text and text.strip():
+      self.queue.put((capture_start - self.origin, capture_end - self.origin, text))
+
+  def add_segments(self, capture_start, segments):
+    """segments 的 start/end 是相对窗口起点的秒数"""
+    for segment in segments:
+      self.add(capture_start + segment['start'], capture_start + segment['end'], segment['text'])
+
+  def _run(self):
+    last_sync = time.time()
+    dirty = False
+    while True:
+      try:
+        item = self.queue.get(timeout=self.fsync_interval)
+      except queue.Empty:
+        item = False
+      if item is None:
+        break
+      if item:
+        self._write(*item)
+        dirty = True
+      # 批量 fsync：有新内容且距上次同步超过间隔时才同步
+      if dirty and time.time() - last_sync >= self.fsync_interval:
+        self._sync()
+        last_sync = time.time()
+        dirty = False
+    self._sync()
+    self.file.close()
+
+  def _write(self, start, end, text):
+    # WebVTT 要求条目按开始时间排序，延迟完成的后台窗口保持时长，挪到上一条的开始时间
+    if self.format == "vtt" and start < self.last_start:
+      start, end = self.last_start, self.last_start + (end - start)
+    end = max(end, start + 0.1)
+    self.index += 1
+    self.last_start = start
+    try:
+      self.file.write(format_cue(self.format, self.index, start, end, text))
+      self.file.flush()
+    except OSError as e:
+      log.error(f"Error writing subtitles to {self.path}: {e}")
+
+  def _sync(self):
+    try:
+      self.file.flush()
+      os.fsync(self.file.fileno())
+    except OSError as e:
+      log.error(f"Error syncing subtitles to {self.path}: {e}")
+
+  def close(self):
+    """写完队列中的条目并同步到磁盘"""
+    self.queue.put(None)
+    self.thread.join(timeout=5.0)
@@ -0,0 +1,78 @@
+#! python3.7
+
+import os
+import shutil
+import sys
+import unicodedata
+
+import runtime_log
+
+
+def _enable_windows_ansi():
+  """Windows 10 起控制台支持 ANSI 转义，但需要手动打开虚拟终端模式"""
+  try:
+    import ctypes
+    kernel32 = ctypes.windll.kernel32
+    handle = kernel32.GetStdHandle(-11)  # STD_OUTPUT_HANDLE
+    mode = ctypes.c_uint32()
+    if not kernel32.GetConsoleMode(handle, ctypes.byref(mode)):
+      return False
+    return bool(kernel32.SetConsoleMode(handle, mode.value | 0x0004))  # ENABLE_VIRTUAL_TERMINAL_PROCESSING
+  except Exception:
+    return False
+
+
+def display_width(text):
+  """终端中占用的列数，中日韩等全角字符占两列"""
+  return sum(2 if unicodedata.east_asian_width(char) in ('W', 'F') else 1 for char in text)
+
+
+class TerminalTranscript:
+  """
+  在终端中显示转录历史，替代每轮 os.system('clear') 后整体重打。
+  记住上次画出的行及各自占用的终端行数，用 ANSI 光标控制回到第一处变化，只擦除并重写变化的尾部；
+  两次重绘之间有日志写到控制台时，已画的行不再覆盖，只在日志之后追加变化的行。
+  标准输出不是终端时不输出任何内容。
+  """
+
+  def __init__(self, stream=None):
+    self.stream = stream or sys.stdout
+    self.enabled = self.stream.isatty() and (os.name != 'nt' or _enable_windows_ansi())
+    self.lines = []
+    self.rows = []
+    self.seen_writes = runtime_log.console_writes()
+
+  def render(self, lines):
+    if not self.enabled:
+      return
+    lines = list(lines)
+    columns, height = shutil.get_terminal_size()
+
+    with runtime_log.console_lock:
+      previous, previous_rows = self.lines, self.rows
+      # 历史从顶部裁掉时对齐到新列表的第一行
+      if lines and previous and lines[0] != previous[0] and lines[0] in previous:
+        dropped = previous.index(lines[0])
+        previous, previous_rows = previous[dropped:], previous_rows[dropped:]
+
+      common = 0
+      while common < min(len(lines), len(previous)) and lines[common] == previous[common]:
+        common += 1
+
+      output = []
+      erase_rows = sum(previous_rows[common:])
+      interrupted = runtime_log.console_writes() != self.seen_writes
+      if erase_rows and not interrupted and erase_rows < height:
+        # 光标移到第一处变化所在行的行首，清除到屏幕末尾
+        output.append(f"\x1b[{erase_rows}F\x1b[J")
+
+      rows = previous_rows[:common]
+      for line in lines[common:]:
+        output.append(line + "\n")
+        rows.append(max(1, -(-display_width(line) // max(1, columns))))
+
+      if output:
+        self.stream.write(''.join(output))
+        self.stream.flush()
+      self.lines, self.rows = lines, rows
+      self.seen_writes = runtime_log.console_writes()
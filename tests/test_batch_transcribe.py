@@ -0,0 +1,137 @@
+from types import SimpleNamespace
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("whisper")
+
+from whisper.audio import SAMPLE_RATE
+
+from batch_transcribe import ChunkManifest, bounded_submit, pending_chunks, split_at_silence
+
+
+def tone(seconds, level=0.1):
+  return np.full(int(seconds * SAMPLE_RATE), level, dtype=np.float32)
+
+
+def test_split_cuts_at_the_quietest_point_after_min_chunk():
+  audio = np.concatenate([tone(12), tone(0.3, 0.0), tone(12)])
+  chunks = split_at_silence(audio, max_chunk=20, min_chunk=5, silence_threshold=0.005)
+  assert len(chunks) == 2
+  assert 12.0 <= chunks[0][1] / SAMPLE_RATE <= 12.3
+  assert chunks[1][1] == len(audio)
+
+
+def test_split_skips_silent_chunks():
+  audio = np.concatenate([tone(10), tone(10, 0.0), tone(10)])
+  chunks = split_at_silence(audio, max_chunk=10, min_chunk=9, silence_threshold=0.005)
+  assert all(audio[start:end].max() > 0 for start, end in chunks)
+
+
+def test_split_hard_cuts_when_min_chunk_is_not_below_max_chunk():
+  audio = tone(25)
+  chunks = split_at_silence(audio, max_chunk=10, min_chunk=10, silence_threshold=0.005)
+  assert [round(end / SAMPLE_RATE) for _, end in chunks] == [10, 20, 25]
+
+
+def manifest_args(**overrides):
+  values = dict(model="tiny.en", language="en", translate=False, beam_size=1, tokens_per_second=10.0,
+                onnx=False, max_chunk=28.0, min_chunk=10.0, silence_threshold=0.005)
+  values.update(overrides)
+  return SimpleNamespace(**values)
+
+
+def make_manifest(tmp_path, **overrides):
+  source = tmp_path / "talk.wav"
+  if not source.exists():
+    source.write_bytes(b"audio")
+  return ChunkManifest(str(tmp_path / "talk.progress.json"), str(source), manifest_args(**overrides))
+
+
+def test_manifest_round_trip_resumes_pending_chunks(tmp_path):
+  manifest = make_manifest(tmp_path)
+  assert not manifest.load()
+  manifest.chunks = [(0, 100), (100, 200), (200, 300)]
+  manifest.save()
+  manifest.record(1, "hello", "en")
+  manifest.record_failure(2, "RuntimeError('boom')")
+
+  resumed = make_manifest(tmp_path)
+  assert resumed.load()
+  assert resumed.chunks == [(0, 100), (100, 200), (200, 300)]
+  assert resumed.results == {1: ("hello", "en")}
+  assert resumed.failed == {2: "RuntimeError('boom')"}
+  # 失败的块不算完成，下次运行重试
+  assert resumed.pending() == [0, 2]
+
+  resumed.record(2, "retried", "en")
+  assert resumed.failed == {}
+  assert not (tmp_path / "talk.progress.json.tmp").exists()
+
+
+def test_manifest_is_discarded_when_settings_change(tmp_path):
+  manifest = make_manifest(tmp_path)
+  manifest.chunks = [(0, 100)]
+  manifest.record(0, "hello", "en")
+  assert not make_manifest(tmp_path, model="base.en").load()
+  assert make_manifest(tmp_path).load()
+
+
+def test_unreadable_manifest_is_ignored(tmp_path):
+  manifest = make_manifest(tmp_path)
+  (tmp_path / "talk.progress.json").write_text("{not json", encoding="utf-8")
+  assert not manifest.load()
+
+
+def test_bounded_submit_limits_in_flight_tasks():
+  import threading
+  from concurrent.futures import ThreadPoolExecutor
+
+  lock = threading.Lock()
+  state = {'pulled': 0, 'running': 0, 'peak': 0}
+
+  def tasks():
+    for i in range(10):
+      state['pulled'] += 1
+      yield i, i
+
+  def work(i):
+    with lock:
+      state['running'] += 1
+      state['peak'] = max(state['peak'], state['running'])
+    try:
+      if i == 3:
+        raise ValueError("boom")
+      return i * 2
+    finally:
+      with lock:
+        state['running'] -= 1
+
+  results = {}
+  with ThreadPoolExecutor(max_workers=4) as pool:
+    for key, future in bounded_submit(pool, work, tasks(), limit=2):
+      # 在途任务之外最多只多取出一个任务
+      assert state['pulled'] <= len(results) + 3
+      results[key] = future.exception() or future.result()
+  assert sorted(results) == list(range(10))
+  assert isinstance(results[3], ValueError) and results[4] == 8
+  assert state['peak'] <= 2
+
+
+def test_pending_chunks_reads_only_unfinished_chunks(tmp_path):
+  cache = tmp_path / "talk.npy"
+  np.save(cache, np.arange(300, dtype=np.float32))
+  manifest = make_manifest(tmp_path)
+  manifest.chunks = [(0, 100), (100, 200), (200, 300)]
+  manifest.results = {1: ("done", "en")}
+  finished = make_manifest(tmp_path)
+  finished.chunks = [(0, 300)]
+  finished.results = {0: ("done", "en")}
+
+  tasks = list(pending_chunks([finished, manifest], [str(cache), str(cache)], "en"))
+  assert [key for key, _ in tasks] == [(1, 0), (1, 2)]
+  _, (file_index, chunk_index, audio, language) = tasks[1]
+  assert (file_index, chunk_index, language) == (1, 2, "en")
+  # 复制出的块不引用映射的整段音频
+  assert isinstance(audio, np.ndarray) and not isinstance(audio, np.memmap) and audio.base is None
+  assert np.array_equal(audio, np.arange(200, 300, dtype=np.float32))
@@ -0,0 +1,71 @@
+import pytest
+
+import caption_sinks
+from caption_sinks import CaptionFanout, CaptionSink
+
+
+class Recorder(CaptionSink):
+  def __init__(self):
+    self.texts = []
+    self.closed = False
+
+  def publish(self, text):
+    self.texts.append(text)
+
+  def close(self):
+    self.closed = True
+
+
+def record_errors(monkeypatch):
+  errors = []
+  monkeypatch.setattr(caption_sinks.log, "error", lambda message, *args: errors.append(message))
+  return errors
+
+
+def test_fanout_publishes_changed_text_once():
+  sink = Recorder()
+  fanout = CaptionFanout([sink])
+  assert fanout.publish("a")
+  assert not fanout.publish("a")
+  assert fanout.publish("a\nb")
+  assert sink.texts == ["a", "a\nb"]
+
+
+def test_failing_sink_does_not_stop_others(monkeypatch):
+  errors = record_errors(monkeypatch)
+
+  class Broken(CaptionSink):
+    def publish(self, text):
+      raise RuntimeError("boom")
+
+    def close(self):
+      raise RuntimeError("boom")
+
+  sink = Recorder()
+  fanout = CaptionFanout([Broken(), sink])
+  fanout.publish("a")
+  fanout.close()
+  assert sink.texts == ["a"]
+  assert sink.closed
+  assert len(errors) == 2
+
+
+def test_closing_fanout_with_caption_store_logs_no_error(monkeypatch):
+  pytest.importorskip("PyQt5")
+  hud = pytest.importorskip("hud")
+  errors = record_errors(monkeypatch)
+  store = hud.CaptionStore()
+  fanout = CaptionFanout()
+  fanout.add(store)
+  fanout.publish("hello")
+  fanout.close()
+  assert store.snapshot() == (1, "hello")
+  assert errors == []
+
+
+def test_writes_stdout_only_with_stdout_sink():
+  assert not caption_sinks.build_captions(None, headless=False).writes_stdout()
+  assert caption_sinks.build_captions(None, headless=True).writes_stdout()
+  assert caption_sinks.build_captions(["stdout"], headless=False).writes_stdout()
+  fanout = CaptionFanout([Recorder()])
+  assert not fanout.writes_stdout()
@@ -0,0 +1,60 @@
+from caption_state import APPEND, EVICT, REPLACE, CaptionState, change_dict
+
+
+def ops(changes):
+  return [(change.op, change.entry.id, change.entry.text) for change in changes]
+
+
+def test_final_results_append_new_lines():
+  state = CaptionState(max_lines=3)
+  assert ops(state.update("hello.")) == [(APPEND, 1, "hello.")]
+  assert ops(state.update("world.")) == [(APPEND, 2, "world.")]
+  assert state.lines() == ["hello.", "world."]
+
+
+def test_partial_tail_is_replaced_in_place():
+  state = CaptionState()
+  state.update("hello", partial=True)
+  changes = state.update("hello world.", partial=False)
+  assert ops(changes) == [(REPLACE, 1, "hello world.")]
+  assert state.tail.revision == 1
+  assert state.tail.final
+  assert len(state) == 1
+
+
+def test_identical_result_produces_no_change():
+  state = CaptionState()
+  state.update("same.")
+  assert state.update("same.") == []
+  assert state.update("") == []
+  assert state.update(" \n ") == []
+
+
+def test_finalizing_partial_without_new_text_is_a_replace():
+  state = CaptionState()
+  state.update("almost", partial=True)
+  changes = state.update("almost")
+  assert ops(changes) == [(REPLACE, 1, "almost")]
+  assert not state.tail.partial
+
+
+def test_oldest_line_is_evicted_at_capacity():
+  state = CaptionState(max_lines=2)
+  state.update("one.")
+  state.update("two.")
+  changes = state.update("three.")
+  assert ops(changes) == [(EVICT, 1, "one."), (APPEND, 3, "three.")]
+  assert state.text == "two.\nthree."
+
+
+def test_multiline_text_becomes_one_entry():
+  state = CaptionState()
+  state.update("first line\n  second line ")
+  assert state.lines() == ["first line second line"]
+
+
+def test_change_dict_includes_op_and_revision():
+  state = CaptionState()
+  state.update("a", partial=True)
+  change = state.update("ab", partial=True)[0]
+  assert change_dict(change) == {"id": 1, "revision": 1, "partial": True, "text": "ab", "op": REPLACE}
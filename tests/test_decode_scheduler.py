@@ -0,0 +1,56 @@
+import numpy as np
+
+from decode_scheduler import DeadlineScheduler
+
+
+def loaded_scheduler(rtf=1.0):
+  scheduler = DeadlineScheduler(live_latency=2.0, max_staleness=8.0, decode_overhead=0.1)
+  scheduler.record(0.1 + rtf * 1.0, 1.0)
+  return scheduler
+
+
+def test_decodes_live_before_any_measurement():
+  scheduler = DeadlineScheduler()
+  assert scheduler.plan(0.0, 3.0, 3.0, now=100.0) == DeadlineScheduler.LIVE
+
+
+def test_record_smooths_rtf():
+  scheduler = DeadlineScheduler(decode_overhead=0.0, smoothing=0.5)
+  scheduler.record(1.0, 1.0)
+  scheduler.record(0.0, 1.0)
+  assert scheduler.rtf == 0.5
+  scheduler.record(5.0, 0.0)  # 没有音频的记录被忽略
+  assert scheduler.rtf == 0.5
+
+
+def test_live_when_prediction_meets_deadline():
+  scheduler = loaded_scheduler(rtf=0.2)
+  # 截止时间 11.0，预计 10.0 + 0.1 + 0.2 完成
+  assert scheduler.plan(9.0, 10.0, 1.0, now=10.0) == DeadlineScheduler.LIVE
+
+
+def test_merges_once_per_window_then_decodes_late():
+  scheduler = loaded_scheduler(rtf=1.0)
+  assert scheduler.plan(7.0, 10.0, 3.0, now=11.0) == DeadlineScheduler.MERGE
+  # 调用方在该窗口清空前传入 merged=True：不再继续并入
+  assert scheduler.plan(7.0, 10.5, 3.5, now=11.05, merged=True) == DeadlineScheduler.LIVE
+  assert scheduler.plan(7.0, 10.6, 3.6, now=11.1, merged=True) == DeadlineScheduler.LIVE
+  assert scheduler.stats['merged'] == 1
+  assert scheduler.stats['late'] == 2
+
+
+def test_stale_window_is_demoted_even_if_never_merged():
+  scheduler = loaded_scheduler(rtf=1.0)
+  assert scheduler.plan(0.0, 5.0, 5.0, now=9.0) == DeadlineScheduler.BACKGROUND
+  assert scheduler.plan(0.0, 5.0, 5.0, now=9.0, merged=True) == DeadlineScheduler.BACKGROUND
+  assert scheduler.stats['demoted'] == 2
+
+
+def test_background_queue_is_bounded_and_ordered():
+  scheduler = DeadlineScheduler(max_background=2)
+  for start in (1.0, 2.0, 3.0):
+    scheduler.demote(np.zeros(10, dtype=np.float32), start)
+  windows = scheduler.take_background(max_windows=5)
+  assert [start for start, _ in windows] == [2.0, 3.0]
+  assert scheduler.take_background() == []
+  assert scheduler.stats['background_decoded'] == 2
@@ -0,0 +1,163 @@
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("whisper")
+from inference_worker import InferenceWorker
+
+
+class FakeConnection:
+  """代替到工作进程的管道：收到命令后由 handler 生成回复，handler 返回 None 表示暂不回复"""
+
+  def __init__(self, handler):
+    self.handler = handler
+    self.sent = []
+    self.replies = []
+
+  def send(self, msg):
+    self.sent.append(msg)
+    reply = self.handler(msg)
+    if reply is not None:
+      self.replies.append(reply)
+
+  def poll(self, timeout=0):
+    return bool(self.replies)
+
+  def recv(self):
+    return self.replies.pop(0)
+
+
+class FakeProcess:
+  def __init__(self, alive=True):
+    self.alive = alive
+    self.exitcode = None if alive else -9
+
+  def is_alive(self):
+    return self.alive
+
+
+def connected_worker(handler, **attrs):
+  worker = InferenceWorker.__new__(InferenceWorker)
+  worker.request_id = 0
+  worker.restarts = 0
+  worker.settings = None
+  worker.written = 0
+  worker.conn = FakeConnection(handler)
+  worker.process = FakeProcess()
+  worker.cancel_event = SimpleNamespace(clear=lambda: None, set=lambda: None)
+  for name, value in attrs.items():
+    setattr(worker, name, value)
+  return worker
+
+
+def make_worker(messages, replies=None):
+  # 不启动工作进程，只记录发出的命令
+  worker = InferenceWorker.__new__(InferenceWorker)
+  worker.written = 1600
+  replies = list(replies or [])
+
+  def request(make_message, cancel_token=None):
+    messages.append(make_message(len(messages) + 1))
+    return replies.pop(0) if replies else None
+  worker._request = request
+  return worker
+
+
+def test_decode_forwards_use_context():
+  messages = []
+  make_worker(messages).decode(None, 800, "en", use_context=False)
+  assert messages == [('decode', 1, 1600, 800, "en", False)]
+
+
+def test_decode_detects_before_choosing_language():
+  messages = []
+  worker = make_worker(messages, replies=[{"en": 0.6, "zh": 0.4}, "result"])
+  assert worker.decode(None, 800, None, choose_language=lambda probs: "zh") == "result"
+  assert messages == [('detect', 1, 1600), ('decode', 2, 1600, 800, "zh", True)]
+
+
+def test_apply_settings_records_what_the_worker_applied():
+  # 工作进程拒绝了不兼容的模型，缓存键应使用实际生效的模型
+  worker = connected_worker(lambda msg: ('result', msg[1], ("large", 1)), model_name="large", beam_size=5)
+  worker.apply_settings({'model': "medium", 'beam_size': 1})
+  assert worker.conn.sent == [('settings', 1, {'model': "medium", 'beam_size': 1})]
+  assert (worker.model_name, worker.beam_size) == ("large", 1)
+  assert worker.settings == {'model': "medium", 'beam_size': 1}
+
+
+def test_cancel_token_stops_decode_in_worker():
+  import threading
+  from whisper_backend import CancellationToken, DecodeCancelled
+
+  cancel_event = threading.Event()
+  token = CancellationToken()
+
+  def handler(msg):
+    # 解码进行中被取代，工作进程在下一个解码步看到 cancel_event 后回复取消
+    token.cancel("superseded")
+    return None
+  worker = connected_worker(handler, cancel_event=cancel_event)
+  real_poll = worker.conn.poll
+
+  def poll(timeout=0):
+    if cancel_event.is_set() and not worker.conn.replies:
+      worker.conn.replies.append(('cancelled', worker.request_id, "cancelled"))
+    return real_poll(timeout)
+  worker.conn.poll = poll
+
+  with pytest.raises(DecodeCancelled, match="superseded"):
+    worker.decode(None, 800, "en", cancel_token=token)
+  assert cancel_event.is_set()
+  assert len(worker.conn.sent) == 1
+
+
+def test_dead_worker_is_restarted_and_request_retried_once():
+  worker = connected_worker(lambda msg: None)
+  worker.process = FakeProcess(alive=False)
+  connections = [worker.conn]
+
+  def start():
+    worker.conn = FakeConnection(lambda msg: ('result', msg[1], "text"))
+    worker.process = FakeProcess()
+    connections.append(worker.conn)
+  worker._start = start
+
+  assert worker.decode(None, 800, "en") == "text"
+  assert worker.restarts == 1
+  # 崩溃前发出一次，重启后重试一次
+  assert [conn.sent for conn in connections] == [[('decode', 1, 0, 800, "en", True)], [('decode', 2, 0, 800, "en", True)]]
+
+
+def test_shared_memory_ring_round_trip():
+  from multiprocessing import shared_memory
+
+  import numpy as np
+  from inference_worker import _read_ring
+
+  capacity = 10
+  worker = InferenceWorker.__new__(InferenceWorker)
+  worker.capacity = capacity
+  worker.written = 0
+  worker.shm = shared_memory.SharedMemory(create=True, size=capacity * 4)
+  # 工作进程按名字连接同一块共享内存
+  other = shared_memory.SharedMemory(name=worker.shm.name)
+  try:
+    worker.ring = np.ndarray((capacity,), dtype=np.float32, buffer=worker.shm.buf)
+    ring = np.ndarray((capacity,), dtype=np.float32, buffer=other.buf)
+    audio = np.arange(25, dtype=np.float32)
+
+    assert worker.accept(audio[:7]) == 7
+    assert np.array_equal(_read_ring(ring, 0, 7), audio[:7])
+    # 跨过缓冲末尾写入
+    worker.accept(audio[7:12])
+    assert np.array_equal(_read_ring(ring, 5, 12), audio[5:12])
+    # 超过容量时只保留最后 capacity 个采样
+    assert worker.accept(audio[12:25]) == capacity
+    assert worker.written == 25
+    assert np.array_equal(_read_ring(ring, 15, 25), audio[15:25])
+    del ring
+    del worker.ring
+  finally:
+    other.close()
+    worker.shm.close()
+    worker.shm.unlink()
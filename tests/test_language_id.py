@@ -0,0 +1,59 @@
+from language_id import LanguageIdManager
+
+
+def probs(top, confidence, other="en"):
+  return {top: confidence, other: 1.0 - confidence}
+
+
+def test_locks_on_first_confident_detection():
+  manager = LanguageIdManager(min_confidence=0.6)
+  assert manager.language_for_decode(now=0.0) is None
+  assert manager.observe(probs("zh", 0.5), now=0.0) is None
+  assert manager.observe(probs("zh", 0.9), now=1.0) == "zh"
+  assert manager.language_for_decode(now=2.0) == "zh"
+
+
+def test_recheck_and_silence_require_detection():
+  manager = LanguageIdManager(recheck_interval=30.0, silence_reset=10.0)
+  manager.observe(probs("zh", 0.9), now=1.0)
+  manager.mark_speech(now=1.0)
+  assert manager.language_for_decode(now=5.0) == "zh"
+  assert manager.language_for_decode(now=12.0) is None  # 长时间静音
+  manager.mark_speech(now=25.0)
+  assert manager.language_for_decode(now=26.0) == "zh"
+  assert manager.language_for_decode(now=31.0) is None  # 定期复查
+
+
+def test_switch_needs_consecutive_confident_votes():
+  manager = LanguageIdManager(switch_confidence=0.8, switch_margin=0.3, switch_votes=2)
+  manager.observe(probs("zh", 0.9, other="ja"), now=0.0)
+  assert manager.observe(probs("en", 0.95, other="zh"), now=1.0) == "zh"
+  assert manager.candidate == "en"
+  # 候选语言待定期间每个窗口都重新识别
+  assert manager.language_for_decode(now=1.5) is None
+  assert manager.observe(probs("en", 0.95, other="zh"), now=2.0) == "en"
+  assert manager.candidate is None
+
+
+def test_weak_or_interrupted_votes_do_not_switch():
+  manager = LanguageIdManager(switch_confidence=0.8, switch_votes=2)
+  manager.observe(probs("zh", 0.9), now=0.0)
+  manager.observe(probs("en", 0.95, other="zh"), now=1.0)
+  manager.observe(probs("zh", 0.9), now=2.0)  # 打断候选
+  assert manager.observe(probs("en", 0.95, other="zh"), now=3.0) == "zh"
+  assert manager.observe(probs("en", 0.7, other="zh"), now=4.0) == "zh"  # 置信度不够
+  assert manager.language == "zh"
+
+
+def test_resolve_keeps_locked_language_for_ambiguous_window():
+  manager = LanguageIdManager()
+  assert manager.resolve(probs("zh", 0.9), now=0.0) == "zh"
+  # 单个窗口识别为英文时仍用已锁定的中文解码
+  assert manager.resolve(probs("en", 0.95, other="zh"), now=1.0) == "zh"
+  assert manager.resolve(probs("en", 0.55, other="zh"), now=2.0) == "zh"
+
+
+def test_resolve_uses_detection_before_lock():
+  manager = LanguageIdManager(min_confidence=0.6)
+  assert manager.resolve(probs("ja", 0.5), now=0.0) == "ja"
+  assert manager.language is None
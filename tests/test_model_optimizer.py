@@ -0,0 +1,45 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("whisper")
+
+from whisper.audio import N_FRAMES
+
+from model_optimizer import OptimizedEncoder, encoder_buckets
+
+
+class Recorder(torch.nn.Module):
+  def __init__(self, scale):
+    super().__init__()
+    self.scale = scale
+    self.shapes = []
+
+  def forward(self, mel):
+    self.shapes.append(tuple(mel.shape))
+    return mel * self.scale
+
+
+def test_encoder_buckets_cover_max_batch_size():
+  assert encoder_buckets(1) == (1,)
+  assert encoder_buckets(8) == (1, 2, 4, 8)
+  assert encoder_buckets(6) == (1, 2, 4, 6)
+  assert encoder_buckets(0) == (1,)
+
+
+def test_smaller_batches_are_padded_to_the_next_bucket():
+  eager, graph = Recorder(1), Recorder(2)
+  encoder = OptimizedEncoder(eager, {1: Recorder(2), 4: graph})
+  mel = torch.ones((3, 2, N_FRAMES))
+  out = encoder(mel)
+  assert graph.shapes == [(4, 2, N_FRAMES)]
+  assert out.shape == (3, 2, N_FRAMES)
+  assert torch.equal(out, mel * 2)
+  assert eager.shapes == []
+
+
+def test_oversized_batches_and_short_windows_use_eager_encoder():
+  eager = Recorder(1)
+  encoder = OptimizedEncoder(eager, {1: Recorder(2), 2: Recorder(2)})
+  encoder(torch.ones((3, 2, N_FRAMES)))
+  encoder(torch.ones((1, 2, 100)))
+  assert eager.shapes == [(3, 2, N_FRAMES), (1, 2, 100)]
@@ -0,0 +1,67 @@
+from types import SimpleNamespace
+
+import pytest
+
+torch = pytest.importorskip("torch")
+np = pytest.importorskip("numpy")
+pytest.importorskip("whisper")
+pytest.importorskip("onnxruntime")
+
+from whisper.audio import N_SAMPLES
+from whisper.model import ModelDimensions, Whisper
+
+from onnx_backend import ONNXWhisperBackend, ONNXWhisperModel, export_model
+from whisper_backend import OpenAIWhisperBackend
+
+
+@pytest.fixture(scope="module")
+def models(tmp_path_factory):
+  torch.manual_seed(0)
+  dims = ModelDimensions(n_mels=80, n_audio_ctx=1500, n_audio_state=64, n_audio_head=2, n_audio_layer=1,
+                         n_vocab=51864, n_text_ctx=448, n_text_state=64, n_text_head=2, n_text_layer=2)
+  model = Whisper(dims).eval()
+  for param in model.parameters():
+    torch.nn.init.normal_(param, std=0.05)
+  model_dir = str(tmp_path_factory.mktemp("onnx"))
+  export_model(model, model_dir)
+  return model, ONNXWhisperModel(model_dir, intra_op_threads=1)
+
+
+def test_cached_steps_match_full_pytorch_decoder(models):
+  model, onnx_model = models
+  mel = torch.randn(2, 80, 3000)
+  tokens = torch.randint(0, 50000, (2, 7))
+  with torch.no_grad():
+    expected = model.decoder(tokens, model.encoder(mel))[:, -1].numpy()
+
+  cross_kv = onnx_model.encode(mel.numpy())
+  np.testing.assert_allclose(onnx_model.logits(tokens.numpy(), cross_kv), expected, atol=1e-4)
+  # 先填充前四个token，之后每步只送入一个token
+  logits, cache = onnx_model.step(tokens.numpy()[:, :4], cross_kv, onnx_model.empty_cache(2))
+  for i in range(4, 7):
+    logits, cache = onnx_model.step(tokens.numpy()[:, i:i + 1], cross_kv, cache)
+  np.testing.assert_allclose(logits, expected, atol=1e-4)
+
+
+def test_greedy_decode_matches_pytorch_and_feeds_one_token_per_step(models):
+  model, onnx_model = models
+  args = SimpleNamespace(model="random", translate=False, no_fp16=True, beam_size=1, tokens_per_second=0)
+  audio = np.random.default_rng(0).normal(0, 0.1, N_SAMPLES).astype(np.float32)
+
+  fed = []
+  step = onnx_model.step
+
+  def record(tokens, cross_kv, past_kv):
+    fed.append(tokens.shape[1])
+    return step(tokens, cross_kv, past_kv)
+  onnx_model.step = record
+  try:
+    result = ONNXWhisperBackend(onnx_model, args, "cpu").decode_audio(audio, "en")
+  finally:
+    del onnx_model.step
+
+  expected = OpenAIWhisperBackend(model, args, "cpu").decode_audio(audio, "en")
+  assert result['tokens'] == expected['tokens']
+  assert result['text'] == expected['text']
+  assert len(fed) > 1 and fed[0] > 1
+  assert set(fed[1:]) == {1}
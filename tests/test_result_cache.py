@@ -0,0 +1,38 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from result_cache import DecodeResultCache
+
+PARAMS = {'model': "tiny.en", 'beam_size': 1, 'task': "transcribe", 'language': "en"}
+
+
+def test_key_depends_on_audio_and_params():
+  cache = DecodeResultCache()
+  audio = np.linspace(-1, 1, 1600, dtype=np.float32)
+  key = cache.key(audio, PARAMS)
+  assert key == cache.key(audio.copy(), dict(reversed(list(PARAMS.items()))))
+  assert key == cache.key(audio.astype(np.float64), PARAMS)
+  assert key != cache.key(audio[:-1], PARAMS)
+  assert key != cache.key(audio, dict(PARAMS, language="de"))
+
+
+def test_least_recently_used_entry_is_evicted():
+  cache = DecodeResultCache(max_entries=2)
+  cache.put("a", {'text': "a"})
+  cache.put("b", {'text': "b"})
+  assert cache.get("a") == {'text': "a"}
+  cache.put("c", {'text': "c"})
+  assert cache.get("b") is None
+  assert cache.get("a") is not None and cache.get("c") is not None
+  assert len(cache) == 2
+
+
+def test_hit_rate_counts_lookups():
+  cache = DecodeResultCache()
+  assert cache.hit_rate == 0.0
+  cache.get("missing")
+  cache.put("k", {'text': ""})
+  cache.get("k")
+  assert (cache.hits, cache.misses) == (1, 1)
+  assert cache.stats() == "1 hits / 1 misses (50%), 1 entries"
@@ -0,0 +1,67 @@
+from types import SimpleNamespace
+
+from rtf_governor import MODEL_FALLBACKS, RealtimeGovernor, build_levels
+
+
+def make_args(model="small.en", beam_size=5):
+  return SimpleNamespace(model=model, beam_size=beam_size)
+
+
+def test_build_levels_steps_down_one_cost_at_a_time():
+  levels = build_levels(make_args())
+  assert [level['name'] for level in levels] == ['normal', 'slow-cadence', 'greedy', 'model-base.en']
+  assert levels[-1]['beam_size'] == 1
+  assert levels[-1]['decode_interval'] == 1.0
+
+
+def test_build_levels_skips_greedy_without_beam_search():
+  names = [level['name'] for level in build_levels(make_args(beam_size=1))]
+  assert 'greedy' not in names
+
+
+def test_large_has_no_fallback():
+  # large-v3 使用 128 维 mel，medium 是 80 维，不能降级过去
+  assert "large" not in MODEL_FALLBACKS
+  assert [level['name'] for level in build_levels(make_args(model="large", beam_size=1))] == ['normal', 'slow-cadence']
+
+
+def feed(governor, rtf, n, now, queue_depth=0):
+  settings = None
+  for _ in range(n):
+    settings = governor.record(rtf, 1.0, queue_depth, now=now) or settings
+  return settings
+
+
+def test_steps_down_when_overloaded_and_holds():
+  governor = RealtimeGovernor(build_levels(make_args()), window=4, hold_time=5.0)
+  assert feed(governor, 1.0, 1, now=100.0) is None  # 样本不足
+  settings = feed(governor, 1.0, 2, now=100.0)
+  assert settings['name'] == 'slow-cadence'
+
+  # 保持时间内不再切换
+  assert feed(governor, 1.0, 4, now=102.0) is None
+  assert governor.level == 1
+  assert feed(governor, 1.0, 2, now=106.0)['name'] == 'greedy'
+
+
+def test_queue_depth_alone_triggers_step_down():
+  governor = RealtimeGovernor(build_levels(make_args()), window=4, high_queue=60)
+  assert feed(governor, 0.5, 2, now=100.0, queue_depth=100)['name'] == 'slow-cadence'
+
+
+def test_steps_back_up_when_load_recovers():
+  governor = RealtimeGovernor(build_levels(make_args()), window=4, hold_time=5.0)
+  feed(governor, 1.0, 2, now=100.0)
+  assert governor.level == 1
+  # 介于上下阈值之间时保持不变
+  assert feed(governor, 0.6, 4, now=110.0) is None
+  assert feed(governor, 0.1, 2, now=120.0)['name'] == 'normal'
+  assert governor.level == 0
+
+
+def test_never_steps_past_last_level():
+  levels = build_levels(make_args(beam_size=1))
+  governor = RealtimeGovernor(levels, window=2, hold_time=0.0)
+  for step in range(10):
+    feed(governor, 2.0, 2, now=100.0 + step)
+  assert governor.level == len(levels) - 1
@@ -0,0 +1,73 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+torch = pytest.importorskip("torch")
+pytest.importorskip("whisper")
+
+from whisper.audio import HOP_LENGTH, N_FFT, N_FRAMES, SAMPLE_RATE, mel_filters
+
+from streaming_features import PAD_LOG_VALUE, StreamingLogMel
+
+
+def reference_log10_mel(audio, n_mels=80):
+  """whisper.audio.log_mel_spectrogram 中归一化之前的 log10 mel，形状 (帧, n_mels)"""
+  stft = torch.stft(torch.from_numpy(audio), N_FFT, HOP_LENGTH, window=torch.hann_window(N_FFT), return_complex=True)
+  magnitudes = stft[..., :-1].abs() ** 2
+  mel_spec = mel_filters("cpu", n_mels) @ magnitudes
+  return mel_spec.clamp(min=1e-10).log10().T.numpy()
+
+
+def speech_like(seconds, seed=0):
+  rng = np.random.default_rng(seed)
+  t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+  return (0.3 * np.sin(2 * np.pi * 220 * t) + 0.05 * rng.standard_normal(len(t))).astype(np.float32)
+
+
+def test_incremental_features_match_whisper():
+  audio = speech_like(2.0)
+  stream = StreamingLogMel()
+  for start in range(0, len(audio), 512):
+    stream.accept(audio[start:start + 512])
+  reference = reference_log10_mel(audio)
+  # 末尾几帧在 whisper 中用反射填充补齐，流式计算要等后续音频
+  n = len(stream) - 2
+  assert n > 150
+  np.testing.assert_allclose(stream.features()[:n], reference[:n], atol=1e-3)
+
+
+def test_chunking_does_not_change_features():
+  audio = speech_like(1.0, seed=1)
+  whole = StreamingLogMel()
+  whole.accept(audio)
+  pieces = StreamingLogMel()
+  for start in range(0, len(audio), 100):
+    pieces.accept(audio[start:start + 100])
+  assert len(whole) == len(pieces)
+  np.testing.assert_allclose(whole.features(), pieces.features(), atol=1e-5)
+
+
+def test_discard_keeps_features_aligned_with_samples():
+  audio = speech_like(1.0, seed=2)
+  stream = StreamingLogMel()
+  stream.accept(audio)
+  before = stream.features()
+  stream.discard(HOP_LENGTH * 10 + HOP_LENGTH // 2)
+  stream.discard(HOP_LENGTH // 2)
+  np.testing.assert_array_equal(stream.features(), before[11:])
+
+
+def test_ring_buffer_keeps_most_recent_frames():
+  stream = StreamingLogMel(max_seconds=1)
+  stream.accept(speech_like(3.0, seed=3))
+  assert len(stream) == stream.max_frames == 100
+
+
+def test_log_mel_pads_to_full_window():
+  stream = StreamingLogMel()
+  stream.accept(speech_like(0.5, seed=4))
+  mel = stream.log_mel()
+  assert mel.shape == (80, N_FRAMES)
+  assert mel.dtype == np.float32
+  # 补齐部分取静音值，再与真实帧一起做动态范围压缩（不低于最大值减 8）
+  floor = max(PAD_LOG_VALUE, stream.features().max() - 8.0)
+  np.testing.assert_allclose(mel[:, len(stream):], (floor + 4.0) / 4.0)
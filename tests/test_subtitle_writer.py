@@ -0,0 +1,46 @@
+from subtitle_writer import SubtitleWriter, format_cue, format_timestamp, subtitle_format
+
+
+def test_format_timestamp():
+  assert format_timestamp(0) == "00:00:00,000"
+  assert format_timestamp(3723.4567) == "01:02:03,457"
+  assert format_timestamp(1.5, ".") == "00:00:01.500"
+  assert format_timestamp(-2) == "00:00:00,000"
+
+
+def test_format_cue_srt_and_vtt():
+  assert format_cue("srt", 3, 1.0, 2.5, " hello ") == "3\n00:00:01,000 --> 00:00:02,500\nhello\n\n"
+  assert format_cue("vtt", 3, 1.0, 2.5, "a --> b") == "00:00:01.000 --> 00:00:02.500\na -> b\n\n"
+
+
+def test_subtitle_format_from_extension():
+  assert subtitle_format("out.VTT") == "vtt"
+  assert subtitle_format("out.srt") == "srt"
+  assert subtitle_format("out.txt") == "srt"
+
+
+def test_srt_writer_numbers_cues_relative_to_origin(tmp_path):
+  path = tmp_path / "captions.srt"
+  writer = SubtitleWriter(str(path), origin=100.0)
+  writer.add(101.0, 102.0, "first")
+  writer.add(103.0, 103.0, "zero length")
+  writer.add(104.0, 105.0, "   ")
+  writer.add_segments(110.0, [{'start': 0.0, 'end': 1.0, 'text': "seg"}])
+  writer.close()
+  assert path.read_text(encoding="utf-8") == (
+    "1\n00:00:01,000 --> 00:00:02,000\nfirst\n\n"
+    "2\n00:00:03,000 --> 00:00:03,100\nzero length\n\n"
+    "3\n00:00:10,000 --> 00:00:11,000\nseg\n\n")
+
+
+def test_vtt_writer_keeps_cues_in_start_order(tmp_path):
+  path = tmp_path / "captions.vtt"
+  writer = SubtitleWriter(str(path), origin=0.0)
+  writer.add(5.0, 6.0, "live")
+  # 延迟完成的后台窗口采集得更早，保持时长挪到上一条的开始时间
+  writer.add(2.0, 4.0, "late")
+  writer.close()
+  assert path.read_text(encoding="utf-8") == (
+    "WEBVTT\n\n"
+    "00:00:05.000 --> 00:00:06.000\nlive\n\n"
+    "00:00:05.000 --> 00:00:07.000\nlate\n\n")
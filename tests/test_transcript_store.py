@@ -0,0 +1,65 @@
+import sqlite3
+
+import pytest
+
+from transcript_store import TranscriptStore, connect, has_fts, list_sessions, search
+
+
+def fill(path):
+  first = TranscriptStore(path, program="transcribe", batch_seconds=0.01)
+  first.add(10.0, 11.0, " budget review today ", source="mic")
+  first.add(12.0, 13.0, "   ")
+  first.close()
+  second = TranscriptStore(path, program="multi", batch_seconds=0.01)
+  second.add(20.0, 21.0, "the budget is approved", source="system")
+  second.add(22.0, 23.0, "unrelated words", source="mic")
+  second.close()
+  return first.session, second.session
+
+
+def test_sessions_are_listed_newest_first_with_counts(tmp_path):
+  path = str(tmp_path / "store" / "transcripts.db")
+  first, second = fill(path)
+  sessions = list_sessions(path)
+  assert [(session, program, count) for session, _, program, count in sessions] == [(second, "multi", 2), (first, "transcribe", 1)]
+
+
+def test_search_across_and_within_sessions(tmp_path):
+  path = str(tmp_path / "transcripts.db")
+  first, second = fill(path)
+  rows = search(path, "budget")
+  assert sorted((session, source, text) for session, _, _, source, text in rows) == [
+    (first, "mic", "budget review today"), (second, "system", "the budget is approved")]
+  assert [row[4] for row in search(path, "budget", session=second)] == ["the budget is approved"]
+  assert search(path, "budget", limit=1)[0][4] in ("budget review today", "the budget is approved")
+  assert search(path, "missing") == []
+
+
+def test_search_falls_back_to_substring_match_without_fts(tmp_path):
+  path = str(tmp_path / "transcripts.db")
+  fill(path)
+  conn = connect(path)
+  conn.execute("DROP TABLE IF EXISTS captions_fts")
+  conn.commit()
+  assert not has_fts(conn)
+  conn.close()
+  rows = search(path, "udge")
+  assert [row[4] for row in rows] == ["the budget is approved", "budget review today"]
+
+
+def test_search_is_read_only(tmp_path):
+  path = str(tmp_path / "missing.db")
+  with pytest.raises(sqlite3.OperationalError):
+    search(path, "anything")
+  assert not (tmp_path / "missing.db").exists()
+
+
+def test_fts_index_is_rebuilt_for_existing_captions(tmp_path):
+  path = str(tmp_path / "transcripts.db")
+  fill(path)
+  conn = connect(path)
+  conn.executescript("DROP TRIGGER captions_fts_insert; DROP TABLE captions_fts;")
+  conn.close()
+  # 重新连接时为已有字幕建立索引
+  connect(path).close()
+  assert sorted(row[4] for row in search(path, "budget")) == ["budget review today", "the budget is approved"]
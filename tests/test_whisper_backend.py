@@ -0,0 +1,114 @@
+from types import SimpleNamespace
+
+import pytest
+
+whisper_backend = pytest.importorskip("whisper_backend")
+
+
+def fake_model(n_mels):
+  return SimpleNamespace(dims=SimpleNamespace(n_mels=n_mels))
+
+
+def make_backend(model):
+  args = SimpleNamespace(model="large", translate=False, no_fp16=True, beam_size=1)
+  return whisper_backend.OpenAIWhisperBackend(model, args, "cpu")
+
+
+def test_apply_settings_refuses_model_with_different_mel_size(monkeypatch):
+  loaded = []
+
+  def load_model(name, device, args):
+    loaded.append(name)
+    return fake_model(80)
+  monkeypatch.setattr(whisper_backend, "load_model", load_model)
+
+  backend = make_backend(fake_model(128))
+  backend.apply_settings({'model': "medium", 'beam_size': 1})
+  assert backend.model_name == "large"
+  assert backend.model.dims.n_mels == 128
+
+  # 不兼容的模型只加载一次
+  backend.apply_settings({'model': "medium", 'beam_size': 1})
+  assert loaded == ["medium"]
+
+
+def test_apply_settings_switches_and_restores_same_mel_model(monkeypatch):
+  monkeypatch.setattr(whisper_backend, "load_model", lambda name, device, args: fake_model(80))
+  original = fake_model(80)
+  backend = make_backend(original)
+  backend.apply_settings({'model': "small"})
+  assert backend.model_name == "small"
+  backend.apply_settings({'model': "large"})
+  assert backend.model is original
+
+
+def test_prefix_cache_commits_agreed_tokens_minus_holdback():
+  cache = whisper_backend.TokenPrefixCache(holdback=2)
+  assert cache.update([1, 2, 3, 4]) == 0
+  assert cache.prefix() == []
+  # 前四个token两次一致，末尾两个暂不确认
+  assert cache.update([1, 2, 3, 4, 5]) == 2
+  assert cache.prefix() == [1, 2]
+  assert cache.update([1, 2, 3, 4, 5, 6]) == 1
+  assert cache.prefix() == [1, 2, 3]
+  # 假设改变时已确认的前缀保持不变
+  assert cache.update([1, 2, 9]) == 0
+  assert cache.prefix() == [1, 2, 3]
+  cache.reset()
+  assert cache.prefix() == []
+
+
+def test_prefix_cache_limits_committed_tokens():
+  cache = whisper_backend.TokenPrefixCache(holdback=0, max_tokens=3)
+  cache.update(list(range(10)))
+  cache.update(list(range(10)))
+  assert cache.prefix() == [0, 1, 2]
+
+
+def test_repeated_tail_finds_start_of_loop():
+  assert whisper_backend.repeated_tail([1, 2, 3, 4]) is None
+  assert whisper_backend.repeated_tail([5, 7, 7, 7]) is None
+  # 重复部分保留一次，从第二次出现开始截掉
+  assert whisper_backend.repeated_tail([5, 7, 7, 7, 7]) == 2
+  assert whisper_backend.repeated_tail([9, 1, 2, 1, 2, 1, 2, 1, 2, 1, 2]) == 3
+
+
+def test_token_budget_scales_with_audio_duration():
+  model = SimpleNamespace(dims=SimpleNamespace(n_mels=80, n_text_ctx=448))
+  backend = make_backend(model)
+  assert backend.token_budget(16000 * 2) == backend.budget_base_tokens + 20
+  assert backend.token_budget(16000 * 60) == 224
+  backend.tokens_per_second = 0
+  assert backend.token_budget(16000) is None
+
+
+def test_repetition_stop_skips_finished_rows_and_tracks_each_audio():
+  torch = pytest.importorskip("torch")
+  eot = 9
+  stop = whisper_backend.RepetitionStop(eot, sample_begin=1, n_group=2)
+  tokens = torch.tensor([
+    [0, 1, 2, 3, 4, 5, 6],
+    [0, 5, 5, 5, 5, 5, 5],
+    [0, 5, 5, 5, 5, 5, eot],
+    [0, 1, 2, 3, 4, 5, 6],
+  ])
+  logits = torch.zeros(4, 10)
+  stop.apply(logits, tokens)
+  # 只有第二行（第一段音频）被强制结束，已结束的第三行不受影响
+  assert stop.triggered == {0}
+  assert logits[1, eot] == 0 and logits[1, 0] == -float("inf")
+  assert (logits[[0, 2, 3]] == 0).all()
+
+
+def test_check_budget_recomputes_compression_ratio_after_trim(monkeypatch):
+  model = SimpleNamespace(dims=SimpleNamespace(n_mels=80, n_text_ctx=448))
+  backend = make_backend(model)
+  tokenizer = SimpleNamespace(decode=lambda tokens: "hello world")
+  monkeypatch.setattr(backend, "tokenizer", lambda language: tokenizer)
+  # 整体压缩率很高，但截掉末尾重复后剩下的文本正常
+  decoded = SimpleNamespace(tokens=[1, 2, 7, 7, 7, 7, 7, 7], text="x", language="en", compression_ratio=10.0)
+  tokens, text = backend.check_budget(decoded, None, True)
+  assert tokens == [1, 2, 7]
+  assert text == "hello world"
+  assert backend.budget_stats['repetition_stop'] == 1
+  assert backend.budget_stats['compression_drop'] == 0
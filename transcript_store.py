@@ -0,0 +1,187 @@
+#! python3.7
+
+import argparse
+import os
+import queue
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from runtime_log import get_logger, setup_logging
+
+log = get_logger("transcript_store")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+  id INTEGER PRIMARY KEY,
+  started REAL NOT NULL,
+  program TEXT
+);
+CREATE TABLE IF NOT EXISTS captions (
+  id INTEGER PRIMARY KEY,
+  session INTEGER NOT NULL REFERENCES sessions(id),
+  start_time REAL NOT NULL,
+  end_time REAL NOT NULL,
+  source TEXT,
+  text TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS captions_session ON captions(session, start_time);
+"""
+
+# 外部内容的全文索引，随 captions 的插入由触发器同步
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS captions_fts USING fts5(text, content='captions', content_rowid='id');
+CREATE TRIGGER IF NOT EXISTS captions_fts_insert AFTER INSERT ON captions BEGIN
+  INSERT INTO captions_fts(rowid, text) VALUES (new.id, new.text);
+END;
+"""
+
+
+def connect(path):
+  conn = sqlite3.connect(path, check_same_thread=False)
+  conn.execute("PRAGMA journal_mode=WAL")
+  conn.execute("PRAGMA synchronous=NORMAL")
+  conn.executescript(SCHEMA)
+  try:
+    created = not has_fts(conn)
+    conn.executescript(FTS_SCHEMA)
+    # 旧库里已有的字幕不会经过触发器，首次建立索引时从 captions 重建
+    if created and conn.execute("SELECT 1 FROM captions LIMIT 1").fetchone() is not None:
+      conn.execute("INSERT INTO captions_fts(captions_fts) VALUES('rebuild')")
+      conn.commit()
+  except sqlite3.OperationalError as e:
+    log.warning(f"SQLite FTS5 not available ({e}), search falls back to LIKE")
+  return conn
+
+
+def has_fts(conn):
+  return conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'captions_fts'").fetchone() is not None
+
+
+class TranscriptStore:
+  """
+  把确认的字幕追加到 SQLite 转录库，每次运行是一个会话，所有会话都可以全文检索。
+  转录线程只把条目放进队列；写入线程攒够 batch_seconds 秒或 batch_size 条后在一个事务里提交，
+  WAL 模式下检索不会阻塞写入。内存中只需保留最近的几条字幕。
+  """
+
+  def __init__(self, path, program=None, batch_seconds=1.0, batch_size=200):
+    self.path = path
+    self.batch_seconds = batch_seconds
+    self.batch_size = batch_size
+    self.count = 0
+
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    self.conn = connect(path)
+    with self.conn:
+      self.session = self.conn.execute("INSERT INTO sessions (started, program) VALUES (?, ?)",
+                                       (time.time(), program)).lastrowid
+
+    self.queue = queue.SimpleQueue()
+    self.thread = threading.Thread(target=self._run, name="transcript-store", daemon=True)
+    self.thread.start()
+    log.info(f"Saving transcript to {path} (session {self.session})")
+
+  def add(self, capture_start, capture_end, text, source=None):
+    """capture_start / capture_end 为 time.time() 时间轴上的采集时间"""
+    if text and text.strip():
+      self.queue.put((self.session, capture_start, capture_end, source, text.strip()))
+
+  def _run(self):
+    closing = False
+    while not closing:
+      item = self.queue.get()
+      if item is None:
+        break
+      batch = [item]
+      # 第一条到达后继续收集，最多等待 batch_seconds 秒
+      deadline = time.time() + self.batch_seconds
+      while len(batch) < self.batch_size:
+        try:
+          item = self.queue.get(timeout=max(0.0, deadline - time.time()))
+        except queue.Empty:
+          break
+        if item is None:
+          closing = True
+          break
+        batch.append(item)
+      self._commit(batch)
+    self.conn.close()
+
+  def _commit(self, batch):
+    try:
+      with self.conn:
+        self.conn.executemany("INSERT INTO captions (session, start_time, end_time, source, text) VALUES (?, ?, ?, ?, ?)", batch)
+      self.count += len(batch)
+      log.debug("Saved %s captions to transcript store", len(batch))
+    except sqlite3.Error as e:
+      log.error(f"Error saving {len(batch)} captions to {self.path}: {e}")
+
+  def close(self):
+    """提交队列中剩余的条目后关闭数据库"""
+    self.queue.put(None)
+    self.thread.join(timeout=5.0)
+    log.info(f"Transcript session {self.session}: {self.count} captions saved to {self.path}")
+
+
+def search(path, query, limit=20, session=None):
+  """
+  在所有会话（或指定会话）中检索字幕，返回 (session, start, end, source, text) 列表。
+  有全文索引时使用 FTS5 查询语法并按相关度排序，否则按子串匹配、按时间倒序。
+  """
+  conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+  try:
+    where = " AND c.session = ?" if session is not None else ""
+    params = [session] if session is not None else []
+    if has_fts(conn):
+      sql = ("SELECT c.session, c.start_time, c.end_time, c.source, c.text FROM captions_fts f "
+             "JOIN captions c ON c.id = f.rowid WHERE captions_fts MATCH ?" + where + " ORDER BY f.rank LIMIT ?")
+    else:
+      sql = ("SELECT c.session, c.start_time, c.end_time, c.source, c.text FROM captions c "
+             "WHERE c.text LIKE '%' || ? || '%'" + where + " ORDER BY c.start_time DESC LIMIT ?")
+    return conn.execute(sql, [query] + params + [limit]).fetchall()
+  finally:
+    conn.close()
+
+
+def list_sessions(path):
+  """返回 (id, started, program, caption_count) 列表，最近的会话在前"""
+  conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+  try:
+    return conn.execute("SELECT s.id, s.started, s.program, COUNT(c.id) FROM sessions s "
+                        "LEFT JOIN captions c ON c.session = s.id GROUP BY s.id ORDER BY s.id DESC").fetchall()
+  finally:
+    conn.close()
+
+
+def main():
+  parser = argparse.ArgumentParser(description="Search captions saved with --transcript-db across sessions")
+  parser.add_argument("query", nargs="?", default=None,
+            help="Full-text query (SQLite FTS5 syntax, e.g. 'budget AND review'); omit to list sessions")
+  parser.add_argument("--db", default="transcripts.db", help="Transcript database path (default: transcripts.db)")
+  parser.add_argument("--session", default=None, help="Only search this session id", type=int)
+  parser.add_argument("--limit", default=20, help="Maximum number of results (default: 20)", type=int)
+  args = parser.parse_args()
+  setup_logging("warning")
+
+  if args.query is None:
+    for session, started, program, count in list_sessions(args.db):
+      print(f"{session:>5}  {datetime.fromtimestamp(started):%Y-%m-%d %H:%M:%S}  {program or '-':<12} {count:>6} captions")
+    return
+
+  start_time = time.time()
+  try:
+    rows = search(args.db, args.query, limit=args.limit, session=args.session)
+  except sqlite3.OperationalError as e:
+    # FTS5 查询语法错误或数据库不存在
+    print(f"Search failed for '{args.query}' in {args.db}: {e}")
+    return
+  for session, start, end, source, text in rows:
+    print(f"[{session}] {datetime.fromtimestamp(start):%Y-%m-%d %H:%M:%S} {source or ''} {text}")
+  print(f"{len(rows)} results in {(time.time() - start_time) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,385 @@
+#! python3.7
+
+import math
+
+import numpy as np
+import torch
+import whisper
+from whisper.decoding import DecodingTask, LogitFilter
+from whisper.tokenizer import get_tokenizer
+from whisper.utils import compression_ratio
+
+from streaming_features import StreamingLogMel
+from model_optimizer import load_model
+from runtime_log import get_logger
+
+log = get_logger("whisper_backend")
+
+
+class DecodeCancelled(Exception):
+  """解码被停止请求或更新的音频取消"""
+
+
+class CancellationToken:
+  """
+  协作式取消标记，解码器在生成每个token前检查一次。
+  可以显式调用 cancel()，也可以传入 should_cancel 回调，由解码线程自己判断是否已被取代。
+  """
+
+  def __init__(self, should_cancel=None):
+    self.should_cancel = should_cancel
+    self.reason = None
+
+  def cancel(self, reason="cancelled"):
+    self.reason = reason
+
+  @property
+  def cancelled(self):
+    if self.reason is None and self.should_cancel is not None:
+      reason = self.should_cancel()
+      if reason:
+        self.reason = reason if isinstance(reason, str) else "cancelled"
+    return self.reason is not None
+
+  def check(self):
+    if self.cancelled:
+      raise DecodeCancelled(self.reason)
+
+
+class CancellationCheck(LogitFilter):
+  """挂在解码器的 logit 过滤器上，每生成一个token检查一次取消标记"""
+
+  def __init__(self, cancel_token):
+    self.cancel_token = cancel_token
+
+  def apply(self, logits, tokens):
+    self.cancel_token.check()
+
+
+def repeated_tail(tokens, max_ngram=4, min_repeats=4):
+  """末尾由同一个n-gram连续重复 min_repeats 次以上时，返回重复部分的起点（保留一次），否则返回 None"""
+  for n in range(1, max_ngram + 1):
+    span = n * min_repeats
+    if len(tokens) < span:
+      break
+    ngram = tokens[-n:]
+    if all(tokens[-span + i] == ngram[i % n] for i in range(span)):
+      start = len(tokens) - span
+      # 继续向前找到重复开始的位置
+      while start >= n and tokens[start - n:start] == ngram:
+        start -= n
+      return start + n
+  return None
+
+
+class RepetitionStop(LogitFilter):
+  """
+  生成的token末尾陷入重复循环时强制输出结束符，不让幻觉占满整个解码预算。
+  triggered 记录触发过的音频序号；束搜索时每段音频占 n_group 行。
+  """
+
+  def __init__(self, eot, sample_begin, n_group=1):
+    self.eot = eot
+    self.sample_begin = sample_begin
+    self.n_group = n_group
+    self.triggered = set()
+
+  def apply(self, logits, tokens):
+    for i in range(tokens.shape[0]):
+      # 已经输出结束符的行后面只会补结束符，不再检查
+      if tokens.shape[1] > self.sample_begin and tokens[i, -1] == self.eot:
+        continue
+      if repeated_tail(tokens[i, self.sample_begin:].tolist()) is not None:
+        logits[i, :] = -np.inf
+        logits[i, self.eot] = 0
+        self.triggered.add(i // self.n_group)
+
+
+class TranscriptionBackend:
+  def decode(self, mel, n_samples, language, use_context=True, cancel_token=None, choose_language=None):
+    raise NotImplementedError
+
+  def decode_audio(self, audio, language, cancel_token=None):
+    raise NotImplementedError
+
+  def detect(self, mel):
+    raise NotImplementedError
+
+  def detect_audio(self, audio):
+    raise NotImplementedError
+
+  def decode_batch(self, audios, language, cancel_token=None):
+    raise NotImplementedError
+
+  def reset_context(self):
+    raise NotImplementedError
+
+  def apply_settings(self, settings):
+    raise NotImplementedError
+
+
+class TokenPrefixCache:
+  """
+  在连续解码之间复用已稳定的token。
+  前后两次假设一致的部分视为已确认，下一轮作为强制前缀送入解码器，
+  前缀在一次前向计算中填充KV缓存，之后只需逐个生成新的尾部token。
+  """
+
+  def __init__(self, holdback=2, max_tokens=200):
+    self.holdback = holdback  # 末尾几个token可能随新音频改变，暂不确认
+    self.max_tokens = max_tokens
+    self.reset()
+
+  def reset(self):
+    self.committed = []
+    self.last_hypothesis = []
+
+  def prefix(self):
+    return list(self.committed)
+
+  def update(self, hypothesis):
+    """hypothesis 为完整token序列（已确认前缀 + 新生成部分），返回新确认的token数"""
+    agree = 0
+    limit = min(len(hypothesis), len(self.last_hypothesis))
+    while agree < limit and hypothesis[agree] == self.last_hypothesis[agree]:
+      agree += 1
+
+    n_commit = min(agree - self.holdback, self.max_tokens)
+    n_new = max(0, n_commit - len(self.committed))
+    if n_new > 0:
+      self.committed = list(hypothesis[:n_commit])
+    self.last_hypothesis = list(hypothesis)
+    return n_new
+
+
+class OpenAIWhisperBackend(TranscriptionBackend):
+  def __init__(self, model, args, compute_device):
+    self.model = model
+    self.args = args
+    self.compute_device = compute_device
+    self.task = "translate" if args.translate else "transcribe"
+    self.fp16 = not args.no_fp16 and compute_device != "cpu"
+    self.beam_size = getattr(args, 'beam_size', 1)
+
+    # 已加载的模型，降级后再回升时不需要重新加载
+    self.model_name = args.model
+    self.models = {args.model: model}
+    self.incompatible_models = set()
+
+    # 只有部分结果模式下窗口才会跨轮次增长，才需要复用前缀
+    self.prefix_cache = TokenPrefixCache() if getattr(args, 'partial_results', False) else None
+    self.prefix_language = None
+
+    # 按语音时长限制生成的token数，短窗口的幻觉不会拖成长时间解码
+    self.tokens_per_second = getattr(args, 'tokens_per_second', 10.0)
+    self.budget_stats = {'decodes': 0, 'budget_hit': 0, 'repetition_stop': 0, 'compression_drop': 0}
+
+  def reset_context(self):
+    if self.prefix_cache is not None:
+      self.prefix_cache.reset()
+
+  def apply_settings(self, settings):
+    """应用实时率调节器给出的配置（beam大小、模型）"""
+    self.beam_size = settings.get('beam_size', self.beam_size)
+    model_name = settings.get('model', self.model_name)
+    if model_name in self.incompatible_models:
+      return
+    if model_name != self.model_name:
+      if model_name not in self.models:
+        log.info(f"Loading fallback model {model_name}...")
+        self.models[model_name] = load_model(model_name, self.compute_device, self.args)
+      # 增量特征按当前模型的 mel 维度计算，维度不同的模型无法直接切换
+      if self.models[model_name].dims.n_mels != self.model.dims.n_mels:
+        log.warning(f"Cannot switch to model {model_name}: it uses {self.models[model_name].dims.n_mels} mel bins, "
+                    f"{self.model_name} uses {self.model.dims.n_mels}; keeping {self.model_name}")
+        del self.models[model_name]
+        self.incompatible_models.add(model_name)
+        return
+      self.model = self.models[model_name]
+      self.model_name = model_name
+      self.reset_context()
+      log.info(f"Switched to model {model_name}")
+
+  # 解码预算的固定部分（标点、语气词等）和压缩率阈值（与 whisper.transcribe 默认值相同）
+  budget_base_tokens = 8
+  compression_ratio_threshold = 2.4
+
+  def token_budget(self, n_samples):
+    """按音频时长计算本次解码最多生成的token数，None 表示不限制（使用 whisper 默认的 n_text_ctx/2）"""
+    if not self.tokens_per_second:
+      return None
+    seconds = n_samples / whisper.audio.SAMPLE_RATE
+    budget = self.budget_base_tokens + math.ceil(self.tokens_per_second * seconds)
+    return min(budget, self.model.dims.n_text_ctx // 2)
+
+  def tokenizer(self, language):
+    return get_tokenizer(
+      self.model.is_multilingual,
+      num_languages=self.model.num_languages,
+      language=language,
+      task=self.task,
+    )
+
+  def detect_language(self, mel):
+    """在编码器输出上识别语言，返回 (audio_features, language_probs)，编码结果可直接用于解码"""
+    if self.fp16:
+      mel = mel.half()
+    with torch.no_grad():
+      audio_features = self.model.encoder(mel.unsqueeze(0))
+    _, probs = self.model.detect_language(audio_features)
+    return audio_features[0], probs[0]
+
+  def audio_log_mel(self, audio):
+    mel_stream = StreamingLogMel(n_mels=self.model.dims.n_mels)
+    mel_stream.accept(audio)
+    return mel_stream.log_mel()
+
+  def decode_audio(self, audio, language, cancel_token=None):
+    """独立解码一段音频（例如被降级到后台的窗口），不使用也不影响实时窗口的前缀"""
+    return self.decode(self.audio_log_mel(audio), len(audio), language, use_context=False, cancel_token=cancel_token)
+
+  def detect(self, mel):
+    """只识别语言，返回 language_probs；mel 为 numpy log-mel 窗口"""
+    if not self.model.is_multilingual:
+      return {"en": 1.0}
+    _, language_probs = self.detect_language(torch.from_numpy(mel).to(self.compute_device))
+    return language_probs
+
+  def detect_audio(self, audio):
+    return self.detect(self.audio_log_mel(audio))
+
+  def decode_batch(self, audios, language, cancel_token=None):
+    """
+    把积压的多段音频补齐到同一窗口长度，一次性批量编码和解码，结果按输入顺序返回。
+    language 为 None 时由 whisper 在批内逐段识别语言。
+    """
+    if not audios:
+      return []
+    if language is None and not self.model.is_multilingual:
+      language = "en"
+
+    mel_stream = StreamingLogMel(n_mels=self.model.dims.n_mels)
+    mels = []
+    for audio in audios:
+      mel_stream.reset()
+      mel_stream.accept(audio)
+      mels.append(mel_stream.log_mel())
+    mel = torch.from_numpy(np.stack(mels)).to(self.compute_device)
+
+    sample_len = self.token_budget(max(len(audio) for audio in audios))
+    decoded, stopped = self.run_decoding(mel, self.decoding_options(language, [], sample_len), cancel_token)
+    results = []
+    for i, (result, audio) in enumerate(zip(decoded, audios)):
+      tokens, text = self.check_budget(result, sample_len, i in stopped)
+      results.append(self.make_result(text, result.language, result.language_probs, tokens, 0, len(audio)))
+    return results
+
+  def run_decoding(self, mel, options, cancel_token=None):
+    """
+    与 whisper.decode 相同，但在每个解码步检查取消标记，并在输出陷入重复循环时提前结束。
+    返回 (结果, 触发了重复停止的音频序号集合)。
+    """
+    if single := mel.ndim == 2:
+      mel = mel.unsqueeze(0)
+
+    task = DecodingTask(self.model, options)
+    repetition_stop = RepetitionStop(task.tokenizer.eot, task.sample_begin, task.n_group)
+    task.logit_filters.append(repetition_stop)
+    if cancel_token is not None:
+      cancel_token.check()
+      task.logit_filters.append(CancellationCheck(cancel_token))
+    with torch.no_grad():
+      result = task.run(mel)
+    return (result[0] if single else result), repetition_stop.triggered
+
+  def check_budget(self, decoded, sample_len, stopped):
+    """
+    统计解码预算和提前结束的触发情况，去掉末尾的重复循环；
+    压缩率过高（多为重复幻觉）的结果直接丢弃；截掉重复后按剩下的文本重新计算压缩率。返回 (tokens, text)。
+    """
+    stats = self.budget_stats
+    stats['decodes'] += 1
+    tokens = list(decoded.tokens)
+    text = decoded.text
+    ratio = decoded.compression_ratio
+
+    if sample_len is not None and len(tokens) >= sample_len:
+      stats['budget_hit'] += 1
+    if stopped:
+      start = repeated_tail(tokens)
+      if start is not None:
+        stats['repetition_stop'] += 1
+        tokens = tokens[:start]
+        text = self.tokenizer(decoded.language).decode(tokens).strip()
+        ratio = compression_ratio(text) if text else 0.0
+    if ratio > self.compression_ratio_threshold:
+      stats['compression_drop'] += 1
+      tokens, text = [], ""
+
+    if stats['decodes'] % 50 == 0:
+      log.info("Decode budget stats: %s", stats)
+    return tokens, text
+
+  def decoding_options(self, language, prefix, sample_len=None):
+    # 不做温度回退：实时窗口下一轮还会重新解码，回退只会成倍增加最坏情况的延迟
+    return whisper.DecodingOptions(
+      task=self.task,
+      language=language,
+      temperature=0.0,
+      sample_len=sample_len,
+      without_timestamps=True,
+      fp16=self.fp16,
+      beam_size=self.beam_size if self.beam_size and self.beam_size > 1 else None,
+      prefix=prefix or None,
+    )
+
+  def make_result(self, text, language, language_probs, tokens, n_prefix, n_samples):
+    """组装与 transcribe 相同结构的结果"""
+    duration = n_samples / whisper.audio.SAMPLE_RATE
+    return {
+      'text': text,
+      'language': language,
+      'language_probs': language_probs,
+      'tokens': tokens,
+      'prefix_tokens': n_prefix,
+      'segments': [{'start': 0.0, 'end': duration, 'text': text}],
+    }
+
+  def decode(self, mel, n_samples, language, use_context=True, cancel_token=None, choose_language=None):
+    """
+    解码一个 log-mel 窗口（numpy，形状 (n_mels, N_FRAMES)），返回与 transcribe 相同结构的结果。
+    language 为 None 时先识别语言，结果中附带 language_probs；
+    choose_language(language_probs) 决定用哪种语言解码（例如保持已锁定的语言），默认取概率最高的语言。
+    use_context 为 False 时不使用已确认的前缀。
+    cancel_token 被取消时抛出 DecodeCancelled，已确认的前缀保持不变。
+    """
+    mel = torch.from_numpy(mel).to(self.compute_device)
+    language_probs = None
+    if language is None:
+      if self.model.is_multilingual:
+        mel, language_probs = self.detect_language(mel)
+        if choose_language is not None:
+          language = choose_language(language_probs)
+        else:
+          language = max(language_probs, key=language_probs.get)
+      else:
+        language = "en"
+
+    prefix_cache = self.prefix_cache if use_context else None
+    # 语言变化后前缀token不再有效
+    if prefix_cache is not None and language != self.prefix_language:
+      self.reset_context()
+      self.prefix_language = language
+
+    prefix = prefix_cache.prefix() if prefix_cache is not None else []
+    sample_len = self.token_budget(n_samples)
+    decoded, stopped = self.run_decoding(mel, self.decoding_options(language, prefix, sample_len), cancel_token)
+
+    new_tokens, text = self.check_budget(decoded, sample_len, 0 in stopped)
+    tokens = prefix + new_tokens
+    if prefix:
+      text = self.tokenizer(decoded.language).decode(tokens).strip()
+    if prefix_cache is not None:
+      prefix_cache.update(tokens)
+
+    return self.make_result(text, decoded.language, language_probs, tokens, len(prefix), n_samples)